@@ -1,9 +1,25 @@
 import pandas as pd
 import numpy as np
 import collections
+import collections.abc
 from position import Stock
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 import datetime
+import re
+
+CATEGORIES = {
+    100: "Stock",           # Equities in the DZ file
+    130: "Certificate",     # Participation Certificate in the DZ file
+    174: "Fund",            # Equity Fund in the DZ file.
+    175: "Fund",            # Balanced Fund in the  DZ file.
+    176: "Fund",            # Other Funds in the DZ file.
+    184: "ETF",             # Equity Fund ETF in the DZ file.
+    186: "ETF",             # Other Funds ETF in the DZ file.
+    161: "ETF",             # Exchange-traded Fund in the DZ file
+    431: "Index Put Option",     # Put Options on Indices in the  DZ file.
+    620: "Futures",         # Futures on Indices
+}
+
 
 def retrieve_category(c_sof) -> str:
     """
@@ -17,24 +33,174 @@ def retrieve_category(c_sof) -> str:
     :param c_sof: 3 digit code in C_SOF_TYP column..
     :return: str: The corresponding category.
     """
-    codes = {
-        100: "Stock",           # Equities in the DZ file
-        130: "Certificate",     # Participation Certificate in the DZ file
-        174: "Fund",            # Equity Fund in the DZ file.
-        175: "Fund",            # Balanced Fund in the  DZ file.
-        176: "Fund",            # Other Funds in the DZ file.
-        184: "ETF",             # Equity Fund ETF in the DZ file.
-        186: "ETF",             # Other Funds ETF in the DZ file.
-        161: "ETF",             # Exchange-traded Fund in the DZ file
-        431: "Index Put Option",     # Put Options on Indices in the  DZ file.
-        620: "Futures",         # Futures on Indices
-    }
     if pd.isna(c_sof):  # must be first if statement.
         return "Cash"
-    if c_sof not in codes.keys():
+    if c_sof not in CATEGORIES.keys():
         return "Unknown"
     else:
-        return codes[c_sof]
+        return CATEGORIES[c_sof]
+
+
+def retrieve_categories(c_sof) -> np.ndarray:
+    """
+    Vectorized version of retrieve_category, used to assign a category to a whole column of C_SOF_TYP (or GTI) codes
+        at once.
+
+    :param c_sof: pd.Series of 3 digit codes.
+    :return: np.ndarray of str: The corresponding categories.
+    """
+    c_sof = pd.Series(c_sof)
+    categories = c_sof.map(CATEGORIES).fillna("Unknown")
+    return np.where(c_sof.isna(), "Cash", categories.astype(object)).astype(object)
+
+
+# C_ID_TYPE of the Bloomberg ticker of a security, e.g. "SX5E 06/19/20 P3000 Index" for an option on the Euro Stoxx 50
+# or "VGM0 Index" for a Euro Stoxx 50 future.
+BLOOMBERG = 6
+OPTION_TICKER = re.compile(r"^(?P<underlying>\S+) \d\d/\d\d/\d\d [A-Za-z](?P<strike>[0-9.]+) \S+$")
+FUTURE_TICKER = re.compile(r"^(?P<underlying>\S+?)[FGHJKMNQUVXZ]\d{1,2} \S+$")
+
+
+class SecurityMaster(collections.abc.MutableMapping):
+    """
+    Index of the ids of the "SecuritiesIDs" tab: (C_N_ID, C_ID_TYPE) -> G_ID_VALUE, plus what is parsed from them once,
+        when they are ingested, instead of every time a position is opened:
+        - strikes: {C_N_ID: Decimal strike} of the options.
+        - underlyings: {C_N_ID: str} Bloomberg root of the underlying of the options and futures ("SX5E", "VG").
+        - wkn: {C_N_ID: [G_SORTING_KEY]} from the "HIS" tab (see Reader.position_events).
+
+    The same securities are listed in every daily file, so update hashes the rows of a sheet and only parses the
+        securities whose rows differ from the ids held; refreshing the ids with an unchanged sheet costs a hash of the
+        sheet. Every lookup is a dict lookup.
+
+    As a mapping, it reads like the dict of lists Portfolio.ids used to be: {C_N_ID: {"C_ID_TYPE": [...],
+        "G_ID_VALUE": [...]}}. The ids of a security are replaced by the latest rows listing it.
+    """
+
+    COLUMNS = ["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]
+
+    def __init__(self):
+        self._types = {}  # C_N_ID -> list of C_ID_TYPE, in the order of the sheet.
+        self._values = {}  # (C_N_ID, C_ID_TYPE) -> G_ID_VALUE
+        self._hashes_of = {}  # (C_N_ID, C_ID_TYPE) -> hash of the row it was read from.
+        self._hashes = np.empty(0, dtype=np.uint64)  # sorted values of self._hashes_of.
+        self.strikes = {}
+        self.underlyings = {}
+        self.wkn = {}
+
+    def value(self, ticker, id_type, default=None):
+        """
+        :return: G_ID_VALUE of the id of type id_type of the security, default if there is none.
+        """
+        return self._values.get((ticker, id_type), default)
+
+    def strike(self, ticker):
+        """
+        Strike of an option. Bloomberg tickers that OPTION_TICKER does not match are split the way Portfolio used to
+            read them ("SX5E 06/19/20 P3000 Index" -> 3000).
+        :param ticker: C_N_ID of the option.
+        :return: Decimal strike.
+        """
+        if ticker in self.strikes:
+            return self.strikes[ticker]
+        name = self.value(ticker, BLOOMBERG)
+        try:
+            return Decimal(str(name).split(" ")[-2][1:])
+        except (IndexError, InvalidOperation):
+            raise ValueError(f"Cannot read the strike of option {ticker} from its Bloomberg ticker {name!r}.") from None
+
+    def update(self, ids=(), **kwargs):
+        """
+        :param ids: pd.DataFrame with the columns C_N_ID, C_ID_TYPE and G_ID_VALUE (the "SecuritiesIDs" tab), or a dict
+                    {C_N_ID: {"C_ID_TYPE": [...], "G_ID_VALUE": [...]}}.
+        :return: None
+        """
+        if isinstance(ids, pd.DataFrame):
+            self._ingest(ids)
+        else:
+            entries = dict(ids, **kwargs)
+            self._ingest(pd.DataFrame({
+                "C_N_ID": [ticker for ticker, entry in entries.items() for _ in entry["C_ID_TYPE"]],
+                "C_ID_TYPE": [id_type for entry in entries.values() for id_type in entry["C_ID_TYPE"]],
+                "G_ID_VALUE": [value for entry in entries.values() for value in entry["G_ID_VALUE"]],
+            }))
+
+    def _ingest(self, data):
+        data = data.loc[:, self.COLUMNS]
+        hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+        tickers = data["C_N_ID"].to_numpy()
+        listed = ~pd.isna(tickers)
+        new = ~np.isin(hashes, self._hashes) & listed
+        # Securities listed with fewer rows than the ids held for them lost an id.
+        unique, counts = np.unique(tickers[listed], return_counts=True)
+        held = np.fromiter(
+            (len(self._types.get(ticker, ())) for ticker in unique.tolist()), dtype=int, count=len(unique)
+        )
+        new |= np.isin(tickers, unique[held > counts])
+        if not new.any():
+            return
+        # Every row of the securities with a new row, so that their ids are replaced as a whole.
+        rows = np.flatnonzero(np.isin(tickers, tickers[new]))
+        columns = [tickers[rows].tolist()] + [data[column].to_numpy()[rows].tolist() for column in self.COLUMNS[1:]]
+
+        listed, kept = {}, []
+        for ticker, id_type, value, row_hash in zip(*columns, hashes[rows].tolist()):
+            ticker_types = listed.setdefault(ticker, [])
+            if id_type not in ticker_types:  # the first one wins, as list.index did.
+                ticker_types.append(id_type)
+                kept.append((ticker, id_type, value, row_hash))
+        for ticker, ticker_types in listed.items():
+            for id_type in set(self._types.get(ticker, ())).difference(ticker_types):
+                del self._values[ticker, id_type]
+                del self._hashes_of[ticker, id_type]
+            self._types[ticker] = ticker_types
+            # Parsed again below from the new Bloomberg id, if there still is one.
+            self.strikes.pop(ticker, None)
+            self.underlyings.pop(ticker, None)
+        for ticker, id_type, value, row_hash in kept:
+            self._values[ticker, id_type] = value
+            self._hashes_of[ticker, id_type] = row_hash
+            if id_type == BLOOMBERG:
+                self._parse(ticker, str(value))
+        self._hashes = np.sort(np.fromiter(self._hashes_of.values(), dtype=np.uint64, count=len(self._hashes_of)))
+
+    def _parse(self, ticker, name):
+        """
+        Reads the strike and the underlying of an option, or the underlying of a future, from its Bloomberg ticker.
+        """
+        option = OPTION_TICKER.match(name)
+        if option is not None:
+            self.strikes[ticker] = Decimal(option["strike"])
+            self.underlyings[ticker] = option["underlying"]
+            return
+        future = FUTURE_TICKER.match(name)
+        if future is not None:
+            self.underlyings[ticker] = future["underlying"]
+
+    def __getitem__(self, ticker):
+        types = self._types[ticker]
+        return {"C_ID_TYPE": list(types), "G_ID_VALUE": [self._values[ticker, id_type] for id_type in types]}
+
+    def __setitem__(self, ticker, entry):
+        self.update({ticker: entry})
+
+    def __delitem__(self, ticker):
+        for id_type in self._types.pop(ticker):
+            del self._values[ticker, id_type]
+            del self._hashes_of[ticker, id_type]
+        self._hashes = np.sort(np.fromiter(self._hashes_of.values(), dtype=np.uint64, count=len(self._hashes_of)))
+        self.strikes.pop(ticker, None)
+        self.underlyings.pop(ticker, None)
+
+    def __iter__(self):
+        return iter(self._types)
+
+    def __len__(self):
+        return len(self._types)
+
+    def __contains__(self, ticker):
+        return ticker in self._types
+
 
 #
 # mappings = {}
@@ -0,0 +1,82 @@
+from SecurityID import SecurityMaster
+
+from decimal import Decimal
+import pandas as pd
+import unittest
+
+
+class TestSecurityMaster(unittest.TestCase):
+    """
+    Ingest two days of the "SecuritiesIDs" tab and check the ids, the parsed strikes and underlyings, and that an
+    unchanged sheet is not parsed again.
+    """
+
+    def setUp(self):
+        self.sheet = pd.DataFrame({
+            "C_N_ID": [1, 1, 2, 2, 3],
+            "C_ID_TYPE": [1, 6, 1, 6, 6],
+            "G_ID_VALUE": ["DE0001", "SX5E 06/19/20 P3000 Index", "DE0002", "VGM0 Index", "SAP GY Equity"],
+        })
+
+    def test_ids(self):
+        master = SecurityMaster()
+        master.update(self.sheet)
+        self.assertEqual(master[1], {"C_ID_TYPE": [1, 6], "G_ID_VALUE": ["DE0001", "SX5E 06/19/20 P3000 Index"]})
+        self.assertEqual(master.value(2, 1), "DE0002")
+        self.assertEqual(master.strikes, {1: Decimal("3000")})
+        self.assertEqual(master.underlyings, {1: "SX5E", 2: "VG"})
+
+        # The next day, the option is rolled and security 2 loses its ISIN.
+        sheet = self.sheet.copy()
+        sheet.loc[1, "G_ID_VALUE"] = "SX5E 12/18/20 P2900.5 Index"
+        sheet = sheet.drop(index=2)
+        master.update(sheet)
+        self.assertEqual(master.strikes[1], Decimal("2900.5"))
+        self.assertEqual(master[2], {"C_ID_TYPE": [6], "G_ID_VALUE": ["VGM0 Index"]})
+        self.assertIsNone(master.value(2, 1))
+        self.assertEqual(len(master), 3)
+
+        # Back to the first day: the rows were seen before, but they are no longer the ids held.
+        master.update(self.sheet)
+        self.assertEqual(master.strikes[1], Decimal("3000"))
+        self.assertEqual(master[2], {"C_ID_TYPE": [1, 6], "G_ID_VALUE": ["DE0002", "VGM0 Index"]})
+
+    def test_changed_bloomberg_id(self):
+        master = SecurityMaster()
+        master.update(self.sheet)
+        # The option loses its Bloomberg id, the future is mapped to another contract and then to a stock.
+        sheet = self.sheet.drop(index=1)
+        sheet.loc[3, "G_ID_VALUE"] = "ESM0 Index"
+        master.update(sheet)
+        self.assertEqual(master.strikes, {})
+        self.assertEqual(master.underlyings, {2: "ES"})
+        sheet.loc[3, "G_ID_VALUE"] = "SAP GY Equity"
+        master.update(sheet)
+        self.assertEqual(master.underlyings, {})
+
+    def test_unchanged_sheet_is_skipped(self):
+        master = SecurityMaster()
+        master.update(self.sheet)
+        master.strikes.clear()
+        master.update(self.sheet.copy())
+        self.assertEqual(master.strikes, {})
+
+    def test_dict_update(self):
+        master = SecurityMaster()
+        master[4] = {"C_ID_TYPE": [6], "G_ID_VALUE": ["SX5E 06/19/20 P3100 Index"]}
+        self.assertEqual(master.strikes[4], Decimal("3100"))
+        self.assertEqual(dict(master), {4: {"C_ID_TYPE": [6], "G_ID_VALUE": ["SX5E 06/19/20 P3100 Index"]}})
+
+    def test_strike(self):
+        master = SecurityMaster()
+        master.update(self.sheet)
+        master[5] = {"C_ID_TYPE": [6], "G_ID_VALUE": ["SX5E 6/19/2020 P3200 Index"]}
+        self.assertEqual(master.strike(1), Decimal("3000"))
+        self.assertEqual(master.strike(5), Decimal("3200"))  # not matched by OPTION_TICKER, read the old way.
+        for ticker in (3, 6):
+            with self.assertRaisesRegex(ValueError, f"option {ticker}"):
+                master.strike(ticker)
+
+
+if __name__ == "__main__":
+    unittest.main()
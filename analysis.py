@@ -7,9 +7,14 @@ Created on Fri Mar 13 13:33:23 2020
 """
 
 from portfolio import Portfolio
+from tradelog import NA
 import performance as perf
 
 from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import pandas as pd
@@ -21,44 +26,135 @@ import os
 import seaborn as sns
 from matplotlib.ticker import FuncFormatter
 
+class Constituents(Mapping):
+    """
+    The per ticker statistics of an Analysis, as a dict {ticker: statistics} that computes the statistics of a ticker
+        the first time they are looked up and keeps them. Nothing is computed for the tickers that are never looked
+        at, so opening an analyzer on a large portfolio is instant and the memory used grows only with the tickers
+        inspected.
+
+    The tickers are the ones of Analysis.positions: the open positions and the tickers that were closed.
+
+    Every entry remembers the log it was computed from and how many rows the log had; once the position trades
+        again (or is replaced), the entry is computed again on the next lookup.
+    """
+
+    def __init__(self, analysis):
+        """
+        :param analysis: Analysis whose statistics are kept.
+        """
+        self.analysis = analysis
+        self._cache = {}  # ticker -> (log, rows, statistics)
+
+    def __getitem__(self, ticker):
+        try:
+            log = self.analysis.position(ticker).log
+        except KeyError:
+            self._cache.pop(ticker, None)
+            raise
+        cached = self._cache.get(ticker)
+        if cached is None or cached[0] is not log or cached[1] != log.rows:
+            cached = (log, log.rows, self.analysis.get_statistics(ticker))
+            self._cache[ticker] = cached
+        return cached[2]
+
+    def __iter__(self):
+        return iter(list(self.analysis.positions()))
+
+    def __len__(self):
+        return len(self.analysis.positions())
+
+    def __contains__(self, ticker):
+        try:
+            self.analysis.position(ticker)
+        except KeyError:
+            return False
+        return True
+
+    def cached(self):
+        """
+        :return: list of the tickers whose statistics are currently kept.
+        """
+        return list(self._cache)
+
+
 class Analysis:
-    def __init__(self,portfolio,title=None,benchmark=None,periods=252,rolling_sharpe=False):
+    def __init__(self,portfolio,title=None,benchmark=None,periods=252,rolling_sharpe=False,batch=False):
+        """
+        The statistics of a ticker are computed when self.constituents[ticker] is first looked up (see Constituents);
+            get_results() computes them for every position at once.
+
+        :param batch: If True, the statistics of every position are computed at once with get_batch_results()
+                      and stored in self.results.
+        """
         self.portfolio = portfolio
-        self.constituents= {}
+        self.constituents = Constituents(self)
         self.periods = periods
         self.benchmark = benchmark
         self.rolling_sharpe = rolling_sharpe
         self.security = {}
         self.security_b = {} 
         self.title = '\n'.join(title)
-        self.get_results()
-        
+        self.results = None
+        if batch:
+            self.results = self.get_batch_results()
+
+    def positions(self):
+        """
+        :return: dict {ticker: position} of every ticker of the portfolio: its open position, or for a ticker that is
+                 closed, its last position.ClosedPosition (whose log runs up to the day it was closed).
+        """
+        positions = {ticker: closed[-1] for ticker, closed in self.portfolio.closed_positions.items() if closed}
+        positions.update(self.portfolio.positions)
+        return positions
+
+    def position(self, ticker):
+        """
+        :param ticker: ticker of the portfolio.
+        :return: the open position of the ticker, or its last position.ClosedPosition if it is closed (see positions).
+        """
+        if ticker in self.portfolio.positions:  # both are defaultdicts, indexing them would add the ticker.
+            return self.portfolio.positions[ticker]
+        if self.portfolio.closed_positions.get(ticker):
+            return self.portfolio.closed_positions[ticker][-1]
+        raise KeyError(ticker)
+
     def get_results(self):
-        for ticker in self.portfolio.positions:
-            daily_return = pd.DataFrame(self.portfolio.positions[ticker].log)["price"].astype(float).pct_change().fillna(0.0)
-            cum_return = np.exp(np.log(1+daily_return).cumsum())         
-            drawdown,max_drawdown,drawdown_duration = perf.create_drawdowns(cum_return)
-            
-            statistics = {}
-#            statistics["ticker"] = ticker
-            statistics["sharpe"] = perf.create_sharpe_ratio(daily_return,self.periods)
-            statistics["drawdowns"] = drawdown
-            statistics["max_drawdown"] = max_drawdown
-            statistics["max_drawdown_pct"] = max_drawdown
-            statistics["max_drawdown_duration"] = drawdown_duration
-            statistics["daily_returns"] = daily_return
-            statistics["cum_returns"] = cum_return
-            statistics["date"] = pd.DataFrame(self.portfolio.positions[ticker].log)["date"]
-            
-            self.constituents[ticker] = statistics
+        """
+        Computes (or refreshes) the statistics of every position, open or closed.
+
+        :return: dict {ticker: statistics}
+        """
+        return {ticker: self.constituents[ticker] for ticker in self.constituents}
+
+    def get_statistics(self, ticker):
+        """
+        :param ticker: ticker of a position in the portfolio, open or closed (see positions).
+        :return: dict of the statistics of the position (Series for returns, drawdowns and dates).
+        """
+        log = self.position(ticker).log.to_frame()
+        daily_return = log["price"].astype(float).pct_change().fillna(0.0)
+        cum_return = np.exp(np.log(1+daily_return).cumsum())
+        drawdown,max_drawdown,drawdown_duration = perf.create_drawdowns(cum_return)
+
+        statistics = {}
+#        statistics["ticker"] = ticker
+        statistics["sharpe"] = perf.create_sharpe_ratio(daily_return,self.periods)
+        statistics["drawdowns"] = drawdown
+        statistics["max_drawdown"] = max_drawdown
+        statistics["max_drawdown_pct"] = max_drawdown
+        statistics["max_drawdown_duration"] = drawdown_duration
+        statistics["daily_returns"] = daily_return
+        statistics["cum_returns"] = cum_return
+        statistics["date"] = log["date"]
 
         if self.benchmark is not None:
             "Need to change the benchamrk here"
-            daily_return_b = pd.DataFrame(self.portfolio.positions[ticker].log)["price"].astype(float).pct_change().fillna(0.0)
+            daily_return_b = daily_return
             cum_returns_b = np.exp(np.log(1 + daily_return_b).cumsum())
             dd_b, max_dd_b, dd_dur_b = perf.create_drawdowns(cum_returns_b)
             statistics["sharpe_b"] = perf.create_sharpe_ratio(daily_return_b)
-            
+
             statistics["drawdowns_b"] = dd_b
             statistics["max_drawdown_pct_b"] = max_dd_b
             statistics["max_drawdown_duration_b"] = dd_dur_b
@@ -66,18 +162,93 @@ class Analysis:
             statistics["returns_b"] = daily_return_b
 #            statistics["rolling_sharpe_b"] = rolling_sharpe_b
             statistics["cum_returns_b"] = cum_returns_b
-            self.constituents[ticker] = statistics
-            
-            
-    
+        return statistics
+
+    def price_matrix(self):
+        """
+        Aligns the price logs of all positions (open or closed, see positions) into one date x ticker matrix holding
+            the last price logged on each day (NaN on the days a ticker has no log row). The logs are read as raw
+            fixed-point columns, so no per ticker DataFrame is built.
+
+        :return: pd.DataFrame indexed by date with one column per ticker.
+        """
+        tickers, dates, prices, owners = [], [], [], []
+        for ticker, position in self.positions().items():
+            price, date = position.log.raw("price"), position.log.raw("date")
+            valid = (price != NA) & ~np.isnat(date)
+            if not valid.any():
+                continue
+            tickers.append(ticker)
+            dates.append(date[valid].astype("datetime64[D]"))
+            prices.append(price[valid] / 10 ** position.log.schema["price"])
+            owners.append(np.full(valid.sum(), len(owners)))
+        if not tickers:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        dates, prices, owners = np.concatenate(dates).view(np.int64), np.concatenate(prices), np.concatenate(owners)
+        # Days as consecutive integers (a bincount instead of sorting the dates for np.unique).
+        min_day = dates.min()
+        dates -= min_day
+        seen = np.bincount(dates) > 0
+        days = np.flatnonzero(seen)
+        day = (np.cumsum(seen) - 1)[dates]
+
+        # The last row of every (ticker, day) group is the last price logged that day. The logs are usually in date
+        # order already, in which case no sort is needed.
+        key = owners * len(days) + day
+        order = np.arange(len(key)) if np.all(key[1:] >= key[:-1]) else np.argsort(key, kind="stable")
+        key = key[order]
+        order = order[np.r_[key[1:] != key[:-1], True]]
+        matrix = np.full((len(days), len(tickers)), np.nan)
+        matrix[day[order], owners[order]] = prices[order]
+        days = (days + min_day).astype("datetime64[D]")
+        return pd.DataFrame(matrix, index=pd.DatetimeIndex(days, name="date"), columns=tickers)
+
+    def get_batch_results(self):
+        """
+        Computes the statistics of every position at once on the date x ticker price matrix, with vectorized NumPy
+            operations instead of a loop over the positions. Returns are taken between consecutive days on which a
+            ticker has a price (the first one is 0.0, as in get_results); the days without a price stay NaN and are
+            left out of the statistics.
+
+        The matrices are kept in self.prices, self.returns, self.cum_returns and self.drawdowns.
+
+        :return: pd.DataFrame indexed by ticker: first_date, last_date, periods, total_return, sharpe, max_drawdown,
+                 max_drawdown_duration.
+        """
+        self.prices = prices = self.price_matrix()
+        values = prices.to_numpy()
+        present = ~np.isnan(values)
+        filled = prices.ffill().to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = filled[1:] / filled[:-1] - 1.0
+        returns = np.vstack([np.zeros((1, values.shape[1])), returns])
+        returns[present & (np.cumsum(present, axis=0) == 1)] = 0.0
+        returns[~present] = np.nan
+        cum_returns = np.exp(np.nancumsum(np.log1p(returns), axis=0))
+        cum_returns[~present] = np.nan
+
+        self.returns = pd.DataFrame(returns, index=prices.index, columns=prices.columns)
+        self.cum_returns = pd.DataFrame(cum_returns, index=prices.index, columns=prices.columns)
+        self.drawdowns, max_drawdown, duration = perf.create_drawdowns(self.cum_returns)
+
+        periods = present.sum(axis=0)
+        last = len(values) - 1 - np.argmax(present[::-1], axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.sqrt(self.periods) * np.nanmean(returns, axis=0) / np.nanstd(returns, axis=0)
+        return pd.DataFrame({
+            "first_date": prices.index[np.argmax(present, axis=0)],
+            "last_date": prices.index[last],
+            "periods": periods,
+            "total_return": cum_returns[last, np.arange(len(last))] - 1.0,
+            "sharpe": sharpe,
+            "max_drawdown": max_drawdown.to_numpy(),
+            "max_drawdown_duration": duration.to_numpy(),
+        }, index=pd.Index(prices.columns, name="ticker"))
+
     def _plot_security(self,stats,ax=None,**kwargs):
         def format_two_dec(x,pos):
             return '%.2f' % x
         
-        stats = pd.DataFrame(stats)
-        stats["date"] = pd.to_datetime(stats["date"])
-        stats.set_index("date",inplace=True)
-        
         y_axis_formatter = FuncFormatter(format_two_dec)
         ax.yaxis.set_major_formatter(FuncFormatter(y_axis_formatter))
         ax.xaxis.set_tick_params(reset=True)
@@ -138,10 +309,6 @@ class Analysis:
         def format_perc(x,pos):
             return '%.0f%%' % x
         
-        stats = pd.DataFrame(stats)
-        stats["date"] = pd.to_datetime(stats["date"])
-        stats.set_index("date",inplace=True)
-        
         y_axis_formatter = FuncFormatter(format_perc)
         ax.yaxis.set_major_formatter(FuncFormatter(y_axis_formatter))
         ax.yaxis.grid(linestyle=":")
@@ -155,10 +322,21 @@ class Analysis:
         
         return ax
             
+    @staticmethod
+    def _stats_frame(stats):
+        """
+        Lines up the Series of the statistics of a ticker (returns, drawdowns, ...) in one DataFrame indexed by date.
+            It is built once per tearsheet and shared by the _plot_* methods, which used to build it (and parse the
+            dates) again every time.
+        :param stats: dict of the statistics of a ticker, see get_statistics.
+        :return: pd.DataFrame indexed by date.
+        """
+        series = {
+            name: np.asarray(value) for name, value in stats.items() if isinstance(value, pd.Series) and name != "date"
+        }
+        return pd.DataFrame(series, index=pd.DatetimeIndex(pd.to_datetime(np.asarray(stats["date"])), name="date"))
+
     def _plot_monthly_returns(self,stats,ax=None,**kwargs):
-        stats = pd.DataFrame(stats)
-        stats["date"] = pd.to_datetime(stats["date"])
-        stats.set_index("date",inplace=True)
         returns = stats["daily_returns"]
         
         monthly_ret = perf.aggregate_returns(returns,"monthly")
@@ -184,9 +362,6 @@ class Analysis:
         def format_perc(x,pos):
             return '%.0f%%' % x
         
-        stats = pd.DataFrame(stats)
-        stats["date"] = pd.to_datetime(stats["date"])
-        stats.set_index("date",inplace=True)
         returns = stats["daily_returns"]
         
         y_axis_formatter = FuncFormatter(format_perc)
@@ -208,16 +383,13 @@ class Analysis:
         def format_perc(x, pos):
                 return '%.0f%%' % x
 
-        stats = pd.DataFrame(stats)
-        stats['date']=pd.to_datetime(stats['date'])
-        stats.set_index('date',inplace=True)
         returns = stats["daily_returns"]
         cum_returns = stats['cum_returns']
 
         y_axis_formatter = FuncFormatter(format_perc)
         ax.yaxis.set_major_formatter(FuncFormatter(y_axis_formatter))
             
-        tot_ret = cum_returns[-1] - 1.0
+        tot_ret = cum_returns.iloc[-1] - 1.0
         cagr = perf.create_cagr(cum_returns, self.periods)
         sharpe = perf.create_sharpe_ratio(returns, self.periods)
         rsq = perf.rsuqare(range(cum_returns.shape[0]), cum_returns)
@@ -249,7 +421,7 @@ class Analysis:
         if self.benchmark is not None:
             returns_b = stats['returns_b']
             security_b = stats['cum_returns_b']
-            tot_ret_b = security_b[-1] - 1.0
+            tot_ret_b = security_b.iloc[-1] - 1.0
             cagr_b = perf.create_cagr(security_b)
             sharpe_b = perf.create_sharpe_ratio(returns_b)
             rsq_b = perf.rsquared(range(security_b.shape[0]), security_b)
@@ -279,10 +451,10 @@ class Analysis:
         return ax
               
         
-    def plot_results(self, ticker):
-                        
+    @staticmethod
+    def _style():
         """
-        Plot the Tearsheet
+        Sets the matplotlib/seaborn style of the tearsheets.
         """
         rc = {
                 'lines.linewidth': 1.0,
@@ -303,38 +475,105 @@ class Analysis:
         sns.set_context(rc)
         sns.set_style("whitegrid")
         sns.set_palette("deep", desat=.6)
-    
+
+    def _figure_size(self):
+        return 10, (5 + self.rolling_sharpe) * 3.5
+
+    def _draw(self, fig, stats):
+        """
+        Draws the tearsheet of a ticker on fig.
+        :param fig: matplotlib Figure.
+        :param stats: pd.DataFrame of the statistics of the ticker, see _stats_frame.
+        :return: None
+        """
         if self.rolling_sharpe:
             offset_index = 1
         else:
             offset_index = 0
         vertical_sections = 5 + offset_index
-        fig = plt.figure(figsize=(10, vertical_sections * 3.5))
         fig.suptitle(self.title, y=0.94, weight='bold')
-        gs = gridspec.GridSpec(vertical_sections, 3, wspace=0.25, hspace=0.5)
-    
-        stats = self.constituents[ticker]
-        ax_security = plt.subplot(gs[:2, :])
-                
+        gs = gridspec.GridSpec(vertical_sections, 3, figure=fig, wspace=0.25, hspace=0.5)
+
+        # sns.heatmap draws the whole figure to check whether its labels overlap: drawn before the other axes are
+        # added, it only draws itself.
+        ax_monthly_returns = fig.add_subplot(gs[3 + offset_index, :2])
+        self._plot_monthly_returns(stats, ax=ax_monthly_returns)
+
+        ax_security = fig.add_subplot(gs[:2, :])
         if self.rolling_sharpe:
-                ax_sharpe = plt.subplot(gs[2, :])
-        ax_drawdown = plt.subplot(gs[2 + offset_index, :])
-        ax_monthly_returns = plt.subplot(gs[3 + offset_index, :2])
-        ax_yearly_returns = plt.subplot(gs[3 + offset_index, 2])
-        ax_txt_curve = plt.subplot(gs[4 + offset_index, 0])
-#                    ax_txt_time = plt.subplot(gs[4 + offset_index, 2])
-    
+                ax_sharpe = fig.add_subplot(gs[2, :])
+        ax_drawdown = fig.add_subplot(gs[2 + offset_index, :])
+        ax_yearly_returns = fig.add_subplot(gs[3 + offset_index, 2])
+        ax_txt_curve = fig.add_subplot(gs[4 + offset_index, 0])
+#                    ax_txt_time = fig.add_subplot(gs[4 + offset_index, 2])
+
         self._plot_security(stats, ax=ax_security)
-                
         if self.rolling_sharpe:
             self._plot_rolling_sharpe(stats, ax=ax_sharpe)
         self._plot_drawdown(stats, ax=ax_drawdown)
-        self._plot_monthly_returns(stats, ax=ax_monthly_returns)
         self._plot_yearly_returns(stats, ax=ax_yearly_returns)
         self._plot_txt_curve(stats, ax=ax_txt_curve)
 #                    self._plot_txt_time(stats, ax=ax_txt_time)
-    
+
+    def plot_results(self, ticker):
+        """
+        Plot the Tearsheet
+        """
+        self._style()
+        fig = plt.figure(figsize=self._figure_size())
+        self._draw(fig, self._stats_frame(self.constituents[ticker]))
+
             # Plot the figure
         plt.show(block=False)
 
+    def export_tearsheets(self, folder, tickers=None, format="png", processes=None, dpi=100):
+        """
+        Renders the tearsheets of many tickers (by default every position) to folder/<ticker>.<format> files.
+
+        The statistics of every ticker are computed, and lined up in a DataFrame, once in this process. The figures
+            are then drawn and written with the Agg renderer, without pyplot and without a window, in a pool of worker
+            processes: drawing is by far the slowest part of a tearsheet, and the tickers are independent.
+        :param folder: Folder in which the files are written. Created if it does not exist.
+        :param tickers: Optional list of tickers. Defaults to every position of the portfolio, open or closed, but cash.
+        :param format: "png" or "pdf".
+        :param processes: Number of worker processes. None or 1 renders the tearsheets in this process.
+        :param dpi: Resolution of the PNG files.
+        :return: dict {ticker: path of the file}
+        """
+        if format not in ("png", "pdf"):
+            raise ValueError(f"format must be 'png' or 'pdf', not {format}")
+        os.makedirs(folder, exist_ok=True)
+        if tickers is None:
+            tickers = [ticker for ticker, position in self.positions().items() if position.category != "Cash"]
+        files = {ticker: os.path.join(folder, f"{ticker}.{format}") for ticker in tickers}
+        jobs = [(self._stats_frame(self.constituents[ticker]), files[ticker]) for ticker in tickers]
+        settings = {
+            "title": self.title, "benchmark": self.benchmark, "periods": self.periods,
+            "rolling_sharpe": self.rolling_sharpe,
+        }
+        if processes is None or processes <= 1:
+            _render_tearsheets(settings, jobs, dpi)
+        else:
+            chunks = [jobs[i::processes] for i in range(processes)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(_render_tearsheets, [settings] * processes, chunks, [dpi] * processes))
+        return files
+
 
+def _render_tearsheets(settings, jobs, dpi):
+    """
+    Writes tearsheets (runs in the worker processes of Analysis.export_tearsheets). Only the settings of the Analysis
+        are sent to the workers, not the portfolio.
+    :param settings: dict {"title", "benchmark", "periods", "rolling_sharpe"}
+    :param jobs: list of (statistics DataFrame, path of the file)
+    :param dpi: Resolution of the PNG files.
+    :return: None
+    """
+    analysis = Analysis.__new__(Analysis)
+    vars(analysis).update(settings)
+    analysis._style()
+    for stats, file in jobs:
+        fig = Figure(figsize=analysis._figure_size())
+        FigureCanvasAgg(fig)
+        analysis._draw(fig, stats)
+        fig.savefig(file, dpi=dpi)
@@ -0,0 +1,163 @@
+from analysis import Analysis
+from portfolio import Portfolio
+
+from decimal import Decimal
+import datetime
+import os
+import tempfile
+import unittest
+
+from matplotlib import gridspec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+
+def two_stocks():
+    """
+    :return: Portfolio logging a price a day for two stocks, "A" and "B", trading on different days.
+    """
+    portfolio = Portfolio()
+    prices = {
+        "A": ["10", "11", "10.5", "9", "9.5", "12", "11"],
+        "B": [None, None, "50", "51", None, "47", "52"],
+    }
+    for ticker, closes in prices.items():
+        for day, close in enumerate(closes):
+            if close is None:
+                continue
+            portfolio.transact_position(
+                ticker=ticker, quantity=Decimal("10"), price=Decimal(close),
+                date=datetime.datetime(2020, 3, 2 + day), action="BOT", category="Stock", currency="EUR"
+            )
+    return portfolio
+
+
+class TestBatchResults(unittest.TestCase):
+    """
+    Check that the batch statistics of two stocks computed on the date x ticker matrix match the ones computed ticker
+    by ticker.
+    """
+
+    def setUp(self):
+        self.portfolio = two_stocks()
+
+    def test_batch_matches_per_ticker(self):
+        loop = Analysis(self.portfolio, title=["Test"])
+        results = Analysis(self.portfolio, title=["Test"], batch=True).results
+        for ticker, statistics in loop.constituents.items():
+            self.assertAlmostEqual(results.loc[ticker, "sharpe"], statistics["sharpe"])
+            self.assertAlmostEqual(results.loc[ticker, "max_drawdown"], statistics["max_drawdown"])
+            self.assertEqual(results.loc[ticker, "max_drawdown_duration"], statistics["max_drawdown_duration"])
+            self.assertAlmostEqual(results.loc[ticker, "total_return"], statistics["cum_returns"].iloc[-1] - 1)
+        self.assertEqual(results.loc["B", "periods"], 4)
+        self.assertEqual(results.loc["B", "first_date"], datetime.datetime(2020, 3, 4))
+
+    def test_export_tearsheets(self):
+        analyzer = Analysis(self.portfolio, title=["Test"])
+        with tempfile.TemporaryDirectory() as folder:
+            files = analyzer.export_tearsheets(folder, tickers=["B"], format="pdf")
+            self.assertEqual(files, {"B": os.path.join(folder, "B.pdf")})
+            files = analyzer.export_tearsheets(folder)
+            self.assertEqual(sorted(files), ["A", "B"])
+            for file in files.values():
+                with open(file, "rb") as f:
+                    self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+
+    def test_export_tearsheets_in_processes(self):
+        analyzer = Analysis(self.portfolio, title=["Test"])
+        with tempfile.TemporaryDirectory() as serial, tempfile.TemporaryDirectory() as parallel:
+            expected = analyzer.export_tearsheets(serial)
+            files = analyzer.export_tearsheets(parallel, processes=2)
+            self.assertEqual(sorted(files), ["A", "B"])
+            for ticker, file in files.items():
+                with open(file, "rb") as f, open(expected[ticker], "rb") as g:
+                    self.assertEqual(f.read(), g.read(), ticker)
+
+
+class TestTearsheet(unittest.TestCase):
+    """
+    Check that drawing the monthly returns heatmap first (see Analysis._draw) gives the image the tearsheet had when
+    the axes were added, and drawn, from top to bottom.
+    """
+
+    @staticmethod
+    def top_to_bottom(analyzer, fig, stats):
+        fig.suptitle(analyzer.title, y=0.94, weight="bold")
+        gs = gridspec.GridSpec(5, 3, figure=fig, wspace=0.25, hspace=0.5)
+        axes = [fig.add_subplot(gs[:2, :]), fig.add_subplot(gs[2, :]), fig.add_subplot(gs[3, :2]),
+                fig.add_subplot(gs[3, 2]), fig.add_subplot(gs[4, 0])]
+        for plot, ax in zip([analyzer._plot_security, analyzer._plot_drawdown, analyzer._plot_monthly_returns,
+                             analyzer._plot_yearly_returns, analyzer._plot_txt_curve], axes):
+            plot(stats, ax=ax)
+
+    def render(self, draw, analyzer, stats):
+        fig = Figure(figsize=analyzer._figure_size())
+        canvas = FigureCanvasAgg(fig)
+        draw(analyzer, fig, stats)
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba()).copy()
+
+    def test_heatmap_first(self):
+        analyzer = Analysis(two_stocks(), title=["Test"])
+        self.assertFalse(analyzer.rolling_sharpe)
+        analyzer._style()
+        stats = analyzer._stats_frame(analyzer.constituents["A"])
+        np.testing.assert_array_equal(
+            self.render(Analysis._draw, analyzer, stats), self.render(self.top_to_bottom, analyzer, stats)
+        )
+
+
+class TestConstituents(unittest.TestCase):
+    """
+    Check that the statistics of a ticker are only computed when it is read, once, and again after it traded.
+    """
+
+    def setUp(self):
+        self.portfolio = two_stocks()
+
+    def test_statistics_are_lazy(self):
+        analyzer = Analysis(self.portfolio, title=["Test"])
+        self.assertEqual(analyzer.constituents.cached(), [])
+        statistics = analyzer.constituents["A"]
+        self.assertIs(analyzer.constituents["A"], statistics)
+        self.assertEqual(analyzer.constituents.cached(), ["A"])
+
+        self.portfolio.transact_position(
+            ticker="A", quantity=Decimal("10"), price=Decimal("8"), date=datetime.datetime(2020, 3, 9), action="SLD"
+        )
+        self.assertEqual(len(analyzer.constituents["A"]["cum_returns"]), len(statistics["cum_returns"]) + 1)
+        self.assertNotIn("C", analyzer.constituents)
+        self.assertNotIn("C", self.portfolio.positions)
+
+
+class TestClosedPositions(unittest.TestCase):
+    """
+    Close one of two stocks and check that it is still analysed: statistics, batch results, price matrix and
+    tearsheets, up to the day it was closed.
+    """
+
+    def setUp(self):
+        self.portfolio = two_stocks()
+        self.portfolio.transact_position(
+            ticker="B", quantity=Decimal("40"), price=Decimal("53"), date=datetime.datetime(2020, 3, 9), action="SLD"
+        )
+
+    def test_closed_ticker(self):
+        self.assertNotIn("B", self.portfolio.positions)
+        analyzer = Analysis(self.portfolio, title=["Test"], batch=True)
+        self.assertEqual(sorted(analyzer.constituents), ["A", "B"])
+        self.assertIn("B", analyzer.constituents)
+        statistics = analyzer.constituents["B"]
+        self.assertEqual(statistics["date"].iloc[-1], datetime.datetime(2020, 3, 9))
+        self.assertAlmostEqual(analyzer.results.loc["B", "total_return"], statistics["cum_returns"].iloc[-1] - 1)
+        self.assertEqual(analyzer.prices["B"].dropna().tolist(), [50, 51, 47, 52, 53])
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertEqual(sorted(analyzer.export_tearsheets(folder)), ["A", "B"])
+        self.assertNotIn("B", self.portfolio.positions)
+        self.assertNotIn("C", analyzer.constituents)
+        self.assertNotIn("C", self.portfolio.closed_positions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -35,7 +35,7 @@ class Analysis:
         
     def get_results(self):
         for ticker in self.portfolio.positions:
-            daily_return = pd.DataFrame(self.portfolio.positions[ticker].log)["price"].astype(float).pct_change().fillna(0.0)
+            daily_return = self.portfolio.positions[ticker].log.to_frame()["price"].astype(float).pct_change().fillna(0.0)
             cum_return = np.exp(np.log(1+daily_return).cumsum())         
             drawdown,max_drawdown,drawdown_duration = perf.create_drawdowns(cum_return)
             
@@ -47,13 +47,13 @@ class Analysis:
             statistics["max_drawdown_duration"] = drawdown_duration
             statistics["daily_returns"] = daily_return
             statistics["cum_returns"] = cum_return
-            statistics["date"] = pd.DataFrame(self.portfolio.positions[ticker].log)["date"]
+            statistics["date"] = self.portfolio.positions[ticker].log.to_frame()["date"]
             
             self.constituents[ticker] = statistics
             
         if self.benchmark is not None:
             "Need to change the benchamrk here"
-            daily_return_b = pd.DataFrame(self.portfolio.positions[ticker].log)["price"].astype(float).pct_change().fillna(0.0)
+            daily_return_b = self.portfolio.positions[ticker].log.to_frame()["price"].astype(float).pct_change().fillna(0.0)
             cum_returns_b = np.exp(np.log(1 + daily_return_b).cumsum())
             dd_b, max_dd_b, dd_dur_b = perf.create_drawdowns(cum_returns_b)
             statistics["sharpe_b"] = perf.create_sharpe_ratio(returns_b)
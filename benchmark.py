@@ -0,0 +1,341 @@
+"""
+Benchmarks of the portfolio replay on synthetic data, so that regressions can be tracked and performance work can be
+    measured.
+
+The synthetic data has the format of the DZ files: the "HIS", "MVT" and "SecuritiesIDs" sheets of the daily Zobel
+    files and the "Movements" sheet of the transactions file, for a configurable number of tickers, days, trades per
+    day and asset mix. The sheets are built in memory (no Excel parsing is timed).
+
+Usage:
+    python benchmark.py --tickers 200 --days 60 --trades-per-day 20 --output benchmark.json
+    python benchmark.py --profile "replay trace.json"  # per-function breakdown of the daily replay (see profiler.py)
+"""
+from analysis import Analysis
+from portfolio import Portfolio
+from profiler import Profiler
+from reader import Reader
+from tradelog import TradeLog
+import performance as perf
+
+from decimal import Decimal
+import argparse
+import datetime
+import json
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+
+# C_SOF_TYP / GTI code of every asset class in the DZ files (see SecurityID.CATEGORIES).
+CODES = {"Stock": 100, "Fund": 174, "ETF": 184, "Futures": 620, "Index Put Option": 431}
+ASSET_MIX = {"Stock": 0.5, "Fund": 0.2, "ETF": 0.1, "Futures": 0.1, "Index Put Option": 0.1}
+
+
+class SyntheticMarket:
+    """
+    A universe of securities with random-walk prices, and generators of DZ-format sheets trading them.
+    """
+
+    def __init__(self, tickers=200, days=60, trades_per_day=20, asset_mix=None, seed=0,
+                 start=datetime.datetime(2019, 3, 12)):
+        """
+        :param tickers: Number of securities.
+        :param days: Number of daily files (weekdays from start).
+        :param trades_per_day: Number of movements in every daily file.
+        :param asset_mix: dict {category: weight}, see ASSET_MIX.
+        :param seed: Seed of the random generator; the same parameters always give the same data.
+        :param start: datetime of the first daily file. The transactions file ends the day before.
+        """
+        self.days = days
+        self.trades_per_day = trades_per_day
+        self.start = start
+        self.rng = np.random.default_rng(seed)
+        mix = ASSET_MIX if asset_mix is None else asset_mix
+        names = list(mix)
+        weights = np.array([mix[name] for name in names], dtype=float)
+        self.ticker = np.arange(100000, 100000 + tickers)
+        self.category = np.array(names, dtype=object)[self.rng.choice(len(names), tickers, p=weights / weights.sum())]
+        self.code = np.array([CODES[category] for category in self.category], dtype=float)
+        self.currency = np.where(self.rng.random(tickers) < 0.7, "EUR", "USD")
+        self.contract_size = np.select(
+            [self.category == "Futures", self.category == "Index Put Option"], [10.0, 100.0], 1.0
+        )
+        self.strike = np.where(self.category == "Index Put Option", 2500 + 25 * self.rng.integers(0, 40, tickers), 0)
+        self.price = np.where(
+            self.category == "Futures", 3000.0, np.where(self.category == "Index Put Option", 50.0, 100.0)
+        ) * self.rng.uniform(0.5, 1.5, tickers)
+
+    def _walk(self):
+        self.price = (self.price * np.exp(self.rng.normal(0, 0.01, len(self.price)))).round(4)
+
+    def _trades(self, quantity, count):
+        """
+        :return: list of (index of the ticker, quantity, "CR" or "DR"); sales never exceed the quantity held.
+        """
+        trades = []
+        for i in self.rng.choice(len(self.ticker), count, replace=count > len(self.ticker)):
+            size = float(self.rng.integers(1, 50) * 10)
+            if quantity[i] > 0 and self.rng.random() < 0.4:
+                size = min(size, quantity[i])
+                quantity[i] -= size
+                trades.append((i, size, "DR"))
+            else:
+                quantity[i] += size
+                trades.append((i, size, "CR"))
+        return trades
+
+    def transactions(self, trades):
+        """
+        :param trades: Number of movements in the sheet, spread over the days before self.start.
+        :return: pd.DataFrame of the "Movements" sheet of the transactions file (newest first, as in the file).
+        """
+        quantity = np.zeros(len(self.ticker))
+        rows = []
+        dates = pd.bdate_range(end=self.start - datetime.timedelta(days=1), periods=max(trades // 20, 1))
+        for date, chunk in zip(dates, np.array_split(np.arange(trades), len(dates))):
+            self._walk()
+            for i, size, way in self._trades(quantity, len(chunk)):
+                price, category = self.price[i], self.category[i]
+                deal_ccy, price_ccy = ("EUR", "EUR") if self.currency[i] == "EUR" else ("EUR", "USD")
+                rows.append({
+                    "C_N_ID": self.ticker[i], "D_NAV": date, "GTI": self.code[i], "Q_QTY": size,
+                    # Futures: P_PRICE is the price of a contract, the price per unit is the third word of L_DEAL.
+                    "P_PRICE": price * self.contract_size[i] if category == "Futures" else price,
+                    "C_ACC_WAY": way,
+                    "L_DEAL": "FUT EUX " + f"{price:.4f}".replace(".", ","),
+                    "L_NAME": "Put on Euro Stoxx 50 Price Index Juni 2020/" + f"{self.strike[i]:,.2f}".replace(
+                        ",", " ").replace(".", ",").replace(" ", "."),
+                    "G_CONTRACT": self.contract_size[i],
+                    "C_DEAL_CCY": deal_ccy, "C_PTF_CCY": "EUR", "C_SETTLE_CCY": "EUR", "C_PRICE_CCY": price_ccy,
+                })
+        frame = pd.DataFrame(rows)
+        # history_trades reads the currencies from the columns 22/23 and 28/29 of the sheet.
+        columns = list(frame.columns[:9]) + [f"F{i}" for i in range(9, 22)]
+        columns += ["C_DEAL_CCY", "C_PTF_CCY", "F24", "F25", "F26", "F27", "C_SETTLE_CCY", "C_PRICE_CCY"]
+        return frame.reindex(columns=columns)[::-1].reset_index(drop=True)
+
+    def daily_files(self):
+        """
+        :return: list of (datetime, dict of the "HIS", "MVT" and "SecuritiesIDs" frames) for every daily file.
+        """
+        quantity = np.zeros(len(self.ticker))
+        files = []
+        for date in pd.bdate_range(self.start, periods=self.days).to_pydatetime():
+            self._walk()
+            trades = self._trades(quantity, self.trades_per_day)
+            mvt = pd.DataFrame(
+                [(self.ticker[i], date, size, self.price[i], way) for i, size, way in trades],
+                columns=["C_N_ID", "D_TRADE", "Q_QTY", "P_PRICE", "C_ACC_WAY"]
+            )
+            held = quantity > 0
+            his = pd.DataFrame({
+                "C_N_ID": self.ticker[held], "A_ACCRUED_INTEREST": np.nan, "G_SORTING_KEY": self.ticker[held] * 7,
+                "D_NAV": date, "P_COST_PRICE": self.price[held], "C_SOF_TYP": self.code[held],
+                "C_INVEST_CCY": self.currency[held], "G_CONTRACT_SIZE": self.contract_size[held],
+                "Q_QTY": quantity[held], "P_VAL_PRICE": self.price[held],
+                "A_MARKET_VALUE": (quantity * self.price * self.contract_size)[held].round(2),
+                "A_COST_VALUE_PTF": (quantity * self.price * self.contract_size)[held].round(2),
+            })
+            cash = pd.DataFrame({
+                "C_N_ID": [1, 2], "A_ACCRUED_INTEREST": np.nan, "G_SORTING_KEY": 0, "D_NAV": date,
+                "C_SOF_TYP": np.nan, "C_INVEST_CCY": ["EUR", "USD"],
+                "A_MARKET_VALUE": self.rng.uniform(1e5, 2e5, 2).round(2),
+                "A_COST_VALUE_PTF": self.rng.uniform(1e5, 2e5, 2).round(2),
+            })
+            listed = self.ticker[held | np.isin(self.ticker, mvt["C_N_ID"])]
+            ids = pd.DataFrame({
+                "C_N_ID": np.repeat(listed, 2),
+                "C_ID_TYPE": np.tile([1, 6], len(listed)),
+                "G_ID_VALUE": [
+                    value for ticker in listed
+                    for value in (f"DE000{ticker}", f"SX5E 06/19/20 P{self.strike[ticker - 100000]} Index")
+                ],
+            })
+            files.append((date, {"HIS": pd.concat([his, cash], ignore_index=True), "MVT": mvt, "SecuritiesIDs": ids}))
+        return files
+
+
+class FrameReader(Reader):
+    """
+    Reader whose read_excel returns in-memory sheets, so that history_movements is timed without Excel parsing.
+    """
+
+    def __init__(self, portfolio, sheets):
+        super().__init__(portfolio)
+        self.sheets = sheets
+
+    def read_excel(self, file, sheet_name, **kwargs):
+        return self.sheets[sheet_name].copy()
+
+
+def timed(fn, repeat):
+    """
+    :param fn: function called without arguments; it is given a fresh state by its caller on every call.
+    :param repeat: Number of runs.
+    :return: dict {"min", "mean"} of the wall time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - begin)
+    return {"min": min(times), "mean": sum(times) / len(times)}
+
+
+def run(tickers=200, days=60, trades_per_day=20, history_trades=2000, asset_mix=None, seed=0, repeat=3):
+    """
+    Generates the synthetic data and times every benchmark.
+    :return: dict of the parameters, the environment and the results {benchmark: {"min", "mean", "items"}}.
+    """
+    market = SyntheticMarket(tickers, days, trades_per_day, asset_mix, seed)
+    movements = market.transactions(history_trades)
+    files = market.daily_files()
+    end_date = market.start.strftime("%m/%d/%Y")
+    results = {}
+
+    def history():
+        FrameReader(Portfolio(), {"Movements": movements}).history_movements("", end_date)
+    results["Reader.history_movements"] = dict(timed(history, repeat), items=len(movements.index))
+
+    # The daily files are replayed sheet by sheet so that every method gets its own timing.
+    stages = {"Reader.read_ids": [], "Reader.read_movements": [], "Reader.read_positions": []}
+    for _ in range(repeat):
+        reader = Reader(Portfolio())
+        spent = dict.fromkeys(stages, 0.0)
+        for date, data in files:
+            data = {name: frame.copy() for name, frame in data.items()}
+            for name, method, sheet in [
+                ("Reader.read_ids", reader.read_ids, "SecuritiesIDs"),
+                ("Reader.read_movements", reader.read_movements, "MVT"),
+                ("Reader.read_positions", reader.read_positions, "HIS"),
+            ]:
+                begin = time.perf_counter()
+                method(data[sheet])
+                spent[name] += time.perf_counter() - begin
+        for name in stages:
+            stages[name].append(spent[name])
+    rows = {"Reader.read_ids": "SecuritiesIDs", "Reader.read_movements": "MVT", "Reader.read_positions": "HIS"}
+    for name, times in stages.items():
+        items = sum(len(data[rows[name]].index) for _, data in files)
+        results[name] = {"min": min(times), "mean": sum(times) / len(times), "items": items}
+    portfolio = reader.portfolio
+
+    trades = [
+        (market.ticker[i], Decimal(str(market.price[i])), market.category[i], market.currency[i],
+         Decimal(str(market.contract_size[i])))
+        for i in np.random.default_rng(seed).choice(len(market.ticker), trades_per_day * days)
+    ]
+
+    def transact():
+        trading = Portfolio()
+        date = market.start
+        for i, (ticker, price, category, currency, contract_size) in enumerate(trades):
+            trading.transact_position(
+                ticker=ticker, quantity=Decimal(10), price=price, date=date, action="BOT" if i % 3 else "SLD",
+                category=category, currency=currency, contract_size=contract_size, strike=Decimal(3000), history=True
+            )
+    results["Portfolio.transact_position"] = dict(timed(transact, repeat), items=len(trades))
+
+    # Log rows of a replay spread over the positions. TradeLog buffers new rows and writes them to its arrays in
+    # blocks; TradeLog.BUFFER = 1 gives the cost of writing every row on its own.
+    row = {
+        "date": market.start, "quantity": Decimal("100"), "price": Decimal("74.78"), "market_value": Decimal("7478.00"),
+        "unit_cost": Decimal("74.78"), "cost_basis": Decimal("7478.00"), "unrealized_pnl": Decimal("0.00"),
+        "realized_pnl": Decimal("0.00"), "event": "Trade",
+    }
+    appends = trades_per_day * days * 10
+
+    def append():
+        logs = [TradeLog() for _ in range(tickers)]
+        for i in range(appends):
+            logs[i % tickers].append(**row)
+        for log in logs:
+            log.raw("date")
+    results["TradeLog.append"] = dict(timed(append, repeat), items=appends)
+
+    results["Analysis.get_results"] = dict(
+        timed(lambda: Analysis(portfolio, title=["Benchmark"]).get_results(), repeat), items=len(portfolio.positions)
+    )
+    results["Analysis.get_batch_results"] = dict(
+        timed(lambda: Analysis(portfolio, title=["Benchmark"]).get_batch_results(), repeat),
+        items=len(portfolio.positions)
+    )
+
+    curves = pd.DataFrame(np.exp(np.cumsum(market.rng.normal(0, 0.01, (days, tickers)), axis=0)))
+    results["performance.create_drawdowns"] = dict(
+        timed(lambda: [perf.create_drawdowns(curves[column]) for column in curves], repeat), items=tickers
+    )
+    results["performance.create_drawdowns (matrix)"] = dict(
+        timed(lambda: perf.create_drawdowns(curves, top=5), repeat), items=tickers
+    )
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "parameters": {
+            "tickers": tickers, "days": days, "trades_per_day": trades_per_day, "history_trades": history_trades,
+            "asset_mix": asset_mix or ASSET_MIX, "seed": seed, "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def profile(trace, tickers=200, days=60, trades_per_day=20, asset_mix=None, seed=0, memory=False):
+    """
+    Replays the synthetic daily files under a Profiler.
+    :param trace: path of the Chrome trace file written.
+    :return: Profiler
+    """
+    files = SyntheticMarket(tickers, days, trades_per_day, asset_mix, seed).daily_files()
+    with Profiler(memory=memory) as profiler:
+        reader = Reader(Portfolio())
+        for date, data in files:
+            reader.process_day({name: frame.copy() for name, frame in data.items()})
+    profiler.write_trace(trace)
+    return profiler
+
+
+def parse_mix(text):
+    """
+    :param text: "Stock=0.5,Futures=0.5"
+    :return: dict {"Stock": 0.5, "Futures": 0.5}
+    """
+    mix = {}
+    for item in text.split(","):
+        category, weight = item.split("=")
+        if category not in CODES:
+            raise argparse.ArgumentTypeError(f"Unknown category {category}, expected one of {list(CODES)}.")
+        mix[category] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the portfolio replay on synthetic DZ-format data.")
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--trades-per-day", type=int, default=20)
+    parser.add_argument("--history-trades", type=int, default=2000)
+    parser.add_argument("--mix", type=parse_mix, default=None, help="asset mix, e.g. Stock=0.6,Fund=0.2,Futures=0.2")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to.")
+    parser.add_argument("--profile", metavar="TRACE", help="profile the daily replay and write a Chrome trace.")
+    parser.add_argument("--memory", action="store_true", help="with --profile, record allocations too (slower).")
+    args = parser.parse_args()
+    np.seterr(divide="ignore", invalid="ignore")  # the Sharpe ratio of a flat price log (cash) is NaN.
+
+    if args.profile:
+        print(profile(args.profile, args.tickers, args.days, args.trades_per_day, args.mix, args.seed,
+                      args.memory).report())
+        raise SystemExit
+
+    report = run(args.tickers, args.days, args.trades_per_day, args.history_trades, args.mix, args.seed, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{'benchmark':<40}{'items':>10}{'min (s)':>12}{'mean (s)':>12}")
+    for name, result in report["results"].items():
+        print(f"{name:<40}{result['items']:>10}{result['min']:>12.4f}{result['mean']:>12.4f}")
@@ -0,0 +1,29 @@
+import benchmark
+
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Run the benchmarks on a tiny synthetic market, with every asset class, to check that the generated sheets can be
+    replayed.
+    """
+
+    def test_run(self):
+        report = benchmark.run(tickers=20, days=3, trades_per_day=10, history_trades=60, repeat=1)
+        self.assertEqual(report["parameters"]["tickers"], 20)
+        for name, result in report["results"].items():
+            self.assertGreater(result["items"], 0, name)
+            self.assertGreaterEqual(result["mean"], result["min"])
+
+    def test_asset_mix(self):
+        market = benchmark.SyntheticMarket(tickers=10, days=2, asset_mix={"Futures": 1})
+        self.assertEqual(set(market.category), {"Futures"})
+        movements = market.transactions(20)
+        self.assertEqual(list(movements.columns[[22, 23, 28, 29]]),
+                         ["C_DEAL_CCY", "C_PTF_CCY", "C_SETTLE_CCY", "C_PRICE_CCY"])
+        self.assertTrue((movements["D_NAV"] < market.start).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
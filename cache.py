@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+
+class ParsedFileCache:
+    """
+    On-disk cache of parsed Excel workbooks.
+
+    Parsing the daily Zobel files and the "Copy of Transactions.xls" file with pd.read_excel takes seconds per file,
+        and the same historical files are read again on every backfill. The first time a workbook is read, every
+        requested sheet is saved as a Parquet file in the cache folder. Later reads load the Parquet files instead,
+        which is orders of magnitude faster.
+
+    Every workbook gets its own entry, keyed by its absolute path (and the read_excel options). The entry records the
+        mtime and size of the workbook when it was parsed; if the workbook changes, the entry no longer matches and is
+        parsed and saved again.
+
+    Sheets that Parquet cannot store (for example object columns mixing strings and numbers) or environments without
+        pyarrow fall back to pickle files, so the cache never changes what read_excel returns.
+    """
+
+    VERSION = 1
+
+    def __init__(self, folder):
+        """
+        :param folder: Folder in which the parsed sheets are stored. Created if it does not exist.
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _entry(self, file, kwargs):
+        """
+        :return: str path to the cache entry of `file` read with the read_excel options `kwargs`.
+        """
+        key = json.dumps([os.path.abspath(file), sorted((k, repr(v)) for k, v in kwargs.items())])
+        return os.path.join(self.folder, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _signature(file):
+        stat = os.stat(file)
+        return {"version": ParsedFileCache.VERSION, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    def read_excel(self, file, sheet_name, **kwargs):
+        """
+        Drop-in replacement for pd.read_excel(file, sheet_name=sheet_name, **kwargs).
+        :param file: path to the workbook.
+        :param sheet_name: str or list of str.
+        :param kwargs: any other pd.read_excel option, such as skiprows.
+        :return: pd.DataFrame if sheet_name is a str, dict {sheet: pd.DataFrame} if it is a list.
+        """
+        sheets = [sheet_name] if isinstance(sheet_name, str) else list(sheet_name)
+        entry = self._entry(file, kwargs)
+        signature = self._signature(file)  # raises FileNotFoundError like pd.read_excel would.
+        data = self._load(entry, signature, sheets)
+        if data is None:
+            data = pd.read_excel(file, sheet_name=sheets, **kwargs)
+            self._save(entry, signature, data)
+        if isinstance(sheet_name, str):
+            return data[sheet_name]
+        return data
+
+    def _load(self, entry, signature, sheets):
+        """
+        :return: dict {sheet: pd.DataFrame}, None if the entry is missing, stale or does not hold every sheet.
+        """
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta["signature"] != signature or not all(sheet in meta["sheets"] for sheet in sheets):
+            return None
+        data = {}
+        for sheet in sheets:
+            path = os.path.join(entry, meta["sheets"][sheet])
+            if path.endswith(".parquet"):
+                data[sheet] = pd.read_parquet(path)
+            else:
+                data[sheet] = pd.read_pickle(path)
+        return data
+
+    def _save(self, entry, signature, data):
+        """
+        Writes every sheet of data into the entry folder. meta.json is written last (and atomically), so an entry
+            interrupted half-way is never picked up by _load.
+        """
+        os.makedirs(entry, exist_ok=True)
+        files = {}
+        for i, (sheet, frame) in enumerate(data.items()):
+            try:
+                name = f"{i}.parquet"
+                frame.to_parquet(os.path.join(entry, name))
+            except (ImportError, ValueError, TypeError):  # pyarrow is missing, or it cannot convert one of the columns.
+                name = f"{i}.pkl"
+                frame.to_pickle(os.path.join(entry, name))
+            files[sheet] = name
+        temp = os.path.join(entry, f"meta.json.{os.getpid()}")
+        with open(temp, "w") as f:
+            json.dump({"signature": signature, "sheets": files}, f)
+        os.replace(temp, os.path.join(entry, "meta.json"))
@@ -0,0 +1,74 @@
+from cache import ParsedFileCache
+
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+
+class TestParsedFileCache(unittest.TestCase):
+    """
+    Read a workbook through the cache twice, then after it changed, and check when it is parsed again and that the
+    sheets read back are the ones pd.read_excel returns.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file = os.path.join(self.folder.name, "daily.xlsx")
+        self.write(pd.DataFrame({"C_N_ID": [1, 2], "Q_QTY": [100.0, 5.5]}))
+        self.cache = ParsedFileCache(os.path.join(self.folder.name, "cache"))
+
+    def write(self, frame):
+        with pd.ExcelWriter(self.file) as writer:
+            frame.to_excel(writer, sheet_name="HIS", index=False)
+
+    def read(self):
+        """
+        :return: tuple(pd.DataFrame of the "HIS" sheet read through the cache, number of times the workbook was parsed)
+        """
+        with mock.patch("cache.pd.read_excel", wraps=pd.read_excel) as read_excel:
+            frame = self.cache.read_excel(self.file, sheet_name="HIS")
+        return frame, read_excel.call_count
+
+    def entry_files(self):
+        return sorted(
+            name for _, _, names in os.walk(self.cache.folder) for name in names if not name.startswith("meta")
+        )
+
+    def test_hit_on_unchanged_file(self):
+        parsed, calls = self.read()
+        self.assertEqual(calls, 1)
+        cached, calls = self.read()
+        self.assertEqual(calls, 0)
+        pd.testing.assert_frame_equal(cached, parsed)
+        self.assertEqual(self.entry_files(), ["0.parquet"])
+
+    def test_invalidation(self):
+        self.read()
+        # Same size, new mtime.
+        stat = os.stat(self.file)
+        os.utime(self.file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.read()[1], 1)
+        self.assertEqual(self.read()[1], 0)
+        # New content, and so a new size.
+        self.write(pd.DataFrame({"C_N_ID": [1, 2, 3], "Q_QTY": [100.0, 5.5, 7.0]}))
+        frame, calls = self.read()
+        self.assertEqual(calls, 1)
+        self.assertEqual(frame["C_N_ID"].tolist(), [1, 2, 3])
+
+    def test_pickle_fallback(self):
+        # A column mixing numbers and strings cannot be stored in Parquet.
+        self.write(pd.DataFrame({"C_N_ID": [1, 2], "G_ID_VALUE": [7007, "DE0001"]}))
+        parsed, _ = self.read()
+        cached, calls = self.read()
+        self.assertEqual(calls, 0)
+        pd.testing.assert_frame_equal(cached, parsed)
+        self.assertEqual(cached["G_ID_VALUE"].tolist(), [7007, "DE0001"])
+        self.assertEqual(self.entry_files(), ["0.pkl"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+from fixedpoint import PLACES, to_decimal
+from tradelog import TradeLog, NA, CHAIN_LOG
+from decimal import Decimal
+
+import numpy as np
+
+
+class ContractChains:
+    """
+    Futures of a Portfolio linked by underlying. The contracts on the same underlying ("VG" for the Euro Stoxx 50
+        futures, see SecurityMaster.underlyings) form a chain: rolling from one expiry to the next closes a contract
+        and opens another one of the same chain, instead of ending one position and starting an unrelated one.
+
+    At the end of every day (see close_day), one row per chain is appended to self.log: the front contract (the one
+        with the largest open quantity) and its price, the net quantity, exposure and P&L of the chain. The P&L of a
+        chain includes the realized P&L of its closed contracts and the exposure adds up every open contract, so both
+        series run on across the rolls. When the front contract changes, the gap between the prices of the new and
+        the old contract is added to the adjustment of the chain, from which frame() back-adjusts the prices.
+
+    Both prices of a gap are taken at the same time. When the old front contract was closed that day, they are the
+        ones of the roll: its closing price and the price of the new contract when the old one was closed (or the
+        opening price of the new contract, if it was opened after). Otherwise both contracts are still open and
+        their prices at the end of the day are used.
+
+    Every update only reads the contracts of the chain that are open, so the log grows by one row per chain and day
+        without going back over the positions or their logs.
+    """
+
+    def __init__(self, ids):
+        """
+        :param ids: SecurityMaster holding the underlyings of the futures, parsed from their Bloomberg tickers.
+        """
+        self.ids = ids
+        self.chains = {}  # underlying -> list of the C_N_ID of its contracts, in the order they were first opened.
+        self.underlying = {}  # C_N_ID -> underlying
+        self.currency = {}  # underlying -> currency of its contracts.
+        self.live = {}  # underlying -> {C_N_ID: open Future position}
+        self.pending = {}  # C_N_ID -> open Future position whose underlying is not known yet.
+        self.realized = {}  # underlying -> Decimal P&L of the closed contracts of the chain.
+        self.front = {}  # underlying -> C_N_ID of the front contract at the end of the last day.
+        self.prices = {}  # C_N_ID -> Decimal last price of a contract at the end of a day, or when it was closed.
+        self.adjustment = {}  # underlying -> Decimal sum of the roll gaps.
+        # underlying -> {C_N_ID closed since the last close_day: {C_N_ID: Decimal price when it was closed}}
+        self.rolls = {}
+        self.log = TradeLog(CHAIN_LOG)
+
+    def _link(self, ticker, underlying, position):
+        if underlying not in self.chains:
+            self.chains[underlying] = []
+            self.currency[underlying] = position.currency
+            self.live[underlying] = {}
+            self.realized[underlying] = Decimal("0.00")
+            self.adjustment[underlying] = Decimal(0)
+        if ticker not in self.underlying:
+            self.underlying[ticker] = underlying
+            self.chains[underlying].append(ticker)
+        self.live[underlying][ticker] = position
+
+    def _resolve(self):
+        """
+        Links the pending contracts whose underlying has since been read from the security ids.
+        """
+        for ticker in [ticker for ticker in self.pending if ticker in self.ids.underlyings]:
+            self._link(ticker, self.ids.underlyings[ticker], self.pending.pop(ticker))
+
+    def open(self, ticker, position):
+        """
+        Adds a new Future position to the chain of its underlying. A contract whose underlying is not known yet is
+            linked by the next close_day after its Bloomberg ticker was read.
+        :param ticker: C_N_ID of the contract.
+        :param position: Future position.
+        :return: None
+        """
+        underlying = self.underlying.get(ticker, self.ids.underlyings.get(ticker))
+        if underlying is None:
+            self.pending[ticker] = position
+            return
+        self._link(ticker, underlying, position)
+        price = self._price(position)
+        if price is not None:
+            for prices in self.rolls.get(underlying, {}).values():
+                prices.setdefault(ticker, price)
+
+    def close(self, ticker, position):
+        """
+        Takes a closed Future position out of its chain, keeping its P&L in the P&L of the chain. Called before the
+            position is archived (see Portfolio._archive).
+        :param ticker: C_N_ID of the contract.
+        :param position: the closed Future position.
+        :return: None
+        """
+        if ticker in self.pending:
+            if ticker not in self.ids.underlyings:  # never linked to a chain.
+                del self.pending[ticker]
+                return
+            self._link(ticker, self.ids.underlyings[ticker], self.pending.pop(ticker))
+        underlying = self.underlying.get(ticker)
+        if underlying is None or ticker not in self.live[underlying]:
+            return
+        del self.live[underlying][ticker]
+        self.realized[underlying] += position.realized_pnl + position.unrealized_pnl
+        price = self._price(position)
+        if price is not None:
+            self.prices[ticker] = price
+            prices = {other: self._price(pt) for other, pt in self.live[underlying].items()}
+            prices = {other: value for other, value in prices.items() if value is not None}
+            prices[ticker] = price
+            self.rolls.setdefault(underlying, {})[ticker] = prices
+
+    @staticmethod
+    def _price(position):
+        """
+        :return: Decimal price of the last row of the log of the position, None if there is none.
+        """
+        prices = position.log.raw("price")
+        if not len(prices) or prices[-1] == NA:
+            return None
+        return to_decimal(int(prices[-1]), PLACES)
+
+    def close_day(self, date):
+        """
+        Appends the state of every chain at the end of `date` to self.log, and adds the gap of the chains whose front
+            contract changed to their adjustment.
+        :param date: datetime of the day.
+        :return: None
+        """
+        self._resolve()
+        for underlying, contracts in self.chains.items():
+            live = self.live[underlying]
+            quantity, exposure, pnl = Decimal(0), Decimal("0.00"), self.realized[underlying]
+            front, largest = self.front.get(underlying, contracts[-1]), -1
+            for ticker in contracts:
+                pt = live.get(ticker)
+                if pt is None:
+                    continue
+                quantity += pt.quantity
+                exposure += pt.exposure
+                pnl += pt.realized_pnl + pt.unrealized_pnl
+                price = self._price(pt)
+                if price is not None:
+                    self.prices[ticker] = price
+                if abs(pt.quantity) >= largest:  # ties go to the contract opened last.
+                    front, largest = ticker, abs(pt.quantity)
+            last = self.front.get(underlying)
+            if last is not None and front != last:
+                prices = self.rolls.get(underlying, {}).get(last)
+                if prices is None or front not in prices:
+                    prices = self.prices
+                if front in prices and last in prices:
+                    self.adjustment[underlying] += prices[front] - prices[last]
+            self.front[underlying] = front
+            self.log.append(
+                date=date, underlying=underlying, currency=self.currency[underlying], contract=front,
+                quantity=quantity, price=self.prices.get(front), adjustment=self.adjustment[underlying],
+                exposure=exposure, pnl=pnl
+            )
+        self.rolls.clear()
+
+    def exposures(self):
+        """
+        :return: dict {underlying: Decimal exposure} of the open contracts of every chain, as they stand.
+        """
+        return {
+            underlying: sum((pt.exposure for pt in live.values()), Decimal("0.00"))
+            for underlying, live in self.live.items()
+        }
+
+    def frame(self):
+        """
+        The daily log of the chains, with the series derived from it per underlying:
+            - roll: True on the days the front contract changed.
+            - adjusted_price: the price of the front contract plus the roll gaps that came after the date, so that the
+              series has no jump at the rolls (back-adjusted).
+            - adjusted_exposure: the exposure restated at the adjusted price.
+            - daily_pnl: the change of the P&L of the chain since the previous day.
+        :return: pd.DataFrame [date, underlying, currency, contract, quantity, price, adjustment, exposure, pnl, roll,
+                               adjusted_price, adjusted_exposure, daily_pnl]
+        """
+        frame = self.log.to_frame()
+        groups = frame.groupby("underlying", observed=True, sort=False)
+        previous = groups["contract"].shift().astype(object)
+        frame["roll"] = previous.notna() & (frame["contract"].astype(object) != previous)
+        frame["adjusted_price"] = frame["price"] + groups["adjustment"].transform("last") - frame["adjustment"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(frame["price"] != 0, frame["adjusted_price"] / frame["price"], 1.0)
+        frame["adjusted_exposure"] = frame["exposure"] * ratio
+        frame["daily_pnl"] = groups["pnl"].diff().fillna(frame["pnl"])
+        return frame
@@ -0,0 +1,65 @@
+from portfolio import Portfolio
+
+from decimal import Decimal
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestContractChains(unittest.TestCase):
+    """
+    Roll a Euro Stoxx 50 future from the March to the June contract, with an S&P 500 future whose Bloomberg ticker is
+    only read after it was opened, and check the continuous series of both chains.
+    """
+
+    days = [datetime.datetime(2020, 3, day) for day in (11, 12, 13)]
+
+    def trade(self, portfolio, ticker, quantity, price, day, **kwargs):
+        portfolio.transact_position(
+            ticker=ticker, quantity=Decimal(quantity), price=Decimal(price), date=day, history=True, **kwargs
+        )
+
+    def test_roll(self):
+        days = self.days
+        portfolio = Portfolio(debug=True)
+        portfolio.ids.update(pd.DataFrame({
+            "C_N_ID": [10, 11], "C_ID_TYPE": [6, 6], "G_ID_VALUE": ["VGH0 Index", "VGM0 Index"]
+        }))
+        future = {"category": "Futures", "contract_size": Decimal("10")}
+        self.trade(portfolio, 10, "2", "3300", days[0], action="BOT", currency="EUR", **future)
+        self.trade(portfolio, 10, "2", "3310", days[0], position=True)
+        self.trade(portfolio, 12, "1", "2700", days[0], action="SLD", currency="USD", **future)
+        self.assertIn(12, portfolio.chains.pending)
+        portfolio.ids[12] = {"C_ID_TYPE": [6], "G_ID_VALUE": ["ESH0 Index"]}
+        portfolio.close_day(days[0])
+
+        # The roll: the March contract is sold and the June contract bought on the same day.
+        self.trade(portfolio, 10, "2", "3320", days[1], action="SLD")
+        self.trade(portfolio, 11, "2", "3350", days[1], action="BOT", currency="EUR", **future)
+        self.assertEqual(portfolio.chains.exposures()["VG"], Decimal("67000.00"))
+        # The June contract closes the day above its roll price; the gap is still the one of the roll.
+        self.trade(portfolio, 11, "2", "3355", days[1], position=True)
+        portfolio.close_day(days[1])
+        self.trade(portfolio, 11, "2", "3340", days[2], position=True)
+        portfolio.close_day(days[2])
+
+        frame = portfolio.chain_frame()
+        vg = frame[frame["underlying"] == "VG"]
+        self.assertEqual(vg["contract"].tolist(), [10, 11, 11])
+        self.assertEqual(vg["roll"].tolist(), [False, True, False])
+        self.assertEqual(vg["price"].tolist(), [3310, 3355, 3340])
+        self.assertEqual(vg["adjustment"].tolist(), [0, 30, 30])
+        self.assertEqual(vg["adjusted_price"].tolist(), [3340, 3355, 3340])
+        self.assertEqual(vg["exposure"].tolist(), [66200, 67100, 66800])
+        self.assertEqual(vg["pnl"].tolist(), [200, 500, 200])
+        self.assertEqual(vg["daily_pnl"].tolist(), [200, 300, -300])
+        np.testing.assert_allclose(vg["adjusted_exposure"], [66200 * 3340 / 3310, 67100, 66800])
+        es = frame[frame["underlying"] == "ES"]
+        self.assertEqual(es["currency"].tolist(), ["USD"] * 3)
+        self.assertEqual(es["quantity"].tolist(), [-1] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
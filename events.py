@@ -0,0 +1,56 @@
+"""
+Typed events produced while the daily files are replayed (see Reader.events). Every event is applied to the Portfolio
+    by apply_event before it is handed to the consumers, so a consumer sees the portfolio as of that event.
+"""
+import collections
+
+# A daily file starts/ends being replayed.
+DayStarted = collections.namedtuple("DayStarted", ["date", "file"])
+DayFinished = collections.namedtuple("DayFinished", ["date", "file"])
+# There is no daily file for a weekday.
+FileMissing = collections.namedtuple("FileMissing", ["date"])
+# New security ids (rows of the "SecuritiesIDs" tab, or {C_N_ID: {"C_ID_TYPE": [...], "G_ID_VALUE": [...]}}, see
+# SecurityID.SecurityMaster.update) and/or WKNs ({C_N_ID: [G_SORTING_KEY]}).
+IdsRefreshed = collections.namedtuple("IdsRefreshed", ["date", "ids", "wkn"])
+# A buy ("BOT") or sell ("SLD"). category, currency and contract_size are only needed to open a new position.
+Trade = collections.namedtuple(
+    "Trade", ["ticker", "quantity", "price", "date", "action", "category", "currency", "contract_size"],
+    defaults=[None, None, 1]
+)
+# Latest quote and quantity of a position from the "HIS" sheet.
+MarketUpdate = collections.namedtuple("MarketUpdate", ["ticker", "quantity", "price", "date", "category", "currency"])
+# Latest quotes ({ticker: price}) of positions whose quantity did not change, marked at once (see
+# Portfolio.mark_to_market).
+MarkToMarket = collections.namedtuple("MarkToMarket", ["date", "prices"])
+# Latest value of a cash account.
+CashUpdate = collections.namedtuple("CashUpdate", ["currency", "market_value", "cost_basis", "date"])
+
+
+def apply_event(portfolio, event):
+    """
+    Applies an event to the portfolio. DayFinished closes the day in the daily time series of the portfolio (see
+        Portfolio.close_day); the events that do not change the portfolio (DayStarted, missing files) are ignored.
+    :param portfolio: Portfolio
+    :param event: one of the events of this module.
+    :return: None
+    """
+    kind = type(event)
+    if kind is Trade:
+        portfolio.transact_position(
+            ticker=event.ticker, quantity=event.quantity, price=event.price, date=event.date, action=event.action,
+            category=event.category, currency=event.currency, contract_size=event.contract_size
+        )
+    elif kind is MarketUpdate:
+        portfolio.transact_position(
+            ticker=event.ticker, quantity=event.quantity, price=event.price, date=event.date,
+            category=event.category, currency=event.currency, position=True
+        )
+    elif kind is MarkToMarket:
+        portfolio.mark_to_market(event.prices, event.date)
+    elif kind is CashUpdate:
+        portfolio.transact_cash(event.currency, event.market_value, event.cost_basis, event.date)
+    elif kind is DayFinished:
+        portfolio.close_day(event.date)
+    elif kind is IdsRefreshed:
+        portfolio.ids.update(event.ids)
+        portfolio.wkn.update(event.wkn)
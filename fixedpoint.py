@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+# Number of decimal places of the scaled integers.
+PLACES = 7       # quantities, prices, contract sizes and averages (SEVENPLACES)
+CENTS = 2        # amounts of money (TWOPLACES)
+PRECISION = 28   # significant digits of the default decimal context.
+_POWERS = [10 ** i for i in range(2 * PRECISION)]
+
+
+def to_fixed(value, places=PLACES):
+    """
+    Converts a number to a scaled integer, rounding half to even like Decimal.quantize.
+    :param value: Decimal, int or float.
+    :param places: number of decimal places kept.
+    :return: int value * 10 ** places
+    """
+    if type(value) is int:
+        return value * 10 ** places
+    return int(Decimal(value).scaleb(places).to_integral_value())
+
+
+def to_decimal(value, places):
+    """
+    :param value: scaled integer.
+    :param places: number of decimal places of value.
+    :return: Decimal equal to value / 10 ** places, with exactly `places` decimal places.
+    """
+    return Decimal(value).scaleb(-places)
+
+
+def _round(value, divisor):
+    """
+    value / divisor rounded half to even. divisor must be positive.
+    """
+    q, r = divmod(abs(value), divisor)
+    r2 = 2 * r
+    if r2 > divisor or (r2 == divisor and q & 1):
+        q += 1
+    return q if value >= 0 else -q
+
+
+def rescale(value, places, to_places):
+    """
+    Equivalent of Decimal.quantize on a scaled integer.
+    :param value: scaled integer with `places` decimal places.
+    :param to_places: decimal places of the result.
+    :return: int
+    """
+    if to_places >= places:
+        return value * 10 ** (to_places - places)
+    return _round(value, 10 ** (places - to_places))
+
+
+def divide(numerator, numerator_places, denominator, denominator_places, places):
+    """
+    Equivalent of (a / b).quantize(10 ** -places) for the Decimals a and b.
+
+    Decimal first rounds the quotient to 28 significant digits and then rounds that to `places`. Rounding twice only
+        gives a different result from rounding the exact quotient once when the exact quotient lies within 28 digits of
+        a tie, so that (rare) case is handed to Decimal.
+    :param numerator: scaled integer a.
+    :param numerator_places: decimal places of a.
+    :param denominator: scaled integer b.
+    :param denominator_places: decimal places of b.
+    :param places: decimal places of the result.
+    :return: int
+    """
+    shift = places + denominator_places - numerator_places
+    num = abs(numerator)
+    den = abs(denominator)
+    if shift >= 0:
+        num *= 10 ** shift
+    else:
+        den *= 10 ** -shift
+    q, r = divmod(num, den)  # raises ZeroDivisionError like Decimal raises DivisionByZero/InvalidOperation.
+    # Upper bound of the exponent of the leading digit of the quotient.
+    exponent = (q.bit_length() * 30103) // 100000 - places
+    r2 = 2 * r
+    if exponent + places >= PRECISION - 1 or abs(r2 - den) * _POWERS[PRECISION - 1 - exponent - places] <= den:
+        quotient = Decimal(numerator).scaleb(-numerator_places) / Decimal(denominator).scaleb(-denominator_places)
+        return int(quotient.quantize(Decimal(1).scaleb(-places)).scaleb(places))
+    if r2 > den or (r2 == den and q & 1):
+        q += 1
+    return q if (numerator >= 0) == (denominator >= 0) else -q
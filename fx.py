@@ -0,0 +1,153 @@
+from position import TWOPLACES
+from decimal import Decimal
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class RateTable:
+    """
+    Daily exchange rates of currencies against a base currency, kept in memory as NumPy arrays: for every currency, a
+        sorted datetime64[D] array of dates and a float64 array of rates.
+
+    Rates follow the ECB reference rate convention: units of the currency for one unit of the base currency
+        (EUR 1 = USD 1.1234), so an amount in the currency is divided by the rate to get the base amount.
+
+    Lookups are "as of": the rate of a date is the latest rate published on or before it, so weekends and holidays
+        use the last rate of the week. A date before the first rate of a currency has no rate (NaN).
+    """
+
+    def __init__(self, base="EUR"):
+        """
+        :param base: The currency the amounts are converted to.
+        """
+        self.base = base
+        self.dates = {}  # currency -> np.ndarray of datetime64[D], sorted.
+        self.rates = {}  # currency -> np.ndarray of float64.
+
+    @classmethod
+    def load(cls, *files, base="EUR", date_column="Date"):
+        """
+        Reads rate tables from local files with one row per date: a date column and one column per currency (like the
+            eurofxref-hist.csv file of the ECB). The files are .csv, .xls or .xlsx; "N/A" and empty cells are missing
+            rates. When several files give a rate for the same date, the last file wins.
+        :param files: paths of the files.
+        :param base: Base currency of the rates.
+        :param date_column: Name of the date column.
+        :return: RateTable
+        """
+        table = cls(base)
+        for file in files:
+            if os.path.splitext(file)[1].lower() in (".xls", ".xlsx"):
+                frame = pd.read_excel(file, na_values=["N/A"])
+            else:
+                frame = pd.read_csv(file, na_values=["N/A"])
+            dates = pd.to_datetime(frame.pop(date_column)).to_numpy()
+            for currency in frame.columns:
+                if str(currency).startswith("Unnamed"):  # the trailing comma of the ECB files.
+                    continue
+                table.add(str(currency).strip(), dates, frame[currency].to_numpy(dtype=float))
+        return table
+
+    def add(self, currency, dates, rates):
+        """
+        Adds rates of a currency, replacing the rates already held for the same dates.
+        :param currency: str currency code.
+        :param dates: array-like of dates.
+        :param rates: array-like of rates (units of currency per unit of base). NaN rates are left out.
+        :return: None
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rates = np.asarray(rates, dtype=float)
+        valid = ~np.isnan(rates)
+        dates, rates = dates[valid], rates[valid]
+        if currency in self.dates:
+            dates = np.concatenate([self.dates[currency], dates])
+            rates = np.concatenate([self.rates[currency], rates])
+        # Sort by date, keeping the last rate given for a date.
+        order = np.argsort(dates, kind="stable")
+        dates, rates = dates[order], rates[order]
+        last = np.r_[dates[1:] != dates[:-1], True]
+        self.dates[currency] = dates[last]
+        self.rates[currency] = rates[last]
+
+    @property
+    def currencies(self):
+        """
+        :return: list of the currencies with rates, base currency included.
+        """
+        return [self.base] + [currency for currency in self.dates if currency != self.base]
+
+    def rate(self, currency, dates):
+        """
+        Vectorized as-of lookup.
+        :param currency: str currency code.
+        :param dates: date or array-like of dates.
+        :return: np.ndarray of float64 rates (a float for a single date); 1.0 for the base currency, NaN where there is
+                 no rate on or before the date.
+        """
+        scalar = np.ndim(dates) == 0
+        dates = np.atleast_1d(np.asarray(dates, dtype="datetime64[D]"))
+        if currency == self.base:
+            rates = np.ones(len(dates))
+        elif currency not in self.dates:
+            rates = np.full(len(dates), np.nan)
+        else:
+            index = np.searchsorted(self.dates[currency], dates, side="right") - 1
+            rates = np.where(index >= 0, self.rates[currency][np.maximum(index, 0)], np.nan)
+        return rates[0] if scalar else rates
+
+    def convert(self, amounts, currencies, dates):
+        """
+        Converts amounts in bulk: one as-of lookup per currency, whatever the number of amounts.
+        :param amounts: array-like of amounts.
+        :param currencies: array-like of the currency of every amount (or one str for all of them).
+        :param dates: array-like of the date of every amount (or one date for all of them).
+        :return: np.ndarray of float64 amounts in the base currency (NaN where there is no rate).
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        dates = np.broadcast_to(np.asarray(dates, dtype="datetime64[D]"), amounts.shape)
+        if isinstance(currencies, str):
+            return amounts / self.rate(currencies, dates)
+        currencies = np.asarray(currencies, dtype=object)
+        rates = np.empty(amounts.shape)
+        for currency in pd.unique(currencies.ravel()):
+            mask = currencies == currency
+            rates[mask] = self.rate(currency, dates[mask])
+        return amounts / rates
+
+    def convert_frame(self, frame, columns, currency="currency", date="date"):
+        """
+        :param frame: pd.DataFrame with a currency and a date column, such as Portfolio.export_logs().
+        :param columns: list of the amount columns to convert.
+        :return: copy of frame with the columns converted to the base currency.
+        """
+        frame = frame.copy()
+        currencies, dates = frame[currency].astype(object).to_numpy(), frame[date].to_numpy()
+        for column in columns:
+            frame[column] = self.convert(frame[column].to_numpy(), currencies, dates)
+        return frame
+
+    def decimal_rate(self, currency, date):
+        """
+        :param currency: str currency code.
+        :param date: date of the rate.
+        :return: Decimal rate as it was published (the rates are read with at most 15 significant digits, which a float
+                 holds exactly), so that Decimal amounts are converted without float rounding.
+        """
+        if currency == self.base:
+            return Decimal(1)
+        rate = self.rate(currency, date)
+        if np.isnan(rate):
+            raise ValueError(f"There is no {currency} rate on or before {pd.Timestamp(date):%Y-%m-%d}.")
+        return Decimal(repr(float(rate)))
+
+    def to_base(self, amount, currency, date):
+        """
+        :param amount: Decimal amount.
+        :param currency: str currency code of the amount.
+        :param date: date of the amount.
+        :return: Decimal amount in the base currency, rounded to the cent.
+        """
+        return (Decimal(amount) / self.decimal_rate(currency, date)).quantize(TWOPLACES)
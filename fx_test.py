@@ -0,0 +1,64 @@
+from fx import RateTable
+from portfolio import Portfolio
+
+from decimal import Decimal
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class TestRateTable(unittest.TestCase):
+    """
+    Load an ECB style rate file (newest date first, N/A cells, trailing comma) and check the as-of lookups and the
+    conversion of the totals of a portfolio holding EUR and USD positions.
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        file = os.path.join(folder.name, "eurofxref-hist.csv")
+        with open(file, "w") as f:
+            f.write("Date,USD,JPY,\n2020-03-04,1.1162,N/A,\n2020-03-03,1.1139,119.94,\n2020-03-02,1.1151,120.03,\n")
+        self.fx = RateTable.load(file)
+
+    def test_as_of(self):
+        dates = np.array(["2020-03-01", "2020-03-02", "2020-03-04", "2020-03-07"], dtype="datetime64[D]")
+        np.testing.assert_array_equal(self.fx.rate("USD", dates), [np.nan, 1.1151, 1.1162, 1.1162])
+        self.assertEqual(self.fx.rate("JPY", datetime.datetime(2020, 3, 4)), 119.94)
+        self.assertEqual(self.fx.rate("EUR", datetime.datetime(2020, 3, 4)), 1.0)
+        np.testing.assert_allclose(
+            self.fx.convert([111.51, 100, 120.03], ["USD", "EUR", "JPY"], dates[1]), [100, 100, 1]
+        )
+        self.assertEqual(self.fx.to_base(Decimal("1116.20"), "USD", datetime.datetime(2020, 3, 5)), Decimal("1000.00"))
+        for date in (datetime.datetime(2020, 2, 28), np.datetime64("2020-02-28"), "2020-02-28"):
+            with self.assertRaisesRegex(ValueError, "no USD rate on or before 2020-02-28"):
+                self.fx.to_base(Decimal("1"), "USD", date)
+
+    def test_portfolio_in_base_currency(self):
+        day = datetime.datetime(2020, 3, 3)
+        portfolio = Portfolio(fx=self.fx, debug=True)
+        for ticker, currency, price in [(1, "EUR", "50"), (2, "USD", "111.39")]:
+            portfolio.transact_position(
+                ticker=ticker, quantity=Decimal("10"), price=Decimal(price), date=day, action="BOT",
+                category="Stock", currency=currency
+            )
+            portfolio.transact_position(
+                ticker=ticker, quantity=Decimal("10"), price=Decimal(price) + 1, date=day, position=True
+            )
+        self.assertEqual(portfolio.currency_totals["USD"][0], Decimal("10.00"))
+        totals = portfolio.base_totals(day)
+        self.assertEqual(totals["unrealized_pnl"], Decimal("10.00") + Decimal("8.98"))
+        self.assertEqual(totals["net_exposure"], Decimal("510.00") + Decimal("1008.98"))
+        portfolio.close_day(day)
+        self.assertEqual(portfolio.history["equity"][0], float(totals["equity"]))
+
+    def test_portfolio_without_rates(self):
+        with self.assertRaisesRegex(ValueError, "RateTable"):
+            Portfolio().base_totals(datetime.datetime(2020, 3, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
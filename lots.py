@@ -0,0 +1,105 @@
+from fixedpoint import PLACES, CENTS, to_fixed, to_decimal, divide, rescale
+from tradelog import TradeLog, LOT_LOG
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+# How a closing fill picks the open lots it relieves.
+METHODS = ("fifo", "lifo", "average")
+
+
+class Lots:
+    """
+    Tax lots of one position: the open lots, and a log of the lots (or parts of lots) closed so far.
+
+    Every fill that adds to the position opens a lot; a fill in the other direction relieves open lots, oldest first
+        ("fifo"), newest first ("lifo"), or out of a single pooled lot at the average cost ("average"), and logs the
+        quantity relieved, both prices and the realized P&L of every lot it matched. A fill larger than the position
+        closes every lot and opens a lot on the other side with the remainder.
+
+    The open lots are [quantity, price, date] entries of a deque, quantities and prices held as scaled integers with
+        PLACES decimal places (see fixedpoint.py). A fill touches the lots at one end of the deque only, and every lot
+        is opened once and closed once, so matching costs amortized O(1) per fill.
+    """
+
+    __slots__ = ("method", "contract_size", "side", "open", "closed")
+
+    def __init__(self, method="fifo", contract_size=1):
+        """
+        :param method: "fifo", "lifo" or "average".
+        :param contract_size: Contract size of the position (Decimal); the P&L of a lot is multiplied by it.
+        """
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {list(METHODS)}, not {method}")
+        self.method = method
+        self.contract_size = to_fixed(contract_size)
+        self.side = 0  # 1 long, -1 short, 0 flat.
+        self.open = collections.deque()
+        self.closed = TradeLog(LOT_LOG)
+
+    def fill(self, quantity, price, date):
+        """
+        :param quantity: Decimal quantity of the fill, positive for a buy and negative for a sale.
+        :param price: Decimal price of the fill.
+        :param date: Date of the fill.
+        :return: None
+        """
+        quantity, price = to_fixed(quantity), to_fixed(price)
+        direction = 1 if quantity > 0 else -1
+        quantity = abs(quantity)
+        if self.side != direction:
+            lifo = self.method == "lifo"
+            side = "long" if self.side == 1 else "short"
+            while quantity and self.open:
+                lot = self.open[-1] if lifo else self.open[0]
+                matched = min(quantity, lot[0])
+                pnl = rescale((price - lot[1]) * self.side * matched * self.contract_size, 3 * PLACES, CENTS)
+                self.closed.append_scaled(
+                    open_date=lot[2], close_date=date, side=side, quantity=matched, open_price=lot[1],
+                    close_price=price, realized_pnl=pnl
+                )
+                quantity -= matched
+                lot[0] -= matched
+                if lot[0] == 0:
+                    if lifo:
+                        self.open.pop()
+                    else:
+                        self.open.popleft()
+            if not self.open:
+                self.side = 0
+        if quantity:
+            self.side = direction
+            if self.method == "average" and self.open:
+                lot = self.open[0]
+                total = lot[0] + quantity
+                lot[1] = divide(lot[0] * lot[1] + quantity * price, 2 * PLACES, total, PLACES, PLACES)
+                lot[0] = total
+            else:
+                self.open.append([quantity, price, date])
+
+    @property
+    def quantity(self):
+        """
+        :return: Decimal quantity held in the open lots, negative for a short position.
+        """
+        return to_decimal(self.side * sum(lot[0] for lot in self.open), PLACES)
+
+    def open_frame(self):
+        """
+        :return: pd.DataFrame of the open lots: open_date, quantity (negative when short), price.
+        """
+        return pd.DataFrame({
+            "open_date": pd.to_datetime([lot[2] for lot in self.open]),
+            "quantity": np.array([lot[0] for lot in self.open], dtype=float) * self.side / 10 ** PLACES,
+            "price": np.array([lot[1] for lot in self.open], dtype=float) / 10 ** PLACES,
+        })
+
+    def closed_frame(self):
+        """
+        :return: pd.DataFrame of the closed lots (see tradelog.LOT_LOG) with their holding period in days.
+        """
+        frame = self.closed.to_frame()
+        frame["holding_days"] = (frame["close_date"] - frame["open_date"]).dt.days
+        return frame
@@ -0,0 +1,89 @@
+from lots import Lots
+from portfolio import Portfolio
+
+from decimal import Decimal
+import datetime
+import unittest
+
+
+class TestLots(unittest.TestCase):
+    """
+    Fill two buys, a partial sale, a sale flipping the position short and a buy closing it, and check the lots
+    relieved by every method.
+    """
+
+    days = [datetime.datetime(2019, 3, day) for day in (11, 12, 13, 14, 15)]
+
+    def fill(self, method):
+        lots = Lots(method)
+        for day, quantity, price in zip(self.days, ["10", "10", "-15", "-10", "5"], ["100", "110", "120", "90", "95"]):
+            lots.fill(Decimal(quantity), Decimal(price), day)
+            if day == self.days[3]:
+                self.assertEqual(lots.quantity, Decimal("-5"))
+        return lots.closed_frame()
+
+    def test_fifo(self):
+        closed = self.fill("fifo")
+        self.assertEqual(closed["quantity"].tolist(), [10, 5, 5, 5])
+        self.assertEqual(closed["open_price"].tolist(), [100, 110, 110, 90])
+        self.assertEqual(closed["realized_pnl"].tolist(), [200, 50, -100, -25])
+        self.assertEqual(closed["side"].tolist(), ["long", "long", "long", "short"])
+        self.assertEqual(closed["holding_days"].tolist(), [2, 1, 2, 1])
+
+    def test_lifo(self):
+        closed = self.fill("lifo")
+        self.assertEqual(closed["open_price"].tolist(), [110, 100, 100, 90])
+        self.assertEqual(closed["realized_pnl"].tolist(), [100, 100, -50, -25])
+
+    def test_average(self):
+        closed = self.fill("average")
+        self.assertEqual(closed["quantity"].tolist(), [15, 5, 5])
+        self.assertEqual(closed["open_price"].tolist(), [105, 105, 90])
+        self.assertEqual(closed["realized_pnl"].tolist(), [225, -75, -25])
+        self.assertEqual(closed["holding_days"].tolist(), [2, 3, 1])
+
+    def test_portfolio(self):
+        days = self.days
+        portfolio = Portfolio(lot_method="fifo", debug=True)
+        portfolio.transact_position(
+            ticker=1, quantity=Decimal("3"), price=Decimal("3312.5"), date=days[0], action="SLD",
+            category="Futures", currency="EUR", contract_size=Decimal("10"), history=True
+        )
+        for quantity, price, day, action in [("2", "3300", days[1], "SLD"), ("4", "3290", days[2], "BOT")]:
+            portfolio.transact_position(
+                ticker=1, quantity=Decimal(quantity), price=Decimal(price), date=day, action=action
+            )
+        self.assertEqual(portfolio.lots[1].quantity, portfolio.positions[1].quantity)
+        portfolio.transact_ticker(1, [
+            {"quantity": Decimal("1"), "price": Decimal("3280"), "date": days[3], "action": "BOT"},
+            {"quantity": Decimal("1"), "price": Decimal("3270"), "date": days[4], "action": "BOT"},
+        ], history=True)
+        # The position went flat at 3280 and a new one was opened with the last buy.
+        self.assertEqual(portfolio.lots[1].quantity, Decimal("1"))
+        self.assertEqual(portfolio.lots[1].open_frame()["price"].tolist(), [3270])
+        report = portfolio.lot_report()
+        self.assertEqual(report["realized_pnl"].tolist(), [675, 100, 200])
+        self.assertEqual(report["ticker"].tolist(), [1] * 3)
+        self.assertEqual(report["realized_pnl"].sum(), float(portfolio.closed_positions[1][0].realized_pnl))
+
+    def test_valuation_is_not_a_fill(self):
+        days = self.days
+        portfolio = Portfolio(lot_method="fifo", debug=True)
+        portfolio.transact_position(
+            ticker=1, quantity=Decimal("10"), price=Decimal("100"), date=days[0], action="BOT",
+            category="Stock", currency="EUR"
+        )
+        # A position file reporting another quantity, at its valuation price.
+        portfolio.transact_position(
+            ticker=1, quantity=Decimal("12"), price=Decimal("105"), date=days[1], position=True
+        )
+        portfolio.transact_ticker(1, [
+            {"quantity": Decimal("15"), "price": Decimal("107"), "date": days[2], "position": True},
+        ])
+        self.assertEqual(portfolio.lots[1].quantity, Decimal("10"))
+        self.assertEqual(portfolio.lots[1].open_frame()["price"].tolist(), [100])
+        self.assertEqual(len(portfolio.lot_report()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+
+def file_hash(file):
+    """
+    :param file: path of a file.
+    :return: str sha1 of the content of the file.
+    """
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class Manifest:
+    """
+    Record of the daily files applied to a portfolio: for every day, the path of the file and the sha1 of its
+        content (or no path if there was no file that day).
+
+    Reader.main uses it to tell whether the file of a day that is already in the portfolio has been restated (changed,
+        added or removed) since it was applied. Hashing a file means reading it, so the size and mtime of the file are
+        recorded too; as long as they did not change, the recorded hash is trusted and the file is not read again.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: path of the manifest (JSON). It does not need to exist yet.
+        """
+        self.file = file
+        try:
+            with open(file) as f:
+                self.days = json.load(f)
+        except FileNotFoundError:
+            self.days = {}  # "YYYY-MM-DD" -> {"path", "sha1", "size", "mtime"}, {"path": None} for a missing file.
+
+    @staticmethod
+    def _key(date):
+        return date.strftime("%Y-%m-%d")
+
+    def _entry(self, file, previous=None):
+        """
+        :return: dict {"path", "sha1", "size", "mtime"} of file; the hash of previous is re-used if the file did not
+                 change size or mtime since.
+        """
+        if file is None:
+            return {"path": None}
+        stat = os.stat(file)
+        entry = {"path": os.path.abspath(file), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        if previous is not None and all(previous.get(k) == entry[k] for k in ("path", "size", "mtime")):
+            entry["sha1"] = previous["sha1"]
+        else:
+            entry["sha1"] = file_hash(file)
+        return entry
+
+    def changed(self, date, file):
+        """
+        :param date: datetime of the day.
+        :param file: path of the file of that day, None if there is none.
+        :return: True if the file of that day is not the one that was applied (or nothing was recorded for the day).
+        """
+        previous = self.days.get(self._key(date))
+        if previous is None:
+            return True
+        if file is None or previous["path"] is None:
+            return file is not None or previous["path"] is not None
+        return self._entry(file, previous)["sha1"] != previous["sha1"]
+
+    def record(self, date, file):
+        """
+        Records that the file (None if there was no file) of that day has been applied.
+        """
+        key = self._key(date)
+        self.days[key] = self._entry(file, self.days.get(key))
+
+    def forget(self, since):
+        """
+        Forgets the days from `since` onwards (they are going to be replayed).
+        """
+        key = self._key(since)
+        self.days = {day: entry for day, entry in self.days.items() if day < key}
+
+    def save(self):
+        temp = f"{self.file}.{os.getpid()}"
+        with open(temp, "w") as f:
+            json.dump(self.days, f, indent=0, sort_keys=True)
+        os.replace(temp, self.file)
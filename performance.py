@@ -7,47 +7,76 @@ Created on Wed Feb 26 14:10:16 2020
 
 """
 
-# functions for iterators for efficient looping
-from itertools import groupby
-
 import numpy as np
 import pandas as pd
 from scipy.stats import linregress
 
 
+def _period_codes(dates, convert_to):
+    """
+    :param dates: np.ndarray of datetime64.
+    :param convert_to: 'weekly', 'monthly', 'quarterly' or 'yearly'.
+    :return: np.ndarray of int64 codes, one per period (weeks start on Monday, the epoch was a Thursday).
+    """
+    if convert_to == 'weekly':
+        return (dates.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    if convert_to == 'monthly':
+        return months
+    elif convert_to == 'quarterly':
+        return months // 3
+    elif convert_to == 'yearly':
+        return months // 12
+    raise ValueError('convert_to must be weekly, monthly, quarterly or yearly')
+
+
 def aggregate_returns(returns,convert_to):
     """
-    Aggregates returns by day, week, month or year.
-    
-    :param returns:
-    :param convert_to:
-    """
-    def cumulate_returns(x):
-        """
-        :return: the cumulative sum of returns
-        """
-        return np.exp(np.log(1+x).cumsum())[-1] - 1
-#    print(returns)
-#    print(type(returns))
-    # .isocalendar() return a 3-tuple with (year, wk num, wk day). 
-    # dt.isocalendar()[0] returns the year,dt.isocalendar()[1] returns 
-    # the week number, dt.isocalendar()[2] returns the week day. 
+    Aggregates returns by week, month, quarter or year.
+
+    Vectorized: every date is mapped to an integer period code with
+    datetime64 arithmetic and the returns of a period are compounded as
+    expm1 of the grouped sum of log1p(returns), so a DataFrame with one
+    column of returns per ticker is aggregated in one call. NaN returns
+    are skipped (a period with no return at all is NaN).
+
+    :param returns: pd.Series or pd.DataFrame of period returns indexed by date.
+    :param convert_to: 'weekly', 'monthly', 'quarterly' or 'yearly'.
+    :return: pd.Series or pd.DataFrame of compounded returns indexed by
+             (ISO year, ISO week), (year, month), (year, quarter) or year.
+    """
+    dates = pd.DatetimeIndex(returns.index).values
+    codes = _period_codes(dates, convert_to)
+    values = returns.to_numpy(dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+
+    order = np.argsort(codes, kind='stable')
+    codes, dates, values = codes[order], dates[order], values[order]
+    first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])[:len(codes)]
+    logs = np.log1p(values)
+    observed = ~np.isnan(logs)
+    sums = np.zeros((len(first), values.shape[1]))
+    if len(first):
+        sums = np.add.reduceat(np.where(observed, logs, 0.0), first, axis=0)
+        sums[~np.logical_or.reduceat(observed, first, axis=0)] = np.nan
+    aggregated = np.expm1(sums)
+
+    starts = pd.DatetimeIndex(dates[first])
     if convert_to == 'weekly':
-        return returns.groupby(
-                [lambda x : x.year,
-                 lambda x : x.month,
-                 lambda x : x.isocalendar()[1]
-                        ]).apply(cumulate_returns)
+        calendar = starts.isocalendar()
+        index = pd.MultiIndex.from_arrays([calendar['year'].to_numpy(), calendar['week'].to_numpy()])
     elif convert_to == 'monthly':
-        return returns.groupby([
-                lambda x: x.year,
-                lambda x: x.month]).apply(cumulate_returns)
-    elif convert_to == 'yearly':
-        return returns.groupby([
-                lambda x: x.year]).apply(cumulate_returns)
+        index = pd.MultiIndex.from_arrays([starts.year, starts.month])
+    elif convert_to == 'quarterly':
+        index = pd.MultiIndex.from_arrays([starts.year, starts.quarter])
     else:
-        ValueError('convert_to must be weekly, monthly or yearly')
-        
+        index = pd.Index(starts.year)
+
+    if isinstance(returns, pd.DataFrame):
+        return pd.DataFrame(aggregated, index=index, columns=returns.columns)
+    return pd.Series(aggregated[:, 0], index=index, name=returns.name)
+
 def create_cagr(equity,periods=252):
     """
     Calculates the compound annual rate(CAGR) for the portfolio, by determing 
@@ -59,7 +88,7 @@ def create_cagr(equity,periods=252):
     :return: 
     """
     years = len(equity) / float(periods)
-    return (equity[-1] ** (1.0 / years)) -1.0
+    return (np.asarray(equity)[-1] ** (1.0 / years)) -1.0
 
 def create_sharpe_ratio(returns, periods =252):
     """
@@ -82,34 +111,132 @@ def create_sharpe_ratio(returns, periods =252):
 #    """
 #    return np.sqrt(periods) * (np.mean(returns)) / np.std(returns[returns < 0])
 
-def create_drawdowns(returns):
+def _drawdown_matrix(values):
+    """
+    Drawdown and underwater run lengths of every column of a 2D array of equity curves.
+
+    The high-water mark is the running maximum of each column (np.fmax.accumulate, so NaN cells are skipped), the
+    drawdown is (hwm - curve) / hwm, and 0 while the high-water mark is not above 0. The length of the underwater run
+    ending at each cell is the cumulative count of underwater cells minus that count at the last cell back at the
+    high-water mark, i.e. a run-length encoding without any loop. NaN cells neither end a run nor add to its length.
+
+    :param values: np.ndarray of shape (dates, tickers), NaN where a ticker has no value.
+    :return: (drawdown, underwater, run_length) np.ndarrays of the same shape.
+    """
+    hwm = np.fmax.accumulate(values, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # No drawdown before the curve has been above 0, as the high-water mark of the loop started at 0.
+        drawdown = np.where(hwm > 0, (hwm - values) / hwm, np.where(np.isnan(values), np.nan, 0.0))
+    underwater = drawdown > 0
+    count = np.cumsum(underwater, axis=0)
+    run_length = count - np.maximum.accumulate(np.where(drawdown == 0, count, 0), axis=0)
+    return drawdown, underwater, run_length
+
+
+def _drawdown_episodes(drawdown, underwater, run_length, top):
+    """
+    Finds every underwater run of every column at once and keeps the `top` deepest runs per column.
+
+    :return: dict of np.ndarrays: column, start (row of the peak), trough, recovery (-1 if not recovered),
+             drawdown (depth at the trough) and duration (rows underwater).
+    """
+    rows, columns = underwater.shape
+    inside = run_length > 0  # underwater, or NaN within a run
+    # A row above water before and after every column, so that runs never span two columns.
+    padded = np.zeros((columns, rows + 2), dtype=np.int8)
+    padded[:, 1:-1] = inside.T
+    edges = np.diff(padded.ravel())
+    starts = np.flatnonzero(edges == 1) + 1  # flat positions in `padded`
+    ends = np.flatnonzero(edges == -1) + 1  # first position above water after the run
+    column = starts // (rows + 2)
+    first, last = starts % (rows + 2) - 1, ends % (rows + 2) - 1  # rows in `underwater`
+
+    # Trough: first row with the deepest drawdown of the run.
+    depth = np.where(underwater, drawdown, 0.0).T.ravel()
+    cells = np.flatnonzero(inside.T.ravel())
+    run = np.repeat(np.arange(len(starts)), last - first)
+    order = np.lexsort((-depth[cells], run))
+    trough = cells[order[np.r_[0, np.flatnonzero(np.diff(run[order])) + 1]]] % rows if len(cells) else cells
+
+    # Peak: last row at the high-water mark before the run (NaN rows in between are skipped).
+    at_peak = np.where(drawdown == 0, np.arange(rows)[:, None], -1)
+    peak = np.maximum.accumulate(at_peak, axis=0)[first - 1, column]
+    recovered = last < rows
+    recovered[recovered] = drawdown[last[recovered], column[recovered]] == 0
+    recovery = np.where(recovered, last, -1)
+
+    episodes = {
+        "column": column, "start": peak, "trough": trough, "recovery": recovery,
+        "drawdown": drawdown[trough, column], "duration": run_length[last - 1, column],
+    }
+    keep = np.lexsort((-episodes["drawdown"], column))
+    keep = keep[_rank(column[keep]) < top]
+    return {name: values[keep] for name, values in episodes.items()}
+
+
+def _rank(groups):
+    """
+    :param groups: sorted np.ndarray of group labels.
+    :return: np.ndarray with the position of every element within its group (0, 1, 2, ...).
+    """
+    positions = np.arange(len(groups))
+    if not len(groups):
+        return positions
+    first = np.r_[0, np.flatnonzero(np.diff(groups)) + 1]
+    return positions - np.repeat(positions[first], np.diff(np.r_[first, len(groups)]))
+
+
+def create_drawdowns(returns, top=None):
     """
     Calculate the maximum peak to through drawdown of the equity curve
-    as well as the duration of the drawdown. Requires that the pnl_returns is 
-    a pandas Series.
-    
-    :param returns:
-    :returns: drawdown, drawdown_max, duration
+    as well as the duration of the drawdown.
+
+    Vectorized: the high-water mark is a running maximum and the durations
+    come from a run-length encoding of the underwater periods, so a
+    DataFrame with one equity curve per column (a date x ticker matrix,
+    NaN where a ticker has no price) is handled in one call.
+
+    :param returns: pd.Series or pd.DataFrame of equity curves (cumulative returns).
+    :param top: If given, the `top` deepest drawdown episodes are returned as well.
+    :returns: drawdown, drawdown_max, duration[, episodes]
+              For a Series: the drawdown Series, the max drawdown (float) and the longest
+              number of consecutive periods spent underwater (int). For a DataFrame: a
+              DataFrame and two Series indexed by column.
+              episodes is a pd.DataFrame with the start (peak), trough and recovery labels of
+              the index (NaN/NaT while not recovered), the depth and the duration of every
+              episode, deepest first, indexed by rank (and by column for a DataFrame).
     """
-    # Calculate the cumulative returns curve
-    # and set uo the High Water Mark
-    idx = returns.index
-    hwm = np.zeros(len(idx))
-    
-    #create the high water mark
-    for t in range(1,len(idx)):
-        hwm[t] = max(hwm[t-1],returns.ix[t])
-        
-    #Calculate the drawdown and duration statistics
-    perf = pd.DataFrame(index=idx)
-    perf['Drawdown'] = (hwm - returns) / hwm
-    perf['Drawdown'].ix[0] = 0.0
-    perf["DurationCheck"] = np.where(perf["Drawdown"] == 0, 0, 1)
-    duration = max(
-        sum(1 for i in g if i == 1)
-        for k, g in groupby(perf["DurationCheck"])
-    )
-    return perf["Drawdown"], np.max(perf["Drawdown"]), duration
+    frame = returns.to_frame() if isinstance(returns, pd.Series) else returns
+    values = frame.to_numpy(dtype=float)
+    drawdown, underwater, run_length = _drawdown_matrix(values)
+    drawdown = pd.DataFrame(drawdown, index=frame.index, columns=frame.columns)
+    drawdown_max = drawdown.max()
+    duration = pd.Series(run_length.max(axis=0, initial=0), index=frame.columns)
+
+    if isinstance(returns, pd.Series):
+        results = [drawdown.iloc[:, 0].rename("Drawdown"), drawdown_max.iloc[0], int(duration.iloc[0])]
+    else:
+        results = [drawdown, drawdown_max, duration]
+
+    if top is not None:
+        found = _drawdown_episodes(drawdown.to_numpy(), underwater, run_length, top)
+        labels = frame.index.to_series(index=range(len(frame.index)))
+        episodes = pd.DataFrame({
+            "start": labels.iloc[found["start"]].to_numpy(),
+            "trough": labels.iloc[found["trough"]].to_numpy(),
+            "recovery": labels.reindex(found["recovery"]).to_numpy(),
+            "drawdown": found["drawdown"],
+            "duration": found["duration"],
+        })
+        rank = _rank(found["column"])
+        if isinstance(returns, pd.Series):
+            episodes.index = pd.Index(rank, name="rank")
+        else:
+            episodes.index = pd.MultiIndex.from_arrays(
+                [frame.columns[found["column"]], rank], names=[frame.columns.name, "rank"]
+            )
+        results.append(episodes)
+    return tuple(results)
 
 def rsuqare(x,y):
     """ 
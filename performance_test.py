@@ -0,0 +1,88 @@
+import performance as perf
+
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class TestCreateDrawdowns(unittest.TestCase):
+    """
+    Check the drawdowns of a small equity curve against values worked out by hand, and that a
+    date x ticker matrix gives the same results as the curves one by one.
+    """
+
+    def setUp(self):
+        self.index = pd.date_range("2020-01-01", periods=9)
+        self.curve = pd.Series([1.0, 1.2, 0.9, 1.0, 1.3, 1.3, 1.17, 1.04, 1.1], index=self.index)
+
+    def test_series(self):
+        drawdown, drawdown_max, duration, episodes = perf.create_drawdowns(self.curve, top=5)
+        np.testing.assert_allclose(drawdown, [0, 0, 0.25, 1 / 6, 0, 0, 0.1, 0.2, 1 - 1.1 / 1.3])
+        self.assertAlmostEqual(drawdown_max, 0.25)
+        self.assertEqual(duration, 3)
+        self.assertEqual(list(episodes["start"]), [self.index[1], self.index[5]])
+        self.assertEqual(list(episodes["trough"]), [self.index[2], self.index[7]])
+        self.assertEqual(episodes["recovery"].iloc[0], self.index[4])
+        self.assertTrue(pd.isna(episodes["recovery"].iloc[1]))
+        self.assertEqual(list(episodes["duration"]), [2, 3])
+
+    def test_matrix(self):
+        other = self.curve[::-1].set_axis(self.index)
+        other.iloc[:2] = np.nan  # not traded yet
+        other.iloc[5] = np.nan  # no price that day
+        matrix = pd.DataFrame({"A": self.curve, "B": other})
+        drawdown, drawdown_max, duration, episodes = perf.create_drawdowns(matrix, top=1)
+        for ticker in matrix:
+            expected = perf.create_drawdowns(matrix[ticker].dropna(), top=1)
+            np.testing.assert_allclose(drawdown[ticker].dropna(), expected[0])
+            self.assertEqual(drawdown_max[ticker], expected[1])
+            self.assertEqual(duration[ticker], expected[2])
+            pd.testing.assert_frame_equal(episodes.loc[ticker], expected[3])
+
+    def test_curve_not_above_zero(self):
+        # The high-water mark is 0 or negative until the third row: there is no drawdown to divide by it.
+        curve = pd.Series([0.0, -0.5, 1.0, 0.5, 1.0, np.nan, 0.8], index=pd.date_range("2020-01-01", periods=7))
+        with np.errstate(all="raise"):
+            drawdown, drawdown_max, duration = perf.create_drawdowns(curve)
+        np.testing.assert_allclose(drawdown, [0, 0, 0, 0.5, 0, np.nan, 0.2])
+        self.assertEqual((drawdown_max, duration), (0.5, 1))
+        matrix = perf.create_drawdowns(pd.DataFrame({"A": curve, "B": -curve.abs()}), top=1)
+        self.assertFalse(np.isinf(matrix[0].to_numpy()).any())
+        self.assertEqual(list(matrix[1]), [0.5, 0])
+        self.assertEqual(list(matrix[3].index.get_level_values(0)), ["A"])
+
+
+class TestAggregateReturns(unittest.TestCase):
+    """
+    Compound daily returns into months, quarters, years and ISO weeks, for a Series and for a matrix.
+    """
+
+    def setUp(self):
+        index = pd.to_datetime(["2019-12-30", "2019-12-31", "2020-01-02", "2020-01-03", "2020-02-03", "2020-04-01"])
+        self.returns = pd.Series([0.1, -0.1, 0.02, 0.03, -0.05, 0.01], index=index)
+
+    def test_series(self):
+        monthly = perf.aggregate_returns(self.returns, "monthly")
+        self.assertEqual(list(monthly.index), [(2019, 12), (2020, 1), (2020, 2), (2020, 4)])
+        np.testing.assert_allclose(monthly, [1.1 * 0.9 - 1, 1.02 * 1.03 - 1, -0.05, 0.01])
+        quarterly = perf.aggregate_returns(self.returns, "quarterly")
+        np.testing.assert_allclose(quarterly, [-0.01, 1.02 * 1.03 * 0.95 - 1, 0.01])
+        yearly = perf.aggregate_returns(self.returns, "yearly")
+        self.assertEqual(list(yearly.index), [2019, 2020])
+        weekly = perf.aggregate_returns(self.returns, "weekly")
+        self.assertEqual(list(weekly.index), [(2020, 1), (2020, 6), (2020, 14)])  # 2019-12-30 is in ISO week 2020-1
+        self.assertAlmostEqual(weekly.iloc[0], 1.1 * 0.9 * 1.02 * 1.03 - 1)
+        with self.assertRaises(ValueError):
+            perf.aggregate_returns(self.returns, "daily")
+
+    def test_matrix(self):
+        matrix = pd.DataFrame({"A": self.returns, "B": self.returns * 2})
+        matrix.iloc[:2, 1] = np.nan
+        monthly = perf.aggregate_returns(matrix, "monthly")
+        pd.testing.assert_series_equal(monthly["A"], perf.aggregate_returns(self.returns, "monthly"), check_names=False)
+        self.assertTrue(np.isnan(monthly.loc[(2019, 12), "B"]))
+        self.assertAlmostEqual(monthly.loc[(2020, 1), "B"], 1.04 * 1.06 - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
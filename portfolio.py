@@ -1,10 +1,20 @@
-from position import Position, Stock, Fund, ETF, Cash, Future, Option
+from position import Position, Stock, Fund, ETF, Cash, Future, Option, TWOPLACES
+from SecurityID import SecurityMaster
+from lots import Lots
+from chains import ContractChains
+from tradelog import TradeLog, PORTFOLIO_LOG, CASH_BALANCES
 from decimal import Decimal
 import collections
 
+import numpy as np
+import pandas as pd
+
+# Portfolio totals, in the order of Portfolio._contribution (the gross exposure comes from the exposure).
+TOTALS = ("unrealized_pnl", "realized_pnl", "equity", "net_exposure", "gross_exposure")
+
 
 class Portfolio:
-    def __init__(self):
+    def __init__(self, debug=False, fx=None, lot_method=None):
         """
         On creation, the Portfolio object contains no positions and all values are "reset" to the initial
         cash, with no PnL - realised or unrealised.
@@ -14,23 +24,56 @@ class Portfolio:
             we buy and sell securities automatically. This is more flexible but adds to complexity to the design.
             Initially, we will just read off the cash values from daily trade files and work our way to modelling the
             portfolio cash positions through trade data.
+        2) The totals (equity, unrealized_pnl, realized_pnl) are maintained incrementally: every time a position
+            changes, only the difference between its old and new contribution is added to the totals. This keeps the
+            cost of a trade independent of the number of positions held.
+        3) At the end of every day (see close_day), the totals and the cash balances are appended to self.history and
+            self.cash_history, the daily time series of the portfolio. Reporting on the portfolio as a whole reads
+            them (history_frame, export_history) instead of going through the log of every position.
+        4) The totals add up amounts in the currency of every position. They are also kept per currency
+            (self.currency_totals), so that with an FX rate table they are converted to its base currency with one rate
+            per currency (see base_totals), whatever the number of positions.
+        5) A position is archived as soon as it is closed (its quantity is back to 0): it leaves self.positions and its
+            final state and log are kept in self.closed_positions[ticker] (see _archive), so the live positions are
+            the open ones only. Trading the ticker again opens a new position (a new lot).
+        6) With a lot_method, every trade changing the quantity of a position is also recorded as a fill in its tax
+            lots (self.lots[ticker], see lots.py), which give the realized P&L and holding period of every lot (see
+            lot_report). The updates of position=True are valuations, not trades, and do not touch the lots even when
+            they change the quantity. The positions keep their own average cost accounting either way.
+        7) Futures are also linked by underlying (self.chains, see chains.py), so that rolling a contract into the next
+            expiry continues the exposure and P&L series of its underlying instead of closing one position and opening
+            an unrelated one. The series are appended to by close_day (see chain_frame).
 
-
+        :param debug: Flag (True/False). If True, the incrementally maintained totals are compared to a full
+                    recompute (self._update_portfolio) after every position change. Slow, only meant for testing.
+        :param fx: Optional fx.RateTable. If given, the daily time series (see close_day) is recorded in its base
+                    currency.
+        :param lot_method: Optional "fifo", "lifo" or "average". If given, the tax lots of every position are tracked
+                    with that relief method.
         """
         # self.price_handler = price_handler
         # self.init_cash = cash
         # self.cur_cash = cash
         self.positions = collections.defaultdict(list)
-        self.closed_positions = collections.defaultdict(list)
-        self.ids = collections.defaultdict(list)
+        self.closed_positions = collections.defaultdict(list)  # ticker -> list of position.ClosedPosition
+        self.closed_totals = {}  # currency -> list of the TOTALS of the closed positions in that currency.
+        self.fx = fx
+        self.lot_method = lot_method
+        self.lots = {}  # ticker -> lots.Lots of the open positions, if lot_method is set.
+        self.cash = {}  # currency -> Cash position (also in self.positions)
+        self.history = TradeLog(PORTFOLIO_LOG)
+        self.cash_history = TradeLog(CASH_BALANCES)
+        self.ids = SecurityMaster()
+        self.chains = ContractChains(self.ids)
         self._reset_values()
-        self.wkn = {}
+        self.wkn = self.ids.wkn
+        self.debug = debug
 
     def _reset_values(self):
         """
 
-        This is called after every position addition or modification. It allows the  calculations to be carried  out
-        "from scratch" in order to minimize errors.
+        This is called before the totals are recomputed by self._update_portfolio. It allows the  calculations to be
+        carried  out "from scratch" in order to minimize errors.
 
         All cash is reset to the inital_values and  the  PnL is set to be zero.
         :return:
@@ -39,34 +82,114 @@ class Portfolio:
         self.equity = Decimal("0.00")
         self.unrealized_pnl = Decimal("0.00")
         self.realized_pnl = Decimal("0.00")
+        self.net_exposure = Decimal("0.00")
+        self.gross_exposure = Decimal("0.00")
+        self.currency_totals = {}  # currency -> list of the TOTALS of the positions in that currency.
 
     def _update_portfolio(self):
         """
         Updates the Portfolio total values (cash, equity, unrealized_pnl, realized_pnl, cost_basis etc.) based on all
             of the current ticker values.
 
-            Next: I need to remove Positions from the Portfolio once their quantity reaches 0. Otherwise
-
-        This method is called after every Position modification.
+        This method recomputes the totals from scratch and costs O(number of open positions): the closed positions
+            only add their totals, which were set aside when they were archived. Single position changes go through
+            self._apply_change instead; this is used to rebuild the totals and by the debug check.
         :return:
         """
-        for ticker in self.positions:
-            pt = self.positions[ticker]
-            if pt.category == "Cash":   # Cash does not have realized/unrealized pnl.
+        self._reset_values()
+        for currency, closed in self.closed_totals.items():
+            self.currency_totals[currency] = list(closed)
+        for pt in self.positions.values():
+            if pt.category == "Cash":
                 continue
-            self.unrealized_pnl += pt.unrealized_pnl
-            self.realized_pnl += pt.realized_pnl
-            # self.cur_cash -= pt.cost_basis
-            pnl_diff = pt.realized_pnl - pt.unrealized_pnl
-            # self.cur_cash += pnl_diff
-            self.equity += (
-                pt.market_value - pt.cost_basis + pnl_diff
-            )
+            unrealized_pnl, realized_pnl, equity, exposure = self._contribution(pt)
+            totals = self.currency_totals.get(pt.currency)
+            if totals is None:
+                totals = self.currency_totals[pt.currency] = [Decimal("0.00")] * len(TOTALS)
+            totals[0] += unrealized_pnl
+            totals[1] += realized_pnl
+            totals[2] += equity
+            totals[3] += exposure
+            totals[4] += abs(exposure)
+        for totals in self.currency_totals.values():
+            for name, value in zip(TOTALS, totals):
+                setattr(self, name, getattr(self, name) + value)
+
+    @staticmethod
+    def _contribution(pt):
+        """
+        The amounts a single position adds to the Portfolio totals.
+        The exposure is the signed notional of the position to the cent: the exposure of a Future, the market value of
+            the other positions. It adds up to the net exposure, and its absolute value to the gross exposure.
+        :param pt: Position (or Cash) object. None stands for a position that does not exist (yet).
+        :return: tuple(unrealized_pnl, realized_pnl, equity, exposure)
+        """
+        if pt is None or pt.category == "Cash":   # Cash does not have realized/unrealized pnl.
+            return Decimal("0.00"), Decimal("0.00"), Decimal("0.00"), Decimal("0.00")
+        # self.cur_cash -= pt.cost_basis
+        pnl_diff = pt.realized_pnl - pt.unrealized_pnl
+        # self.cur_cash += pnl_diff
+        exposure = pt.exposure if pt.category == "Futures" else pt.market_value
+        return (
+            pt.unrealized_pnl, pt.realized_pnl, pt.market_value - pt.cost_basis + pnl_diff, exposure.quantize(TWOPLACES)
+        )
+
+    def _apply_change(self, before, after, currency):
+        """
+        Updates the Portfolio totals, and the totals of its currency, with the change of a single position.
+        :param before: self._contribution of the position before it was modified.
+        :param after: self._contribution of the position after it was modified.
+        :param currency: currency of the position.
+        :return: None
+        """
+        totals = self.currency_totals.get(currency)
+        if totals is None:
+            totals = self.currency_totals[currency] = [Decimal("0.00")] * len(TOTALS)
+        change = after[0] - before[0]
+        self.unrealized_pnl += change
+        totals[0] += change
+        change = after[1] - before[1]
+        self.realized_pnl += change
+        totals[1] += change
+        change = after[2] - before[2]
+        self.equity += change
+        totals[2] += change
+        if after[3] != before[3]:
+            change = after[3] - before[3]
+            self.net_exposure += change
+            totals[3] += change
+            change = abs(after[3]) - abs(before[3])
+            self.gross_exposure += change
+            totals[4] += change
+        if self.debug:
+            self._check_totals()
+
+    def _check_totals(self):
+        """
+        Debug check: compares the incrementally maintained totals to a full recompute. Both sides are compared to the
+            cent since the order in which the amounts are added differs.
+        :return: None
+        """
+        totals = {None: [getattr(self, name) for name in TOTALS]}
+        totals.update(self.currency_totals)
+        self._update_portfolio()
+        recomputed = {None: [getattr(self, name) for name in TOTALS]}
+        recomputed.update(self.currency_totals)
+        for name, value in zip(TOTALS, totals[None]):
+            setattr(self, name, value)
+        self.currency_totals = {currency: values for currency, values in totals.items() if currency is not None}
+        zero = [Decimal("0.00")] * len(TOTALS)
+        for currency in recomputed.keys() | totals.keys():
+            for name, incremental, full in zip(TOTALS, totals.get(currency, zero), recomputed.get(currency, zero)):
+                if incremental.quantize(TWOPLACES) != full.quantize(TWOPLACES):
+                    label = name if currency is None else f"{name} in {currency}"
+                    raise AssertionError(
+                        f"Portfolio {label} is {incremental} but the positions add up to {full}."
+                    )
 
     def _add_position(
             self, action, ticker, quantity, price, category, currency, date, contract_size=1, strike=None, history=None
     ):
-        self._reset_values()
         if ticker not in self.positions:
             if category in ["Stock", "Certificate"]:
                 position = Stock(
@@ -91,10 +214,11 @@ class Portfolio:
                 )
             elif category == "Index Put Option":
                 if not history:
-                    strike = self.ids[ticker]["G_ID_VALUE"][self.ids[ticker]["C_ID_TYPE"].index(6)].split(" ")[-2][1:]
+                    strike = self.ids.strike(ticker)  # parsed from the Bloomberg ticker, see SecurityMaster.
                 else:
                     strike = strike
-                position = Option(action, ticker, quantity, price, category, currency, date, contract_size,
+                position = Option(
+                                  action, ticker, quantity, price, category, currency, date, contract_size,
                                   strike_price=strike
    # Uncomment this when extracting data from daily files (as opposed to history_movements())
                 # strike_price=self.ids[ticker]["G_ID_VALUE"][self.ids[ticker]["C_ID_TYPE"].index(6)].split(" ")[-2][1:]
@@ -104,7 +228,12 @@ class Portfolio:
                     action, ticker, quantity, price, category, currency, date
                 )
             self.positions[ticker] = position
-            self._update_portfolio()
+            self._apply_change(self._contribution(None), self._contribution(position), currency)
+            if category == "Futures":
+                self.chains.open(ticker, position)
+            if self.lot_method is not None:
+                self.lots[ticker] = Lots(self.lot_method, position.contract_size)
+                self.lots[ticker].fill(position.quantity, position.avg_price, date)
         else:
             print(
                 """Ticker f{ticker} is already in the positions list. 
@@ -128,25 +257,16 @@ class Portfolio:
                 If true, divide price by contract_size.
         :return:
         """
-        self._reset_values()
         if ticker in self.positions:
-            if history:  # We already do this for _calculate_initial_value, need to do for updating transactions too.
-                if self.positions[ticker].category=="Index Put Option":
-                    price = price/self.positions[ticker].contract_size
-            if position:  # Method called from read_positions()
-                # No new trades were made. Check if this "if" is necessary
-                if quantity == self.positions[ticker].quantity:
-                    quantity = Decimal(0.00)
-                    action = self.positions[ticker].action  # So that we don't end up dividing up 0 in avg_sld/bot
-            else:  # Method called from read_movements()
-                quantity = Decimal(quantity)
-            self.positions[ticker].transact_shares(
-                action=action,
-                quantity=quantity,
-                price=Decimal(price),
-                date=date
-            )
-            self._update_portfolio()
+            pt = self.positions[ticker]
+            before = self._contribution(pt)
+            held = pt.quantity
+            price = self._transact_shares(pt, quantity, price, date, position, action, history)
+            if self.lot_method is not None and not position and pt.quantity != held:
+                self.lots[ticker].fill(pt.quantity - held, price, date)
+            self._apply_change(before, self._contribution(pt), pt.currency)
+            if pt.quantity == 0:
+                self._archive(ticker, date)
         else:
             print(
                 """
@@ -155,6 +275,84 @@ class Portfolio:
                 """
             )
 
+    def _archive(self, ticker, date):
+        """
+        Moves a closed position out of self.positions into self.closed_positions[ticker], as a ClosedPosition record.
+            What it added to the totals (its realized P&L) stays in them, and is set aside in self.closed_totals for
+            the recomputes of _update_portfolio.
+        :param ticker: ticker of a position whose quantity is 0.
+        :param date: Date on which it was closed.
+        :return: None
+        """
+        pt = self.positions.pop(ticker)
+        totals = self.closed_totals.get(pt.currency)
+        if totals is None:
+            totals = self.closed_totals[pt.currency] = [Decimal("0.00")] * len(TOTALS)
+        unrealized_pnl, realized_pnl, equity, exposure = self._contribution(pt)
+        for i, value in enumerate([unrealized_pnl, realized_pnl, equity, exposure, abs(exposure)]):
+            totals[i] += value
+        self.closed_positions[ticker].append(pt.closed(date, self.lots.pop(ticker, None)))
+        if pt.category == "Futures":
+            self.chains.close(ticker, pt)
+
+    @staticmethod
+    def _transact_shares(pt, quantity, price, date, position, action, history):
+        """
+        Passes a trade on to an existing position without touching the Portfolio totals. See _modify_position for
+            the parameters.
+        :return: Decimal price per unit of the trade.
+        """
+        if history:  # We already do this for _calculate_initial_value, need to do for updating transactions too.
+            if pt.category=="Index Put Option":
+                price = price/pt.contract_size
+        if position:  # Method called from read_positions()
+            # No new trades were made. Check if this "if" is necessary
+            if quantity == pt.quantity:
+                quantity = Decimal(0.00)
+                action = pt.action  # So that we don't end up dividing up 0 in avg_sld/bot
+        else:  # Method called from read_movements()
+            quantity = Decimal(quantity)
+        price = Decimal(price)
+        pt.transact_shares(
+            action=action,
+            quantity=quantity,
+            price=price,
+            date=date
+        )
+        return price
+
+    def transact_ticker(self, ticker, trades, history=None):
+        """
+        Applies a series of trades on a single ticker, in order. The result is the same as calling transact_position
+            for every trade, but the Portfolio totals are only updated once, after the last trade.
+        :param ticker: C_IN_ID of the security.
+        :param trades: iterable of dicts holding the other keyword arguments of transact_position (quantity, price,
+                    date, action, and for the trade opening the position: category, currency, contract_size, strike).
+        :param history: Flag (True/False). See transact_position.
+        :return: None
+        """
+        pt = self.positions[ticker] if ticker in self.positions else None
+        before = None if pt is None else self._contribution(pt)
+        for trade in trades:
+            if pt is None:  # The first trade, or the first after the position was closed, opens a new position.
+                self.transact_position(ticker=ticker, history=history, **trade)
+                pt = self.positions[ticker]
+                before = self._contribution(pt)
+                continue
+            held = pt.quantity
+            price = self._transact_shares(
+                pt, trade["quantity"], trade["price"], trade["date"], trade.get("position"), trade.get("action"),
+                history
+            )
+            if self.lot_method is not None and not trade.get("position") and pt.quantity != held:
+                self.lots[ticker].fill(pt.quantity - held, price, trade["date"])
+            if pt.quantity == 0:
+                self._apply_change(before, self._contribution(pt), pt.currency)
+                self._archive(ticker, trade["date"])
+                pt = None
+        if pt is not None:
+            self._apply_change(before, self._contribution(pt), pt.currency)
+
     def transact_position(
             self, ticker, quantity, price, date, action=None, category=None, currency=None, position=None,
             contract_size=1, strike=None, history=None
@@ -167,6 +365,8 @@ class Portfolio:
         :param date: Date of the transaction.
         :param action: "BOT" for Long transactions and "SLD" for Short transactions.
         :param category: Asset class category of the underlying being transacted.
+                    For a ticker that was closed, None re-opens it with the category, currency and contract_size of
+                    its last lot.
         :param currency: Currency of the transaction.
         :param position: Flag (True/False). If True, we will just modify current market value and set quantity=0
         :param contract_size: Only used for Futures and Options. Defines the multiple of units the contract is trade in.
@@ -177,6 +377,9 @@ class Portfolio:
         :return:
         """
         if ticker not in self.positions:
+            if category is None and ticker in self.closed_positions:  # A new lot of a closed position.
+                lot = self.closed_positions[ticker][-1]
+                category, currency, contract_size = lot.category, lot.currency, lot.contract_size
             self._add_position(action=action,
                                ticker=ticker,
                                quantity=quantity,
@@ -197,6 +400,26 @@ class Portfolio:
                                   action=action,
                                   history=history)
 
+    def mark_to_market(self, prices, date):
+        """
+        Marks many positions to market at once, for example every holding of a daily file. This is the same as calling
+            transact_position(ticker, quantity=<quantity held>, price, date, position=True) for every ticker: the
+            market value, unrealized P&L (and exposure of Futures) of every position are updated at its new price and
+            a "Market_Update" row (or "Close" for a flat position) is logged. The Portfolio totals are recomputed once,
+            after the last position, instead of after every position.
+        :param prices: dict {ticker: price (Decimal)} of positions (not Cash) held by the Portfolio. A KeyError is
+                    raised, before any position is marked, if one of them is not held.
+        :param date: Date of the prices.
+        :return: None
+        """
+        missing = [ticker for ticker in prices if ticker not in self.positions]
+        if missing:
+            raise KeyError(f"Cannot mark positions that are not held: {missing}")
+        for ticker, price in prices.items():
+            pt = self.positions[ticker]
+            self._transact_shares(pt, pt.quantity, price, date, True, None, None)
+        self._update_portfolio()
+
     def transact_cash(
             self, currency, market_value, cost_basis, date
     ):
@@ -212,22 +435,134 @@ class Portfolio:
         if currency not in self.positions:
             position = Cash(currency, market_value, cost_basis, date)
             self.positions[currency] = position
+            self.cash[currency] = position
         else:
             self.positions[currency].update_cash_position(market_value, cost_basis, date)
         # self._update_portfolio() # For now, not calling this function after updating Cash positions because
         # Cash positions do not have unrealized/realized profits.
 
-    def export_logs(self):
+    def base_totals(self, date, fx=None):
+        """
+        Converts the totals to the base currency of an FX rate table, one currency at a time (see
+            self.currency_totals): the cost does not depend on the number of positions.
+        :param date: date of the rates.
+        :param fx: fx.RateTable. Defaults to self.fx.
+        :return: dict {total: Decimal} of the TOTALS in fx.base.
         """
+        fx = self.fx if fx is None else fx
+        if fx is None:
+            raise ValueError("base_totals needs an fx.RateTable: pass fx, or create the Portfolio with one.")
+        base = dict.fromkeys(TOTALS, Decimal("0.00"))
+        for currency, totals in self.currency_totals.items():
+            rate = fx.decimal_rate(currency, date)
+            for name, value in zip(TOTALS, totals):
+                base[name] += (value / rate).quantize(TWOPLACES)
+        return base
 
-        Combines the self.log from every Position in the Portfolio and exports the resulting data as a csv file.
-        :return: pd.DataFrame(int, [date, quantity, price, market_value, unit_cost_basis, cost_basis, unrealized_pnl,
-                                                    realized_pnl]
+    def close_day(self, date):
         """
-        import pandas as pd
-        current_positions = [lambda x: pd.DataFrame(x.log) for x in self.positions]
-        closed_positions = [lambda y: pd.DataFrame(y.log) for y in self.closed_positions]
+        Appends the totals of the portfolio and the balance of every cash account at the end of `date` to self.history
+            and self.cash_history, and the state of every futures chain to self.chains.log. Called for every
+            DayFinished event (see events.apply_event). With self.fx, the totals are recorded in its base currency (see
+            base_totals); the cash balances stay in their own currency and the chains in the currency of their
+            contracts.
 
+        The time series are append-only: a date that is not after the last recorded one (a day replayed twice) is
+            ignored.
+        :param date: datetime of the day.
+        :return: None
+        """
+        if date is None:
+            return
+        dates = self.history.raw("date")
+        if len(dates) and np.datetime64(date, "ns") <= dates[-1]:
+            return
+        if self.fx is None:
+            totals = {name: getattr(self, name) for name in TOTALS}
+        else:
+            totals = self.base_totals(date)
+        self.history.append(date=date, **totals)
+        for currency, cash in self.cash.items():
+            self.cash_history.append(
+                date=date, currency=currency, market_value=cash.market_value, cost_basis=cash.cost_basis
+            )
+        self.chains.close_day(date)
 
+    def history_frame(self):
+        """
+        :return: pd.DataFrame indexed by date: equity, unrealized_pnl, realized_pnl, net_exposure, gross_exposure and
+                 one "cash <currency>" column per cash account (NaN before the account was opened).
+        """
+        frame = self.history.to_frame().set_index("date")
+        cash = self.cash_history.to_frame()
+        if len(cash):
+            cash = cash.pivot(index="date", columns="currency", values="market_value")
+            cash.columns = [f"cash {currency}" for currency in cash.columns]
+            frame = frame.join(cash)
+        return frame
 
+    def export_history(self, file):
+        """
+        Writes history_frame() to file: Parquet if file ends with .parquet (needs pyarrow or fastparquet), CSV
+            otherwise.
+        :param file: path of the file.
+        :return: pd.DataFrame written.
+        """
+        frame = self.history_frame()
+        if str(file).endswith(".parquet"):
+            frame.to_parquet(file)
+        else:
+            frame.to_csv(file)
+        return frame
 
+    def chain_frame(self):
+        """
+        :return: pd.DataFrame of the daily exposure and P&L of the futures chain of every underlying, continuous across
+                 the rolls, with back-adjusted prices (see chains.ContractChains.frame). The amounts are in the
+                 currency of the chain.
+        """
+        return self.chains.frame()
+
+    def lot_report(self):
+        """
+        The lots closed so far, of the open and of the closed positions. Needs a lot_method.
+        :return: pd.DataFrame [ticker, currency, open_date, close_date, side, quantity, open_price, close_price,
+                               realized_pnl, holding_days]
+        """
+        frames = [lots.closed_frame().assign(ticker=ticker, currency=self.positions[ticker].currency)
+                  for ticker, lots in self.lots.items()]
+        frames += [
+            lot.lots.closed_frame().assign(ticker=ticker, currency=lot.currency)
+            for ticker, closed in self.closed_positions.items() for lot in closed if lot.lots is not None
+        ]
+        if not frames:
+            return pd.DataFrame()
+        report = pd.concat(frames, ignore_index=True)
+        columns = ["ticker", "currency"]
+        return report[columns + [column for column in report.columns if column not in columns]]
+
+    def export_logs(self, file=None):
+        """
+        Combines the log of every Position in the Portfolio, open or closed, and optionally exports the resulting data
+            as a csv file.
+        :param file: Optional path of the csv file.
+        :return: pd.DataFrame(int, [ticker, currency, date, quantity, price, market_value, unit_cost, cost_basis,
+                                                    unrealized_pnl, realized_pnl, event])
+                 The amounts are in the currency of the position; fx.RateTable.convert_frame converts them in bulk.
+        """
+        frames = [
+            pt.log.to_frame().assign(ticker=ticker, currency=pt.currency)
+            for ticker, pt in self.positions.items() if pt.category != "Cash"
+        ]
+        frames += [
+            pt.log.to_frame().assign(ticker=ticker, currency=pt.currency)
+            for ticker, closed in self.closed_positions.items() for pt in closed
+        ]
+        if not frames:
+            return pd.DataFrame()
+        logs = pd.concat(frames, ignore_index=True)
+        columns = ["ticker", "currency"]
+        logs = logs[columns + [column for column in logs.columns if column not in columns]]
+        if file is not None:
+            logs.to_csv(file, index=False)
+        return logs
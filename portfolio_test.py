@@ -0,0 +1,209 @@
+from portfolio import Portfolio
+
+from decimal import Decimal
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+def holdings(date, debug=False):
+    """
+    :return: Portfolio holding a stock, a short future and an option, all in EUR, bought on date.
+    """
+    portfolio = Portfolio(debug=debug)
+    for ticker, action, quantity, price, category, size in [
+        (1, "BOT", "100", "74.78", "Stock", "1"), (2, "SLD", "3", "3312.5", "Futures", "10"),
+        (3, "BOT", "5", "1250", "Index Put Option", "10"),
+    ]:
+        portfolio.transact_position(
+            ticker=ticker, quantity=Decimal(quantity), price=Decimal(price), date=date, action=action,
+            category=category, currency="EUR", contract_size=Decimal(size), strike=Decimal(3000), history=True
+        )
+    return portfolio
+
+
+class TestIncrementalTotals(unittest.TestCase):
+    """
+    Trade a stock, a fund and a future and check that the totals kept up to date trade by trade agree with
+    a full recompute over all the positions.
+    """
+
+    def setUp(self):
+        self.portfolio = Portfolio(debug=True)
+        self.date = datetime.datetime(2019, 3, 12)
+
+    def test_totals_match_full_recompute(self):
+        self.portfolio.transact_position(
+            ticker=1, quantity=Decimal("100"), price=Decimal("74.78"), date=self.date,
+            action="BOT", category="Stock", currency="USD"
+        )
+        self.portfolio.transact_position(
+            ticker=2, quantity=Decimal("50"), price=Decimal("20.50"), date=self.date,
+            action="BOT", category="Fund", currency="EUR"
+        )
+        self.portfolio.transact_position(
+            ticker=3, quantity=Decimal("2"), price=Decimal("3300"), date=self.date, action="SLD",
+            category="Futures", currency="EUR", contract_size=Decimal("10"), history=True
+        )
+        self.portfolio.transact_position(
+            ticker=1, quantity=Decimal("40"), price=Decimal("75.26"), date=self.date, action="SLD"
+        )
+        self.portfolio.transact_position(
+            ticker=3, quantity=Decimal("2"), price=Decimal("3250"), date=self.date, position=True
+        )
+        self.portfolio.transact_cash("EUR", 1000, 1000, self.date)
+
+        totals = (self.portfolio.unrealized_pnl, self.portfolio.realized_pnl, self.portfolio.equity)
+        self.portfolio._update_portfolio()
+        self.assertEqual(
+            totals, (self.portfolio.unrealized_pnl, self.portfolio.realized_pnl, self.portfolio.equity)
+        )
+        self.assertEqual(self.portfolio.realized_pnl, Decimal("19.20"))
+        self.assertEqual(self.portfolio.unrealized_pnl, Decimal("1028.80"))
+
+
+class TestTransactTicker(unittest.TestCase):
+    """
+    Apply the trades of a stock (closed and re-opened on the way) and of a future with transact_ticker, and check the
+    positions, logs and totals against calling transact_position for every trade.
+    """
+
+    def test_same_as_row_by_row(self):
+        days = [datetime.datetime(2017, 1, day) for day in (2, 3, 4, 5)]
+        trades = {
+            1: [
+                ("BOT", "100", "20.5", days[0]), ("SLD", "40", "21", days[1]), ("SLD", "60", "19.75", days[2]),
+                ("BOT", "10", "20", days[3]),
+            ],
+            2: [("SLD", "2", "3300.5", days[0]), ("BOT", "3", "3290", days[2])],
+        }
+        opening = {1: ("Stock", "1"), 2: ("Futures", "10")}
+        row_by_row, batched = Portfolio(), Portfolio(debug=True)
+        for ticker, rows in trades.items():
+            category, size = opening[ticker]
+            batch = [
+                {"quantity": Decimal(quantity), "price": Decimal(price), "date": date, "action": action,
+                 "category": category, "currency": "EUR", "contract_size": Decimal(size)}
+                for action, quantity, price, date in rows
+            ]
+            for trade in batch:
+                row_by_row.transact_position(ticker=ticker, history=True, **trade)
+            batched.transact_ticker(ticker, batch, history=True)
+        for name in ["equity", "unrealized_pnl", "realized_pnl", "net_exposure", "gross_exposure"]:
+            self.assertEqual(getattr(row_by_row, name), getattr(batched, name), name)
+        self.assertEqual(list(batched.positions), [1, 2])
+        self.assertEqual(len(batched.closed_positions[1]), 1)
+        logs = row_by_row.export_logs(), batched.export_logs()
+        pd.testing.assert_frame_equal(logs[0], logs[1])
+
+
+class TestMarkToMarket(unittest.TestCase):
+    """
+    Mark a stock, a short future and an option to market with Portfolio.mark_to_market, and check the logs and the
+    totals against marking the positions one by one.
+    """
+
+    def test_same_as_one_by_one(self):
+        date = datetime.datetime(2019, 3, 12)
+        prices = {1: Decimal("75.26"), 2: Decimal("3290.25"), 3: Decimal("131.5")}
+        one_by_one, bulk = holdings(date), holdings(date)
+        for ticker, price in prices.items():
+            one_by_one.transact_position(
+                ticker=ticker, quantity=one_by_one.positions[ticker].quantity, price=price, date=date,
+                position=True
+            )
+        bulk.mark_to_market(prices, date)
+        self.assertEqual(
+            (one_by_one.equity, one_by_one.unrealized_pnl, one_by_one.realized_pnl),
+            (bulk.equity, bulk.unrealized_pnl, bulk.realized_pnl)
+        )
+        self.assertEqual(one_by_one.positions[2].exposure, bulk.positions[2].exposure)
+        for ticker in prices:
+            self.assertTrue(
+                one_by_one.positions[ticker].log.to_frame().equals(bulk.positions[ticker].log.to_frame())
+            )
+
+    def test_not_held(self):
+        date = datetime.datetime(2019, 3, 12)
+        portfolio = holdings(date)
+        with self.assertRaisesRegex(KeyError, r"\[4\]"):
+            portfolio.mark_to_market({1: Decimal("75.26"), 4: Decimal("10")}, date)
+        self.assertNotIn(4, portfolio.positions)
+        self.assertEqual(portfolio.positions[1].log.rows, 1)
+
+
+class TestHistory(unittest.TestCase):
+    """
+    Close two days of a portfolio holding a stock, a short future, an option and two cash accounts, and check the
+    daily time series and its export.
+    """
+
+    def test_close_day(self):
+        days = [datetime.datetime(2019, 3, 12), datetime.datetime(2019, 3, 13)]
+        portfolio = holdings(days[0], debug=True)
+        portfolio.transact_cash("EUR", "1000.50", "1000.50", days[0])
+        portfolio.close_day(days[0])
+        portfolio.mark_to_market({1: Decimal("75.26"), 2: Decimal("3290.25"), 3: Decimal("131.5")}, days[1])
+        portfolio.transact_cash("USD", "200", "180.25", days[1])
+        portfolio.close_day(days[1])
+        portfolio.close_day(days[1])  # a day closed twice is only recorded once.
+
+        stock, future, option = (portfolio.positions[ticker] for ticker in [1, 2, 3])
+        exposures = [stock.market_value, future.exposure, option.market_value]
+        self.assertEqual(portfolio.net_exposure, sum(exposures).quantize(Decimal("0.01")))
+        self.assertEqual(portfolio.gross_exposure, sum(abs(x) for x in exposures).quantize(Decimal("0.01")))
+
+        frame = portfolio.history_frame()
+        self.assertEqual(list(frame.index), days)
+        self.assertEqual(frame["equity"].iloc[-1], float(portfolio.equity))
+        self.assertEqual(frame["gross_exposure"].iloc[-1], float(portfolio.gross_exposure))
+        self.assertEqual(frame["cash EUR"].tolist(), [1000.5, 1000.5])
+        self.assertTrue(np.isnan(frame["cash USD"].iloc[0]))
+        with tempfile.TemporaryDirectory() as folder:
+            file = os.path.join(folder, "history.csv")
+            portfolio.export_history(file)
+            exported = pd.read_csv(file, index_col="date", parse_dates=["date"])
+        pd.testing.assert_frame_equal(
+            exported, frame, check_names=False, check_freq=False, check_index_type=False
+        )
+
+
+class TestArchive(unittest.TestCase):
+    """
+    Close a stock and a future, re-open the stock, and check that the closed lots leave the live positions with their
+    realized P&L still in the totals.
+    """
+
+    def test_closed_positions_are_archived(self):
+        days = [datetime.datetime(2019, 3, 12), datetime.datetime(2019, 3, 13), datetime.datetime(2019, 3, 14)]
+        portfolio = holdings(days[0], debug=True)
+        portfolio.transact_position(
+            ticker=1, quantity=Decimal("100"), price=Decimal("76"), date=days[1], action="SLD"
+        )
+        portfolio.transact_ticker(2, [
+            {"quantity": Decimal("1"), "price": Decimal("3300"), "date": days[1], "action": "BOT"},
+            {"quantity": Decimal("2"), "price": Decimal("3280"), "date": days[2], "action": "BOT"},
+        ])
+        self.assertEqual(list(portfolio.positions), [3])
+        self.assertEqual(portfolio.realized_pnl, Decimal("122.00") + Decimal("125.00") + Decimal("650.00"))
+
+        portfolio.transact_position(
+            ticker=1, quantity=Decimal("10"), price=Decimal("80"), date=days[2], action="BOT"
+        )
+        (lot,) = portfolio.closed_positions[1]
+        self.assertEqual(
+            (lot.entry_date, lot.exit_date, lot.realized_pnl), (days[0], days[1], Decimal("122.00"))
+        )
+        self.assertEqual(lot.log.decimals("quantity"), [Decimal("100.00"), Decimal("0.00")])
+        self.assertEqual(portfolio.positions[1].entry_date, days[2])
+        self.assertEqual(portfolio.positions[1].realized_pnl, 0)
+        self.assertEqual(portfolio.closed_positions[2][0].exit_date, days[2])
+        self.assertEqual(sorted(portfolio.export_logs()["ticker"].unique()), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
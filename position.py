@@ -1,11 +1,20 @@
 from decimal import Decimal
 import  datetime
-import numpy as np
 import collections
+import numpy as np
+from tradelog import TradeLog, POSITION_LOG, CASH_LOG
 
 TWOPLACES = Decimal("0.01")
 SEVENPLACES = Decimal("0.0000001")
 
+# Final state of a position once it was closed (see Position.closed and Portfolio._archive), with its log and its tax
+# lots (lots.Lots, None unless Portfolio tracks them). A ticker traded again after it was closed opens a new position,
+# so there is one record per lot.
+ClosedPosition = collections.namedtuple("ClosedPosition", [
+    "ticker", "category", "currency", "action", "entry_date", "exit_date", "contract_size", "buys", "sells", "avg_bot",
+    "avg_sld", "total_bot", "total_sld", "realized_pnl", "log", "lots"
+], defaults=[None])
+
 
 class Position:
     def __init__(
@@ -50,7 +59,7 @@ class Position:
         # self.total_bot = Decimal("0.00")
         # self.total_sld = Decimal("0.00")
 
-        self.log = collections.defaultdict(list)
+        self.log = TradeLog(POSITION_LOG)
         # Decided to put self.update_market_value and self._log_trade inside self._calculate_initial_value
         # Reason being is that the only time _calculate_initial_value is called is when position is created, or
         # when you flip long/short and you create a new position. In both cases, I would like to log the opening
@@ -92,6 +101,20 @@ class Position:
         """
         raise NotImplementedError
 
+    def closed(self, date, lots=None):
+        """
+        :param date: Date on which the position was closed.
+        :param lots: Optional lots.Lots of the position.
+        :return: ClosedPosition record of the position; its log is trimmed to the rows logged.
+        """
+        self.log.compact()
+        return ClosedPosition(
+            ticker=self.ticker, category=self.category, currency=self.currency, action=self.action,
+            entry_date=self.entry_date, exit_date=date, contract_size=self.contract_size, buys=self.buys,
+            sells=self.sells, avg_bot=self.avg_bot, avg_sld=self.avg_sld, total_bot=self.total_bot,
+            total_sld=self.total_sld, realized_pnl=self.realized_pnl, log=self.log, lots=lots
+        )
+
     def _log_trade(self, date, price, event):
         """
         Save the trade details over the livespan of the position so it could be recorded and analyzed later.
@@ -106,7 +129,7 @@ class Position:
         :param date: string/datetime denoting the trade date
         :param price: latest market quote (per unit)
         :param event: What event is being logged? three choices initially: "Inception", "Trade", "Close".
-        :return: Dict["attribute": [data]]
+        :return: None. The row is appended to self.log (TradeLog).
         """
         # self.log[len(self.log.keys()) + 1] = [
         #     dat for dat in [date, (self.quantity).quantize(TWOPLACES),
@@ -117,17 +140,17 @@ class Position:
         #                     (self.realized_pnl).quantize(TWOPLACES), event]
         # ]
         #
-        self.log["date"].append(date)
-        self.log["quantity"].append(self.quantity.quantize(TWOPLACES))
-        self.log["price"].append(price.quantize(SEVENPLACES))
-        self.log["market_value"].append(self.market_value.quantize(TWOPLACES))
-        self.log["unit_cost"].append(
-            self.cost_basis.quantize(TWOPLACES) if self.net == 0 else (self.cost_basis / (self.net * self.contract_size)).quantize(SEVENPLACES)
+        self.log.append(
+            date=date,
+            quantity=self.quantity.quantize(TWOPLACES),
+            price=price.quantize(SEVENPLACES),
+            market_value=self.market_value.quantize(TWOPLACES),
+            unit_cost=self.cost_basis.quantize(TWOPLACES) if self.net == 0 else (self.cost_basis / (self.net * self.contract_size)).quantize(SEVENPLACES),
+            cost_basis=self.cost_basis.quantize(TWOPLACES),
+            unrealized_pnl=self.unrealized_pnl.quantize(TWOPLACES),
+            realized_pnl=self.realized_pnl.quantize(TWOPLACES),
+            event=event
         )
-        self.log["cost_basis"].append(self.cost_basis.quantize(TWOPLACES))
-        self.log["unrealized_pnl"].append(self.unrealized_pnl.quantize(TWOPLACES))
-        self.log["realized_pnl"].append(self.realized_pnl.quantize(TWOPLACES))
-        self.log["event"].append(event)
 
     def transact_shares(self, action, quantity, price, date, contract_size=1):
         """
@@ -406,7 +429,7 @@ class Cash:
         self.currency = currency
         self.market_value = Decimal(market_value)
         self.cost_basis = Decimal(cost_basis)
-        self.log = collections.defaultdict(list)
+        self.log = TradeLog(CASH_LOG)
         self._log_trade(date)
         self.category = "Cash"
 
@@ -434,16 +457,18 @@ class Cash:
         :param date: The date of the market_value update.
         :return:
         """
-        self.log["date"].append(date)
-        self.log["quantity"].append(np.nan)
-        self.log["price"].append(np.nan)
-        self.log["market_value"].append(self.market_value.quantize(TWOPLACES))
-        self.log["unit_cost"].append(np.nan)
-        self.log["cost_basis"].append(self.cost_basis.quantize(TWOPLACES))
-        self.log["unrealized_pnl"].append(np.nan)
-        self.log["realized_pnl"].append(np.nan)
-        self.log["currrency"].append(self.currency)
-        self.log["event"].append("Update")
+        self.log.append(
+            date=date,
+            quantity=np.nan,
+            price=np.nan,
+            market_value=self.market_value.quantize(TWOPLACES),
+            unit_cost=np.nan,
+            cost_basis=self.cost_basis.quantize(TWOPLACES),
+            unrealized_pnl=np.nan,
+            realized_pnl=np.nan,
+            currrency=self.currency,
+            event="Update"
+        )
         # self.log[len(self.log.keys()) + 1] = [
         #     dat for dat in [date, np.nan, np.nan, self.market_value.quantize(TWOPLACES),
         #                     np.nan, self.cost_basis.quantize(TWOPLACES), np.nan, np.nan, self.currency]
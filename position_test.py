@@ -1,6 +1,7 @@
 from position import Position, Stock
 
 from decimal import Decimal
+import datetime
 import unittest
 
 
@@ -15,10 +16,11 @@ class TestRoundTripXOMPosition(unittest.TestCase):
         """
         Set up the Position object that will store the PnL.
         """
+        self.date = datetime.datetime(2019, 3, 12)
         self.position = Stock(
             "BOT", "XOM", Decimal('100'),
             Decimal("74.78"), "Stock",
-            "USD"
+            "USD", self.date
         )
 
     def test_calculate_round_trip(self):
@@ -30,16 +32,16 @@ class TestRoundTripXOMPosition(unittest.TestCase):
         via Interactive Brokers' Trader Workstation (TWS).
         """
         self.position.transact_shares(
-            "BOT", Decimal('200'), Decimal('74.63')
+            "BOT", Decimal('100'), Decimal('74.63'), self.date
         )
         self.position.transact_shares(
-            "BOT", Decimal('250'), Decimal('74.620')
+            "BOT", Decimal('250'), Decimal('74.620'), self.date
         )
         self.position.transact_shares(
-            "SLD", Decimal('200'), Decimal('74.58')
+            "SLD", Decimal('200'), Decimal('74.58'), self.date
         )
         self.position.transact_shares(
-            "SLD", Decimal('250'), Decimal('75.26')
+            "SLD", Decimal('250'), Decimal('75.26'), self.date
         )
         self.position.update_market_value(Decimal("77.75"))
 
@@ -54,10 +56,10 @@ class TestRoundTripXOMPosition(unittest.TestCase):
         self.assertEqual(self.position.total_sld, Decimal("33731.00"))
         self.assertEqual(self.position.net_total, Decimal("135.00"))
 
-        self.assertEqual(self.position.avg_price, Decimal("74.65778"))
+        self.assertEqual(self.position.avg_price, Decimal("74.6577778"))
         self.assertEqual(self.position.cost_basis, Decimal("0.00"))
-        self.assertEqual(self.position.market_value, Decimal("7775"))
-        self.assertEqual(self.position.unrealized_pnl, Decimal("309.73"))
+        self.assertEqual(self.position.market_value, Decimal("0.00"))
+        self.assertEqual(self.position.unrealized_pnl, Decimal("0.00"))
         self.assertEqual(self.position.realized_pnl, Decimal("135.00"))
 
 
@@ -0,0 +1,225 @@
+"""
+Opt-in instrumentation of the replay, to find out where a slow backfill spends its time.
+
+While a Profiler is active, the functions of its targets (file loading, the Reader stages, the Portfolio and Position
+    methods called for every trade) are replaced by wrappers recording the number of calls, the wall time and, on
+    request, the memory allocated by every call. The original functions are put back when the Profiler exits, so
+    nothing is wrapped, and nothing is paid, while profiling is off.
+
+Usage:
+    with Profiler(reader) as profiler:
+        reader.main(path, "03122019", "01012020")
+    print(profiler.report())
+    profiler.write_trace("replay trace.json")  # open in chrome://tracing or https://ui.perfetto.dev
+"""
+from portfolio import Portfolio
+from position import Position, Cash
+from tradelog import TradeLog
+import reader
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# (owner, attribute) of the functions wrapped by default. owner is a class or a module.
+TARGETS = [
+    (reader, "load_daily_file"),
+    (reader.Reader, "read_excel"),
+    (reader.Reader, "read_ids"),
+    (reader.Reader, "read_movements"),
+    (reader.Reader, "read_positions"),
+    (reader.Reader, "id_events"),
+    (reader.Reader, "movement_events"),
+    (reader.Reader, "position_events"),
+    (reader.Reader, "cash_events"),
+    (reader, "apply_event"),
+    (Portfolio, "transact_position"),
+    (Portfolio, "transact_ticker"),
+    (Portfolio, "transact_cash"),
+    (Portfolio, "mark_to_market"),
+    (Portfolio, "_add_position"),
+    (Portfolio, "_modify_position"),
+    (Portfolio, "_update_portfolio"),
+    (Position, "transact_shares"),
+    (Position, "_log_trade"),
+    (Cash, "_log_trade"),
+    (TradeLog, "append"),
+]
+
+
+class Profiler:
+    """
+    Records, for every target, the number of calls, the cumulative wall time and (with memory=True) the memory
+        allocated, plus one Chrome trace event per call.
+
+    Calls are nested: the time of Portfolio.transact_position includes the time of the Portfolio._modify_position it
+        calls. Stages (Reader.id_events, ...) are generators; their time is the time spent producing the events, not
+        applying them, while their trace event spans the whole stage, events applied included.
+
+    Daily files parsed by worker processes (Reader.main with processes > 1) are not recorded: the profiler only sees
+        the process it runs in.
+    """
+
+    def __init__(self, *readers, targets=None, memory=False, trace=True):
+        """
+        :param readers: Readers whose stages (Reader.stages) are profiled. A Reader copies the default stages when it
+                    is created, so the stages of readers created before the Profiler is entered are only wrapped if the
+                    readers are given here. Readers created inside the `with` block are covered anyway.
+        :param targets: list of (owner, attribute) to wrap. Defaults to TARGETS.
+        :param memory: Flag (True/False). If True, the memory allocated by every call (net of what it freed) is
+                    recorded with tracemalloc. tracemalloc slows every allocation down, so the times measured with
+                    memory=True are inflated; profile time and memory in separate runs.
+        :param trace: Flag (True/False). If True, every call is kept for write_trace.
+        """
+        self.readers = readers
+        self.targets = TARGETS if targets is None else targets
+        self.memory = memory
+        self.trace = trace
+        self.stats = {}  # label -> [calls, total ns, max ns, allocated bytes]
+        self.events = []  # (label, start ns, duration ns, thread id)
+        self._patched = []  # (owner, attribute, original)
+        self._stages = None  # (Reader.STAGES, [(reader, stages)]) before they were wrapped.
+        self._origin = None
+        self._tracing = False
+
+    def _record(self, label, start, duration, allocated, span=None):
+        """
+        Adds a call to the statistics of label. span is the duration of its trace event, if it differs from the
+            duration counted in the statistics (see Profiler).
+        """
+        stat = self.stats.get(label)
+        if stat is None:
+            stat = self.stats[label] = [0, 0, 0, 0]
+        stat[0] += 1
+        stat[1] += duration
+        if duration > stat[2]:
+            stat[2] = duration
+        stat[3] += allocated
+        if self.trace:
+            self.events.append((label, start, duration if span is None else span, threading.get_ident()))
+
+    def _wrap(self, function, label):
+        """
+        :return: function recording every call of `function` under `label`.
+        """
+        clock, record, memory = time.perf_counter_ns, self._record, self.memory
+        traced = tracemalloc.get_traced_memory
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = clock()
+                spent = allocated = 0
+                generator = function(*args, **kwargs)
+                while True:
+                    begin, before = clock(), traced()[0] if memory else 0
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        break
+                    finally:
+                        spent += clock() - begin
+                        if memory:
+                            allocated += traced()[0] - before
+                    yield item
+                record(label, start, spent, allocated, span=clock() - start)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                before = traced()[0] if memory else 0
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    end = clock()
+                    record(label, start, end - start, traced()[0] - before if memory else 0)
+        return wrapper
+
+    def __enter__(self):
+        if self._patched:
+            raise RuntimeError("This Profiler is already active.")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._origin = time.perf_counter_ns()
+        wrappers = {}
+        for owner, attribute in self.targets:
+            original = vars(owner).get(attribute)
+            if original is None:
+                continue
+            label = f"{owner.__name__}.{attribute}"
+            if isinstance(original, staticmethod):
+                wrapper = staticmethod(self._wrap(original.__func__, label))
+            else:
+                wrapper = self._wrap(original, label)
+                wrappers[original] = wrapper
+            setattr(owner, attribute, wrapper)
+            self._patched.append((owner, attribute, original))
+        # The default stages are also referenced by Reader.STAGES and by the stages list of every Reader.
+        self._stages = (reader.Reader.STAGES, [(r, list(r.stages)) for r in self.readers])
+        reader.Reader.STAGES = tuple(wrappers.get(stage, stage) for stage in reader.Reader.STAGES)
+        for r in self.readers:
+            r.stages[:] = [wrappers.get(stage, stage) for stage in r.stages]
+        return self
+
+    def __exit__(self, *exc):
+        for owner, attribute, original in reversed(self._patched):
+            setattr(owner, attribute, original)
+        self._patched.clear()
+        reader.Reader.STAGES, stages = self._stages
+        for r, original in stages:
+            r.stages[:] = original
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        return False
+
+    def summary(self):
+        """
+        :return: pd.DataFrame indexed by target, sorted by total time: calls, total (s), mean (ms), max (ms) and, with
+                 memory=True, allocated (KiB).
+        """
+        frame = pd.DataFrame.from_dict(
+            self.stats, orient="index", columns=["calls", "total", "max", "allocated"], dtype="int64"
+        )
+        frame["mean"] = frame["total"] / frame["calls"].clip(lower=1) / 1e6
+        frame["total"] = frame["total"] / 1e9
+        frame["max"] = frame["max"] / 1e6
+        frame["allocated"] = frame["allocated"] / 1024
+        frame = frame.rename(columns={
+            "total": "total (s)", "mean": "mean (ms)", "max": "max (ms)", "allocated": "allocated (KiB)"
+        })[["calls", "total (s)", "mean (ms)", "max (ms)", "allocated (KiB)"]]
+        if not self.memory:
+            frame = frame.drop(columns="allocated (KiB)")
+        return frame.sort_values("total (s)", ascending=False)
+
+    def report(self):
+        """
+        :return: str summary table.
+        """
+        return self.summary().to_string(float_format=lambda x: f"{x:.3f}")
+
+    def write_trace(self, file):
+        """
+        Writes the recorded calls in the Chrome trace event format, which chrome://tracing, Perfetto and speedscope
+            show as a timeline / flame graph.
+        :param file: path of the JSON file.
+        :return: None
+        """
+        origin = self._origin or 0
+        pid = os.getpid()
+        events = [
+            {
+                "name": label, "cat": label.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                "ts": (start - origin) / 1000, "dur": duration / 1000,
+            }
+            for label, start, duration, tid in self.events
+        ]
+        with open(file, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,63 @@
+from benchmark import SyntheticMarket
+from portfolio import Portfolio
+from profiler import Profiler
+from reader import Reader
+
+import json
+import os
+import tempfile
+import unittest
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Replay a few synthetic daily files under a Profiler and check the recorded calls, the trace, and that every
+    wrapped function is put back afterwards.
+    """
+
+    def setUp(self):
+        self.files = SyntheticMarket(tickers=20, days=3, trades_per_day=10).daily_files()
+
+    def replay(self, reader):
+        for date, data in self.files:
+            reader.process_day({name: frame.copy() for name, frame in data.items()})
+
+    def test_calls_are_recorded(self):
+        reader = Reader(Portfolio())
+        stages = list(reader.stages)
+        with Profiler(reader, memory=True) as profiler:
+            self.replay(reader)
+        summary = profiler.summary()
+        self.assertEqual(summary.loc["Reader.position_events", "calls"], len(self.files))
+        rows = sum(position.log.rows for position in reader.portfolio.positions.values())
+        rows += sum(lot.log.rows for lots in reader.portfolio.closed_positions.values() for lot in lots)
+        self.assertEqual(summary.loc["TradeLog.append", "calls"], rows)
+        self.assertIn("allocated (KiB)", summary.columns)
+
+        self.assertEqual(reader.stages, stages)
+        self.assertEqual(Reader.STAGES, tuple(stages))
+        self.assertFalse(hasattr(Portfolio.transact_position, "__wrapped__"))
+
+        with tempfile.TemporaryDirectory() as folder:
+            file = os.path.join(folder, "trace.json")
+            profiler.write_trace(file)
+            with open(file) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual(len(events), summary["calls"].sum())
+        self.assertTrue(all(event["dur"] >= 0 for event in events))
+
+    def test_same_portfolio(self):
+        plain = Reader(Portfolio())
+        self.replay(plain)
+        with Profiler() as profiler:
+            profiled = Reader(Portfolio())
+            self.replay(profiled)
+        self.assertGreater(profiler.summary().loc["Portfolio.transact_position", "calls"], 0)
+        self.assertEqual(
+            (plain.portfolio.equity, plain.portfolio.realized_pnl, plain.portfolio.unrealized_pnl),
+            (profiled.portfolio.equity, profiled.portfolio.realized_pnl, profiled.portfolio.unrealized_pnl)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
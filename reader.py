@@ -3,26 +3,178 @@ from portfolio import Portfolio
 from decimal import Decimal
 import datetime
 import pandas as pd
-from SecurityID import retrieve_category
+from SecurityID import retrieve_categories
+from events import (
+    apply_event, DayStarted, DayFinished, FileMissing, IdsRefreshed, Trade, MarketUpdate, MarkToMarket, CashUpdate
+)
 from analysis import Analysis as ana
 from tqdm import tqdm
 import numpy as np
-import pickle
 import os
+import collections
+import contextlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', None)
 
+DAILY_SHEETS = ["HIS", "MVT", "SecuritiesIDs"]
+# Columns of the "HIS" sheet read by Reader.read_positions.
+HIS_COLUMNS = [
+    "C_N_ID", "D_NAV", "C_INVEST_CCY", "Q_QTY", "P_VAL_PRICE", "P_COST_PRICE", "G_CONTRACT_SIZE", "A_MARKET_VALUE",
+    "A_COST_VALUE_PTF"
+]
+
+
+def weekdays(start, end):
+    """
+    Yields every weekday from start (inclusive) up to end (exclusive). Daily files are only produced on weekdays.
+    :param start: datetime of the first day.
+    :param end: datetime of the day after the last day.
+    :return: generator of datetime
+    """
+    for i in range((end - start).days):
+        date = start + datetime.timedelta(days=i)
+        if date.weekday() < 5:
+            yield date
+
+
+def locate_daily_file(path, file_date):
+    """
+    Daily files are stored as path/MMYYYY/Zobel MMDDYYYY.xls. Some of them were saved as .xlsx instead, so we look for
+        both extensions.
+    :param path: The path to the folder holding the monthly folders.
+    :param file_date: datetime of the daily file.
+    :return: str path of the daily file, None if there is no file for that day.
+    """
+    # Month and Day need to be in two digit format. i.e. dd/mm
+    folder = os.path.join(path, file_date.strftime("%m%Y"))
+    name = file_date.strftime("Zobel %m%d%Y")
+    for extension in (".xls", ".xlsx"):
+        file = os.path.join(folder, name + extension)
+        if os.path.exists(file):
+            return file
+    return None
+
+
+def daily_files(path, start, end):
+    """
+    :param path: The path to the folder holding the monthly folders.
+    :param start: datetime of the first day.
+    :param end: datetime of the day after the last day.
+    :return: list of (datetime, str path of the daily file or None) for every weekday from start up to end.
+    """
+    return [(file_date, locate_daily_file(path, file_date)) for file_date in weekdays(start, end)]
+
+
+def load_daily_file(file, cache=None):
+    """
+    Parses the tabs of a daily file that are used by the Reader. This is a module level function so that it can be
+        sent to worker processes by Reader.main.
+    :param file: path to the daily file.
+    :param cache: Optional ParsedFileCache. If given, the sheets are loaded from (and saved to) the cache.
+    :return: dict {"HIS": pd.DataFrame, "MVT": pd.DataFrame, "SecuritiesIDs": pd.DataFrame}
+    """
+    if cache is not None:
+        return cache.read_excel(file, sheet_name=DAILY_SHEETS)
+    return pd.read_excel(file, sheet_name=DAILY_SHEETS)
+
+
+def prefetch(executor, fn, items, depth):
+    """
+    Like executor.map, but keeps at most `depth` calls in flight so that parsed files do not pile up in memory when
+        the portfolio is updated slower than the files are read. Results are yielded in the order of items.
+    :param executor: concurrent.futures.Executor
+    :param fn: function applied to every item.
+    :param items: iterable of arguments for fn.
+    :param depth: maximum number of pending calls.
+    :return: generator of results
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def history_trades(data):
+    """
+    Turns the rows of the "Movements" sheet of the transactions file into the arguments of
+        Portfolio.transact_position. Every column is derived with whole-column operations:
+        - category: from the GTI code.
+        - price: for Futures, the price is the third word of L_DEAL (with a decimal comma). P_PRICE otherwise.
+        - contract_size: P_PRICE / price for Futures, G_CONTRACT for Options, 1 otherwise.
+        - strike: for Options, the number after the "/" in L_NAME. NaN otherwise.
+        - currency: EUR when columns 22/23 and 28/29 agree, USD otherwise.
+    :param data: pd.DataFrame of movements, in the order in which they should be applied.
+    :return: pd.DataFrame [ticker, quantity, price, date, category, currency, action, contract_size, strike]
+    """
+    category = retrieve_categories(data["GTI"])
+    futures = category == "Futures"
+    options = category == "Index Put Option"
+
+    price = data["P_PRICE"].to_numpy(dtype=float, copy=True)
+    if futures.any():
+        deal = data.loc[futures, "L_DEAL"].str.split(" ").str[2]
+        price[futures] = deal.str.replace(",", ".", regex=False).astype(float).to_numpy()
+    contract_size = np.ones(len(data.index))
+    contract_size[futures] = data["P_PRICE"].to_numpy(dtype=float)[futures] / price[futures]
+    contract_size[options] = data["G_CONTRACT"].to_numpy(dtype=float)[options]
+    strike = np.full(len(data.index), np.nan)
+    if options.any():
+        name = data.loc[options, "L_NAME"].str.split("/").str[1]
+        strike[options] = name.str.replace(".", "", regex=False).str.replace(",", ".", regex=False).astype(float).to_numpy()
+    eur = (
+        (data.iloc[:, 22].to_numpy() == data.iloc[:, 23].to_numpy()) &
+        (data.iloc[:, 28].to_numpy() == data.iloc[:, 29].to_numpy())
+    )
+    return pd.DataFrame({
+        "ticker": data["C_N_ID"].to_numpy(),
+        "quantity": data["Q_QTY"].to_numpy(),
+        "price": price,
+        "date": data["D_NAV"].to_numpy(),
+        "category": category,
+        "currency": np.where(eur, "EUR", "USD"),
+        "action": np.where(data["C_ACC_WAY"].to_numpy() == "CR", "BOT", "SLD"),
+        "contract_size": contract_size,
+        "strike": strike,
+    })
+
+
 class Reader:
     """
     This class is used to read data files to update the portfolio information.
 
+    The daily files are replayed as a stream of events (see events.py and Reader.events): every file goes through the
+        stages (ids, movements, positions, cash), whose events are applied to the portfolio and handed to whoever
+        consumes the stream.
     """
 
-    def __init__(self, portfolio):
+    def __init__(self, portfolio, cache=None, stages=None):
+        """
+        :param portfolio: The Portfolio updated by the files that are read.
+        :param cache: Optional ParsedFileCache. When given, parsed Excel sheets are stored on disk and re-used by
+                    later runs as long as the workbook does not change.
+        :param stages: Functions stage(reader, day) -> iterable of events (see events.py) run on every daily file, in
+                    order. day is the dict of the sheets of the file, with its "date" and "file". Defaults to
+                    Reader.STAGES; stages can be added, removed or replaced.
+        """
         self.portfolio = portfolio
+        self.cache = cache
+        self.stages = list(self.STAGES if stages is None else stages)
         self.trades = {}
 
+    def read_excel(self, file, sheet_name, **kwargs):
+        """
+        pd.read_excel going through self.cache when there is one.
+        """
+        if self.cache is not None:
+            return self.cache.read_excel(file, sheet_name=sheet_name, **kwargs)
+        return pd.read_excel(file, sheet_name=sheet_name, **kwargs)
+
     def history_movements(self, path, end_date):
         """
         Since we have daily files for Zobel going back to only 12/March/2019, we need to obtain the
@@ -44,106 +196,163 @@ class Reader:
         :return: None
         """
         end_date = datetime.datetime.strptime(end_date, "%m/%d/%Y")
-        data = pd.read_excel(os.path.join(path, "Copy of Transactions.xls"), sheet_name="Movements", skiprows=3)
+        data = self.read_excel(os.path.join(path, "Copy of Transactions.xls"), sheet_name="Movements", skiprows=3)
         data = data.loc[~data["D_NAV"].isna()]
         data["D_NAV"] = pd.to_datetime(data["D_NAV"])
         data = data.loc[~(data["D_NAV"] >= end_date)]
         # data.sort_values(by="D_NAV", inplace=True)
-        data = data.assign(
-            Currency=pd.Series(["EUR" if all((data.iloc[i, 22] == data.iloc[i, 23], data.iloc[i, 28] == data.iloc[i, 29])) else "USD" for i in range(len(data.index))]).values)
-        for row in data[::-1].itertuples():  # read in reverse order.
-            quantity = row.Q_QTY
-            category = retrieve_category(row.GTI)
-            if category == "Futures":
-                price = float(row.L_DEAL.split(" ")[2].replace(",", "."))
-            else:
-                price = row.P_PRICE
-            if category == "Futures":
-                contract_size = row.P_PRICE/price
-            elif category == "Index Put Option":
-                contract_size = row.G_CONTRACT
-            else:
-                contract_size = 1
-            if category == "Index Put Option":
-                strike_price = float(row.L_NAME.split("/")[1].replace(".", "").replace(",", "."))
-            else:
-                strike_price = None
-            self.portfolio.transact_position(
-                ticker=row.C_N_ID,
-                quantity=Decimal(quantity),
-                price=Decimal(price),
-                date=row.D_NAV,
-                category=retrieve_category(row.GTI),
-                currency=row.Currency,
-                action="BOT" if row.C_ACC_WAY == "CR" else "SLD",
-                contract_size=Decimal(contract_size),
-                strike=strike_price,
+        trades = history_trades(data[::-1])  # read in reverse order.
+        # The trades of a day are applied ticker by ticker (see Portfolio.transact_ticker), each in the order of the
+        # rows. The positions do not depend on each other, so this is the row by row replay as long as the rows follow
+        # note 1. The portfolio closes every day once its trades are applied, as it does for the daily files.
+        if not trades["date"].is_monotonic_increasing:
+            raise ValueError("The Movements sheet must be sorted by D_NAV, newest first (see note 1).")
+        # The rows of every (day, ticker) pair, days in order and tickers in the order they first trade in the day. A
+        # groupby over the pairs would make a group of almost every row, so the groups are laid out with NumPy.
+        dates = trades["date"].to_numpy()
+        days = np.cumsum(np.r_[len(dates) > 0, dates[1:] != dates[:-1]]) - 1
+        codes, tickers = pd.factorize(trades["ticker"], use_na_sentinel=False)  # keeps the rows without C_N_ID.
+        groups = pd.factorize(days * len(tickers) + codes)[0]
+        order = np.argsort(groups, kind="stable")
+        starts = np.flatnonzero(np.r_[len(order) > 0, np.diff(groups[order]) != 0])
+        ordered = trades.take(order)
+        rows = list(zip(*(ordered[column].tolist() for column in (
+            "quantity", "price", "date", "category", "currency", "action", "contract_size", "strike"
+        ))))
+        tickers, day = tickers.tolist(), None
+        for start, end in zip(starts.tolist(), np.r_[starts[1:], len(order)].tolist()):
+            date = rows[start][2]
+            if date != day:
+                self.portfolio.close_day(day)
+                day = date
+            self.portfolio.transact_ticker(
+                tickers[codes[order[start]]],
+                (
+                    {
+                        "quantity": Decimal(quantity),
+                        "price": Decimal(price),
+                        "date": date,
+                        "category": category,
+                        "currency": currency,
+                        "action": action,
+                        "contract_size": Decimal(contract_size),
+                        "strike": None if np.isnan(strike) else strike,
+                    }
+                    for quantity, price, date, category, currency, action, contract_size, strike in rows[start:end]
+                ),
                 history=True
             )
+        self.portfolio.close_day(day)
 
-    def main(self, path, start_date, end_date):
+    def main(self, path, start_date, end_date, processes=None, subscribers=(), checkpoint=None):
         """
         This method will read the Excel file, then spawn multiple processes so that each file is processed very quickly.
+
+        Parsing the .xls files is by far the slowest part of a rebuild, so when processes is larger than 1 the daily
+            files are parsed in a pool of worker processes (see load_daily_file). The parsed frames are handed back
+            in date order and applied to the portfolio one day at a time, so the resulting Portfolio is the same as
+            the one obtained from a serial run.
         :param path: The path to the daily file.
         :param start_date: The start day for reading the files.
         :param end_date: The end day for reading the files
-        :return:
+        :param processes: Number of worker processes used to parse the daily files. None or 1 reads them serially.
+        :param subscribers: Callables called with every event of the replay (see self.events), in order. The replay
+                    waits for each call to return, so a slow subscriber slows the replay down instead of events
+                    piling up in memory.
+        :param checkpoint: Optional Checkpoint, for incremental runs. If it holds a snapshot, the portfolio is restored
+                    from it and only the days after the snapshot are replayed; new snapshots are saved as the replay
+                    goes. If the file of a day in the snapshot was restated since it was applied, the replay starts
+                    again from the latest snapshot before that day (see Checkpoint.resume), even if that is before
+                    start_date. A portfolio restored this way already holds the history_movements trades, which
+                    must not be read again.
+        :return: list of the dates (%m%d%Y) for which no daily file was found.
+        """
+        resume = None
+        if checkpoint is not None:
+            resume, restated = checkpoint.resume(self, path, datetime.datetime.strptime(start_date, "%m%d%Y"))
+            if restated is not None:
+                # The days rolled back to are no longer in the portfolio: they are replayed whatever start_date is.
+                start_date = (resume + datetime.timedelta(days=1)).strftime("%m%d%Y")
+        not_available = []
+        for event in self.events(path, start_date, end_date, processes, after=resume):
+            if type(event) is FileMissing:
+                not_available.append(datetime.datetime.strftime(event.date, format="%m%d%Y"))
+            for subscriber in subscribers:
+                subscriber(event)
+            if checkpoint is not None and type(event) in (DayFinished, FileMissing):
+                checkpoint.day_finished(self, event.date, getattr(event, "file", None))
+        if checkpoint is not None:
+            checkpoint.save(self)
+        return not_available
+
+    def events(self, path, start_date, end_date, processes=None, after=None):
+        """
+        Replays the daily files from start_date up to end_date and yields the events (see events.py) as they are
+            applied to the portfolio: DayStarted, the events of every stage of self.stages, then DayFinished, for
+            every day; FileMissing for the weekdays without a file.
+
+        This is a generator: the replay only advances when the next event is requested, and at most a few parsed
+            files are held in memory at once, so a multi-year replay runs in constant memory and a consumer can
+            report on a day as soon as its DayFinished event arrives.
+        :param path: The path to the daily file.
+        :param start_date: The start day for reading the files. %m%d%Y
+        :param end_date: The end day for reading the files. %m%d%Y
+        :param processes: Number of worker processes used to parse the daily files. None or 1 reads them serially.
+        :param after: Optional datetime; the days up to and including it are skipped (already in the portfolio).
+        :return: generator of events
         """
         start = datetime.datetime.strptime(start_date, "%m%d%Y")
+        if after is not None:
+            start = max(start, after + datetime.timedelta(days=1))
         end = datetime.datetime.strptime(end_date, "%m%d%Y")
+        days = daily_files(path, start, end)
+        files = [file for _, file in days if file is not None]
 
-        def is_weekday(date):
-            """
-            Checks if date is a weekday or not. Returns True if date is a weekday, False otherwise.
-            :param date:
-            :return: bool
-            """
-            if date.weekday() < 5:
-                return True
-            else:
-                return False
-
-        not_available = []
-        k = abs((start-end).days)
-        print(f"The value  of k is: {k}")
-        for i in tqdm(range(k)):
-            file_date = start
-            if is_weekday(file_date):
-                pass
+        load = functools.partial(load_daily_file, cache=self.cache)
+        with contextlib.ExitStack() as stack:
+            if processes is None or processes <= 1:
+                parsed = map(load, files)
             else:
-                start = start + datetime.timedelta(days=1)
-                continue
-            day = file_date.day
-            month = file_date.month
-            year = str(file_date.year)
-            # Month and Day need to be in two digit format. i.e. dd/mm
-            if month < 10:
-                month = "0"+str(month)
-            else:
-                month = str(month)
-            if day < 10:
-                day = "0"+str(day)
-            else:
-                day = str(day)
-            folder = os.path.join(path, f"{month}{year}")
-            file = os.path.join(folder, f"Zobel {month}{day}{year}.xls")
-            try:
-                data = pd.read_excel(file, sheet_name=["HIS", "MVT", "SecuritiesIDs"])
-                print(f"Now processing the file with path: {file}")
-            except FileNotFoundError:
-                print(f"1st Level FileNotFoundError {file}")
-                try:
-                    data = pd.read_excel(os.path.join(folder, f"Zobel {month}{day}{year}.xlsx"), sheet_name=["HIS", "MVT", "SecuritiesIDs"])
-                except FileNotFoundError:
-                    not_available.append(datetime.datetime.strftime(file_date, format="%m%d%Y"))
-                    start = start + datetime.timedelta(days=1)
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=processes))
+                parsed = prefetch(executor, load, files, depth=2 * processes)
+            for file_date, file in tqdm(days):
+                if file is None:
+                    yield FileMissing(file_date)
                     continue
-            pos, mov, s_ids = data.values()
-            self.read_ids(s_ids)
-            self.read_movements(mov)
-            self.read_positions(pos)
-            start = start + datetime.timedelta(days=1)
-            break
+                print(f"Now processing the file with path: {file}")
+                yield from self.replay_day(next(parsed), file_date, file)
+
+    def replay_day(self, data, date=None, file=None):
+        """
+        Runs one parsed daily file through the stages of self.stages, applying every event to the portfolio before it
+            is yielded.
+        :param data: dict of the "HIS", "MVT" and "SecuritiesIDs" frames, as returned by load_daily_file.
+        :param date: datetime of the daily file.
+        :param file: path of the daily file.
+        :return: generator of events
+        """
+        day = dict(data, date=date, file=file)
+        yield DayStarted(date, file)
+        for stage in self.stages:
+            for event in stage(self, day):
+                apply_event(self.portfolio, event)
+                yield event
+        event = DayFinished(date, file)
+        apply_event(self.portfolio, event)
+        yield event
+
+    def process_day(self, data):
+        """
+        Applies one parsed daily file to the portfolio. The order in which the tabs are read matters: the ids are
+            needed to open new options, and the movements have to be stored before read_positions can record them.
+        :param data: dict of the "HIS", "MVT" and "SecuritiesIDs" frames, as returned by load_daily_file.
+        :return: None
+        """
+        collections.deque(self.replay_day(data), maxlen=0)
+
+    def _apply(self, events):
+        for event in events:
+            apply_event(self.portfolio, event)
 
     def read_ids(self, file):
         """
@@ -153,10 +362,16 @@ class Reader:
         :param path:
         :return:
         """
-        # data = pd.read_excel(path, sheet_name="SecuritiesIDs").loc[:,["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]]
-        data = file.loc[:, ["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]]
-        self.portfolio.ids.update(data.groupby(["C_N_ID"]).agg(lambda x: list(x)).T.to_dict())
-        # {C_N_ID: {"C_ID_TYPE": [List], "G_ID_VALUE":[List] }}
+        self._apply(self.id_events({"SecuritiesIDs": file}))
+
+    def id_events(self, day):
+        """
+        Stage: refreshes the security ids (Portfolio.ids) from the "SecuritiesIDs" tab.
+        :param day: dict of the sheets of a daily file (and its "date").
+        :return: generator of IdsRefreshed
+        """
+        # The sheet is handed over as it is: the SecurityMaster in portfolio.ids only parses the rows it has not seen.
+        yield IdsRefreshed(day.get("date"), day["SecuritiesIDs"].loc[:, ["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]], {})
 
     def read_positions(self, pos):
         """
@@ -166,39 +381,93 @@ class Reader:
         :param pos: The daily position file.
         :return:
         """
-        data = pos
-        data = data.loc[~data["C_N_ID"].isna()].merge(data.loc[~(data["A_ACCRUED_INTEREST"] == 0) & (data["A_ACCRUED_INTEREST"].isna())])
-        self.portfolio.wkn.update(data.loc[:, ["C_N_ID", "G_SORTING_KEY"]].set_index("C_N_ID").T.to_dict("list"))
-        data["D_NAV"] = pd.to_datetime(data["D_NAV"])
+        day = {"HIS": pos}
+        self._apply(self.position_events(day))
+        self._apply(self.cash_events(day))
+
+    @staticmethod
+    def _his(day):
+        """
+        Filters the "HIS" tab of a day and indexes it once: the columns that are read as lists, their categories, and
+            C_N_ID -> first row with that id. Pending trades and the update loops then read rows by position instead
+            of scanning the sheet for every ticker. The index is kept in the day dict for the following stages.
+        :return: dict {"data": pd.DataFrame, "columns": {column: list}, "categories": list, "rows": {C_N_ID: int}}
+        """
+        if "HIS index" not in day:
+            data = day["HIS"]
+            data = data.loc[~data["C_N_ID"].isna()].merge(data.loc[~(data["A_ACCRUED_INTEREST"] == 0) & (data["A_ACCRUED_INTEREST"].isna())])
+            data["D_NAV"] = pd.to_datetime(data["D_NAV"])
+            columns = {column: data[column].tolist() for column in HIS_COLUMNS}
+            day["HIS index"] = {
+                "data": data,
+                "columns": columns,
+                "categories": retrieve_categories(data["C_SOF_TYP"]).tolist(),
+                "rows": dict(zip(reversed(columns["C_N_ID"]), range(len(data.index) - 1, -1, -1))),
+            }
+        return day["HIS index"]
+
+    def position_events(self, day):
+        """
+        Stage: WKNs and the pending trades of new positions (see movement_events), then the latest market quotes of
+            every position of the "HIS" tab.
+        :param day: dict of the sheets of a daily file (and its "date").
+        :return: generator of IdsRefreshed, Trade, MarketUpdate and MarkToMarket
+        """
+        index = self._his(day)
+        his, categories, rows = index["columns"], index["categories"], index["rows"]
+        data = index["data"]
+        wkn = dict(zip(data["C_N_ID"].tolist(), ([key] for key in data["G_SORTING_KEY"].tolist())))
+        yield IdsRefreshed(day.get("date"), {}, wkn)
         if self.trades.__len__() != 0:
             for _, trade in self.trades.items():
-                self.portfolio.transact_position(
+                row = rows[trade["ticker"]]
+                yield Trade(
                     ticker=trade["ticker"],
                     quantity=Decimal(trade["quantity"]),
-                    price=Decimal(data.loc[data["C_N_ID"] == trade["ticker"]]["P_COST_PRICE"].iloc[0]),
+                    price=Decimal(his["P_COST_PRICE"][row]),
                     date=trade["date"],
-                    category=retrieve_category(data.loc[data["C_N_ID"] == trade["ticker"]]["C_SOF_TYP"].iloc[0]),
-                    currency=data.loc[data["C_N_ID"] == trade["ticker"]]["C_INVEST_CCY"],
+                    category=categories[row],
+                    currency=his["C_INVEST_CCY"][row],
                     action="BOT" if trade["action"] == "CR" else "SLD",
-                    contract_size=Decimal(data.loc[data["C_N_ID"] == trade["ticker"]]["G_CONTRACT_SIZE"].iloc[0])
+                    contract_size=Decimal(his["G_CONTRACT_SIZE"][row])
                 )
             self.trades.clear()
-        for row in data.itertuples():
-            category = retrieve_category(row.C_SOF_TYP)
-            date = row.D_NAV
-            currency = row.C_INVEST_CCY
+        # Positions held in the same quantity are only re-priced: they are marked together, once per date. New
+        # positions, changed quantities and tickers listed twice go through transact_position row by row.
+        marks = {}
+        listed = collections.Counter(his["C_N_ID"])
+        for row, category in enumerate(categories):
             if category == "Cash":
-                market_value = row.A_MARKET_VALUE
-                cost_basis = row.A_COST_VALUE_PTF
-                self.portfolio.transact_cash(currency, market_value, cost_basis, date)
                 continue
-            self.portfolio.transact_position(ticker=row.C_N_ID,
-                                             quantity=Decimal(row.Q_QTY),
-                                             price=Decimal(row.P_VAL_PRICE),
-                                             date=date,
-                                             category=category,
-                                             currency=currency,
-                                             position=True)
+            ticker = his["C_N_ID"][row]
+            quantity = Decimal(his["Q_QTY"][row])
+            held = self.portfolio.positions.get(ticker)
+            if held is not None and held.category != "Cash" and quantity == held.quantity and listed[ticker] == 1:
+                marks.setdefault(his["D_NAV"][row], {})[ticker] = Decimal(his["P_VAL_PRICE"][row])
+                continue
+            yield MarketUpdate(ticker=ticker,
+                               quantity=quantity,
+                               price=Decimal(his["P_VAL_PRICE"][row]),
+                               date=his["D_NAV"][row],
+                               category=category,
+                               currency=his["C_INVEST_CCY"][row])
+        for date, prices in marks.items():
+            yield MarkToMarket(date, prices)
+
+    def cash_events(self, day):
+        """
+        Stage: the cash accounts of the "HIS" tab.
+        :param day: dict of the sheets of a daily file (and its "date").
+        :return: generator of CashUpdate
+        """
+        index = self._his(day)
+        his = index["columns"]
+        for row, category in enumerate(index["categories"]):
+            if category == "Cash":
+                yield CashUpdate(currency=his["C_INVEST_CCY"][row],
+                                 market_value=his["A_MARKET_VALUE"][row],
+                                 cost_basis=his["A_COST_VALUE_PTF"][row],
+                                 date=his["D_NAV"][row])
 
     def read_movements(self, mov):
         """
@@ -210,76 +479,90 @@ class Reader:
         :param mov: The daily movement file.
         :return:
         """
+        self._apply(self.movement_events({"MVT": mov}))
+
+    def movement_events(self, day):
+        """
+        Stage: trades of the "MVT" tab on existing positions. Trades opening a new position are stored in self.trades
+            until position_events can complete them.
+        :param day: dict of the sheets of a daily file (and its "date").
+        :return: generator of Trade
+        """
+        mov = day["MVT"]
         mov = mov.loc[~mov["C_N_ID"].isna()]
         if len(mov.index) == 0:  # No movements.
-            return False
+            return
         data = mov
         data["D_TRADE"] = pd.to_datetime(data["D_TRADE"])
         for row in data.itertuples():
             if row.C_N_ID in self.portfolio.positions.keys():
-                self.portfolio.transact_position(ticker=row.C_N_ID,
-                                                 quantity=row.Q_QTY,
-                                                 price=row.P_PRICE,
-                                                 date=row.D_TRADE,
-                                                 action="BOT" if row.C_ACC_WAY == "CR" else "SLD")
+                yield Trade(ticker=row.C_N_ID,
+                            quantity=row.Q_QTY,
+                            price=row.P_PRICE,
+                            date=row.D_TRADE,
+                            action="BOT" if row.C_ACC_WAY == "CR" else "SLD")
             else:
                 self.trades[self.trades.__len__() + 1] = \
                     {"price": row.P_PRICE, "quantity": row.Q_QTY, "ticker": row.C_N_ID,
                         "date": row.D_TRADE, "action": row.C_ACC_WAY}
 
+    # Default stages of a daily file, in the order they have to run: the ids are needed to open new options, and
+    # the movements have to be stored before position_events can record them.
+    STAGES = (id_events, movement_events, position_events, cash_events)
+
+if __name__ == "__main__":
+    zobel = Portfolio()
+    read = Reader(zobel)
+    read.history_movements(r"/Users/vanessa/Desktop/Sigma/03.10.2020", "04/01/2017")
+    #analyzer = ana(zobel, title=["A","B"])
+    #analyzer.get_results()
+
+    ##print(position.log)
+    for ticker, position in zobel.positions.items():
+        print(f"Ticker: {ticker}\t {position.currency} \t {position}\t {position.log}")
+    #    #print(f"Ticker: {ticker}\t {analyzer.get_results()}")
+    #    print(pd.DataFrame(position.log, index=position.log["date"]))
+        print("-"*100)
+       # print(f"Ticker: {ticker}\t {position.currency} {position}\t {position.log}")
+
+
 
-zobel = Portfolio()
-read = Reader(zobel)
-read.history_movements(r"/Users/vanessa/Desktop/Sigma/03.10.2020", "04/01/2017")
-#analyzer = ana(zobel, title=["A","B"])
-#analyzer.get_results()
-
-##print(position.log)
-for ticker, position in zobel.positions.items():
-    print(f"Ticker: {ticker}\t {position.currency} \t {position}\t {position.log}")
-#    #print(f"Ticker: {ticker}\t {analyzer.get_results()}")
-#    print(pd.DataFrame(position.log, index=position.log["date"]))
-    print("-"*100)
-   # print(f"Ticker: {ticker}\t {position.currency} {position}\t {position.log}")
-    
-    
- 
-    #analyzer = ana(data, title=["A","B"])
-    #analyzer.plot_results()
-# read.main(path=r"C:\Users\Presentation\Desktop\CleaningData\Cash Data", start_date="03122019", end_date="01012020")
-# zobel.transact_position(
-#     ticker=168796,
-#     quantity=Decimal(156507),
-#     price=Decimal(20),
-#     date=datetime.datetime.strptime("2019/09/11", "%Y/%m/%d"),
-#     action="CR",
-#     category="Fund",
-#     currency="EUR",
-# )
-# zobel.transact_position(
-#     ticker=4743,
-#     quantity=Decimal(335000),
-#     price=Decimal(5.45),
-#     date=datetime.datetime.strptime("2018/08/01", "%Y/%m/%d"),
-#     action="CR",
-#     category="Stock",
-#     currency="USD"
-# )
-# reader = Reader(zobel)
-# reader.read_ids("toy_transactions.xlsx")
-# reader.read_movements("toy_transactions.xlsx")
-# reader.read_positions("toy_transactions.xlsx")
-# print(zobel.positions)
-# print(zobel.positions[102660].log)
-# for ticker, position in zobel.positions.items():
-#     print(f"Ticker {ticker}: ", position.log)
-#     print(zobel.realized_pnl)
-# s_id = pd.read_excel("toy_transactions.xlsx", sheet_name="SecuritiesIDs").loc[:, ["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]]
-# # zobel.ids.update(s_id.set_index("C_N_ID").T.to_dict("list"))
-# print(s_id.groupby(["C_N_ID"]).agg(lambda x: list(x)).T.to_dict())
-# zobel.ids.update(s_id.groupby(["C_N_ID"]).agg(lambda x: list(x)).T.to_dict())
-# print(zobel.ids)
-# print(zobel.ids[73904]["G_ID_VALUE"][zobel.ids[73904]["C_ID_TYPE"].index(6)])
+        #analyzer = ana(data, title=["A","B"])
+        #analyzer.plot_results()
+    # read.main(path=r"C:\Users\Presentation\Desktop\CleaningData\Cash Data", start_date="03122019", end_date="01012020")
+    # zobel.transact_position(
+    #     ticker=168796,
+    #     quantity=Decimal(156507),
+    #     price=Decimal(20),
+    #     date=datetime.datetime.strptime("2019/09/11", "%Y/%m/%d"),
+    #     action="CR",
+    #     category="Fund",
+    #     currency="EUR",
+    # )
+    # zobel.transact_position(
+    #     ticker=4743,
+    #     quantity=Decimal(335000),
+    #     price=Decimal(5.45),
+    #     date=datetime.datetime.strptime("2018/08/01", "%Y/%m/%d"),
+    #     action="CR",
+    #     category="Stock",
+    #     currency="USD"
+    # )
+    # reader = Reader(zobel)
+    # reader.read_ids("toy_transactions.xlsx")
+    # reader.read_movements("toy_transactions.xlsx")
+    # reader.read_positions("toy_transactions.xlsx")
+    # print(zobel.positions)
+    # print(zobel.positions[102660].log)
+    # for ticker, position in zobel.positions.items():
+    #     print(f"Ticker {ticker}: ", position.log)
+    #     print(zobel.realized_pnl)
+    # s_id = pd.read_excel("toy_transactions.xlsx", sheet_name="SecuritiesIDs").loc[:, ["C_N_ID", "C_ID_TYPE", "G_ID_VALUE"]]
+    # # zobel.ids.update(s_id.set_index("C_N_ID").T.to_dict("list"))
+    # print(s_id.groupby(["C_N_ID"]).agg(lambda x: list(x)).T.to_dict())
+    # zobel.ids.update(s_id.groupby(["C_N_ID"]).agg(lambda x: list(x)).T.to_dict())
+    # print(zobel.ids)
+    # print(zobel.ids[73904]["G_ID_VALUE"][zobel.ids[73904]["C_ID_TYPE"].index(6)])
 
 # All of the above worked for securities in the toy_transactions.xlsx  as of 29/02/2020 (LEAP DAY WOHOO!)
 
@@ -0,0 +1,148 @@
+from events import DayStarted, DayFinished, IdsRefreshed, Trade, MarkToMarket, CashUpdate
+from portfolio import Portfolio
+from reader import Reader, history_trades
+
+from decimal import Decimal
+import datetime
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import unittest
+
+
+def movements(rows):
+    """
+    :param rows: list of (C_N_ID, D_NAV, GTI, C_ACC_WAY, Q_QTY, P_PRICE, L_DEAL, L_NAME, G_CONTRACT, currency), oldest
+                 first.
+    :return: pd.DataFrame laid out like the "Movements" sheet of the transactions file: newest row first, and the
+             currency columns (22/23 and 28/29) equal for EUR.
+    """
+    names = ["C_N_ID", "D_NAV", "GTI", "C_ACC_WAY", "Q_QTY", "P_PRICE", "L_DEAL", "L_NAME", "G_CONTRACT"]
+    data = pd.DataFrame([row[:-1] for row in rows[::-1]], columns=names)
+    for i in range(len(names), 30):
+        data[f"column {i}"] = "EUR"
+    usd = [row[-1] == "USD" for row in rows[::-1]]
+    data["column 23"] = np.where(usd, "USD", "EUR")
+    return data
+
+
+class TestReplayDay(unittest.TestCase):
+    """
+    Replay one daily file, in which a new stock is bought, and check the events yielded by the stages and the
+    resulting portfolio.
+    """
+
+    def setUp(self):
+        self.date = datetime.datetime(2019, 3, 12)
+        self.day = {
+            "SecuritiesIDs": pd.DataFrame({"C_N_ID": [1001], "C_ID_TYPE": [1], "G_ID_VALUE": ["DE0001001"]}),
+            "MVT": pd.DataFrame({
+                "C_N_ID": [1001], "D_TRADE": [self.date], "Q_QTY": [100.0], "P_PRICE": [20.5], "C_ACC_WAY": ["CR"]
+            }),
+            "HIS": pd.DataFrame({
+                "C_N_ID": [1001, 1], "A_ACCRUED_INTEREST": np.nan, "G_SORTING_KEY": [7007, 0], "D_NAV": self.date,
+                "P_COST_PRICE": [20.5, np.nan], "C_SOF_TYP": [100.0, np.nan], "C_INVEST_CCY": ["EUR", "EUR"],
+                "G_CONTRACT_SIZE": [1.0, np.nan], "Q_QTY": [100.0, np.nan], "P_VAL_PRICE": [21.0, np.nan],
+                "A_MARKET_VALUE": [2100.0, 5000.0], "A_COST_VALUE_PTF": [2050.0, 5000.0],
+            }),
+        }
+
+    def test_events(self):
+        portfolio = Portfolio()
+        events = list(Reader(portfolio).replay_day(self.day, self.date))
+        self.assertEqual(
+            [type(event) for event in events],
+            [DayStarted, IdsRefreshed, IdsRefreshed, Trade, MarkToMarket, CashUpdate, DayFinished]
+        )
+        self.assertEqual((events[3].category, events[3].currency), ("Stock", "EUR"))
+        self.assertEqual(events[4].prices, {1001: 21})
+        self.assertEqual(portfolio.wkn[1001], [7007])
+        self.assertEqual(portfolio.positions[1001].market_value, 2100)
+        self.assertEqual(portfolio.positions["EUR"].market_value, 5000)
+
+    def test_custom_stages(self):
+        seen = []
+
+        def audit(reader, day):
+            seen.append(len(reader.portfolio.positions))
+            return []
+
+        reader = Reader(Portfolio())
+        reader.stages.insert(3, audit)  # between the positions and the cash
+        reader.process_day(self.day)
+        self.assertEqual(seen, [1])
+        self.assertIn("EUR", reader.portfolio.positions)
+
+
+class TestHistoryMovements(unittest.TestCase):
+    """
+    Replay a transactions file holding a stock (bought, then partly sold), a short future, an option and a row without
+    C_N_ID, and check the trades derived from the sheet and the resulting portfolio.
+    """
+
+    def setUp(self):
+        days = [datetime.datetime(2017, 1, day) for day in (2, 3, 4)]
+        self.data = movements([
+            (1001, days[0], 100, "CR", 100.0, 20.5, "", "", np.nan, "EUR"),
+            (2001, days[0], 620, "DR", 2.0, 33005.0, "KAUF FUT 3300,5 EUR", "", np.nan, "USD"),
+            (3001, days[1], 431, "CR", 5.0, 125.0, "", "Put on Euro Stoxx 50 Juni 2020/3.000,00", 10.0, "EUR"),
+            (1001, days[1], 100, "DR", 40.0, 21.0, "", "", np.nan, "EUR"),
+            (np.nan, days[2], 100, "CR", 1.0, 10.0, "", "", np.nan, "EUR"),
+        ])
+
+    def test_history_trades(self):
+        trades = history_trades(self.data[::-1])
+        self.assertEqual(trades["category"].tolist()[:4], ["Stock", "Futures", "Index Put Option", "Stock"])
+        self.assertEqual(trades["price"].tolist()[:4], [20.5, 3300.5, 125.0, 21.0])
+        self.assertEqual(trades["contract_size"].tolist()[:4], [1.0, 10.0, 10.0, 1.0])
+        self.assertEqual(trades["strike"].tolist()[2], 3000.0)
+        self.assertTrue(np.isnan(trades["strike"].tolist()[0]))
+        self.assertEqual(trades["currency"].tolist()[:2], ["EUR", "USD"])
+        self.assertEqual(trades["action"].tolist()[:2], ["BOT", "SLD"])
+
+    def replay(self, data, ids=None):
+        portfolio = Portfolio()
+        portfolio.ids.update(ids or {})
+        with tempfile.TemporaryDirectory() as folder:
+            with pd.ExcelWriter(os.path.join(folder, "Copy of Transactions.xls"), engine="openpyxl") as writer:
+                data.to_excel(writer, sheet_name="Movements", index=False, startrow=3)
+            Reader(portfolio).history_movements(folder, "03/12/2019")
+        return portfolio
+
+    def test_history_movements(self):
+        portfolio = self.replay(self.data)
+        self.assertEqual(portfolio.positions[1001].quantity, Decimal("60"))
+        self.assertEqual(portfolio.positions[1001].realized_pnl, Decimal("20.00"))
+        self.assertEqual(
+            (portfolio.positions[2001].action, portfolio.positions[2001].currency), ("SLD", "USD")
+        )
+        self.assertEqual(portfolio.positions[3001].strike, Decimal("3000"))
+        # The row without C_N_ID is applied as it was row by row, not dropped.
+        self.assertEqual(sum(1 for ticker in portfolio.positions if ticker != ticker), 1)
+        # Every day of the sheet is closed once its trades are applied.
+        history = portfolio.history_frame()
+        self.assertEqual(history.index.tolist(), [datetime.datetime(2017, 1, day) for day in (2, 3, 4)])
+        self.assertEqual(history["realized_pnl"].tolist(), [0, 20, 20])
+
+    def test_no_trades_before_end_date(self):
+        data = self.data.copy()
+        data["D_NAV"] = datetime.datetime(2019, 3, 12)
+        portfolio = self.replay(data)
+        self.assertEqual(len(portfolio.positions), 0)
+        self.assertEqual(len(portfolio.history_frame()), 0)
+
+    def test_chains(self):
+        portfolio = self.replay(self.data, ids={2001: {"C_ID_TYPE": [6], "G_ID_VALUE": ["VGH7 Index"]}})
+        chains = portfolio.chain_frame()
+        self.assertEqual(chains["date"].tolist(), [datetime.datetime(2017, 1, day) for day in (2, 3, 4)])
+        self.assertEqual(chains["underlying"].tolist(), ["VG"] * 3)
+        self.assertEqual(chains["quantity"].tolist(), [-2] * 3)
+
+    def test_unsorted_sheet(self):
+        with self.assertRaises(ValueError):
+            self.replay(self.data.iloc[[1, 0, 2, 3, 4]])
+
+
+if __name__ == "__main__":
+    unittest.main()
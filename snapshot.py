@@ -0,0 +1,178 @@
+from manifest import Manifest
+from reader import daily_files
+
+import datetime
+import os
+import pickle
+import warnings
+
+VERSION = 9
+
+
+def save_snapshot(file, portfolio, date, trades=None):
+    """
+    Saves a whole Portfolio (positions, closed positions, ids, wkn, Cash and every log) to a snapshot file.
+
+    The file holds two pickles: a small header ({"version", "date"}) followed by the portfolio itself, so that the
+        version and the date of a snapshot can be checked without loading the portfolio. The file is written under a
+        temporary name and then renamed, so a run interrupted while saving never leaves a half-written snapshot.
+    :param file: path of the snapshot file.
+    :param portfolio: Portfolio to save.
+    :param date: datetime of the last day applied to the portfolio.
+    :param trades: Pending trades of the Reader (see Reader.trades).
+    :return: None
+    """
+    temp = f"{file}.{os.getpid()}"
+    with open(temp, "wb") as f:
+        pickle.dump({"version": VERSION, "date": date}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump({"portfolio": portfolio, "trades": trades or {}}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, file)
+
+
+def read_header(file):
+    """
+    :param file: path of the snapshot file.
+    :return: dict {"version", "date"} of the snapshot.
+    """
+    with open(file, "rb") as f:
+        return pickle.load(f)
+
+
+def load_snapshot(file):
+    """
+    :param file: path of the snapshot file.
+    :return: dict {"version", "date", "portfolio", "trades"}
+    """
+    with open(file, "rb") as f:
+        header = pickle.load(f)
+        if header["version"] != VERSION:
+            raise ValueError(f"{file} is a version {header['version']} snapshot, version {VERSION} is expected.")
+        return dict(header, **pickle.load(f))
+
+
+class Checkpoint:
+    """
+    Portfolio snapshots taken by Reader.main while it replays the daily files, so that a later run resumes from the
+        latest snapshot and only applies the files of the days after it.
+
+    A snapshot is saved every `every` replayed days, and after the last day of a run, as
+        folder/portfolio YYYYMMDD.snapshot. The first run also saves the portfolio it starts from (for example after
+        history_movements) as the base snapshot. The base and the `keep` latest snapshots are kept.
+
+    Next to the snapshots, a Manifest (folder/manifest.json) records the file applied for every day. If the file of a
+        day that is already in the latest snapshot has changed since (a restatement), the portfolio is restored from
+        the latest snapshot before that day and replayed from there.
+    """
+
+    def __init__(self, folder, every=1, keep=30):
+        """
+        :param folder: Folder in which the snapshots are stored. Created if it does not exist.
+        :param every: Number of replayed days between two snapshots.
+        :param keep: Number of snapshots kept besides the base snapshot.
+        """
+        self.folder = folder
+        self.every = every
+        self.keep = keep
+        os.makedirs(folder, exist_ok=True)
+        self.manifest = Manifest(os.path.join(folder, "manifest.json"))
+        self._days = 0
+        self._unsaved = None  # date of the last replayed day, if it is not in a snapshot yet.
+
+    def _file(self, date):
+        return os.path.join(self.folder, f"portfolio {date:%Y%m%d}.snapshot")
+
+    def snapshots(self):
+        """
+        :return: sorted list of the datetimes of the snapshots in the folder.
+        """
+        dates = []
+        for name in os.listdir(self.folder):
+            if name.startswith("portfolio ") and name.endswith(".snapshot"):
+                dates.append(datetime.datetime.strptime(name[len("portfolio "):-len(".snapshot")], "%Y%m%d"))
+        return sorted(dates)
+
+    def resume(self, reader, path, start):
+        """
+        Restores reader to the snapshot from which the replay has to start.
+
+        Without any snapshot, the portfolio of the reader is saved as the base snapshot (as of the day before start)
+            and nothing needs to be restored. Otherwise the latest snapshot is restored, unless the file of one of its
+            days changed, in which case the snapshots (and manifest days) from that day onwards are dropped and the
+            latest snapshot before it is restored. Every day from the base snapshot up to the latest one is compared
+            with the files in path, whatever the range of the replay.
+        :param reader: Reader
+        :param path: The path to the folder holding the monthly folders of the daily files.
+        :param start: datetime of the first day of the replay.
+        :return: (datetime of the last day in the portfolio, datetime of the first restated day or None). The replay
+                 starts the day after the first one; after a restatement it has to start there whatever start is, as
+                 the days in between are no longer in the portfolio.
+        """
+        snapshots = self.snapshots()
+        if not snapshots:
+            base = start - datetime.timedelta(days=1)
+            save_snapshot(self._file(base), reader.portfolio, base, reader.trades)
+            self.manifest.forget(start)
+            self.manifest.save()
+            return base, None
+        one_day = datetime.timedelta(days=1)
+        days = daily_files(path, snapshots[0] + one_day, snapshots[-1] + one_day)
+        restated = [date for date, file in days if self.manifest.changed(date, file)]
+        if not restated:
+            return self.restore(reader, snapshots[-1]), None
+        first = min(restated)
+        for date in snapshots:
+            if date >= first and date != snapshots[0]:
+                os.remove(self._file(date))
+        self.manifest.forget(first)
+        self.manifest.save()
+        resumed = self.restore(reader, self.snapshots()[-1])
+        warnings.warn(
+            f"The file of {first:%m%d%Y} changed since it was applied, replaying from {resumed + one_day:%m%d%Y}."
+        )
+        return resumed, first
+
+    def restore(self, reader, date):
+        """
+        Loads the snapshot of `date` into reader.portfolio (in place, so references to the portfolio stay valid) and
+            reader.trades.
+        :param reader: Reader
+        :param date: datetime of the snapshot.
+        :return: datetime of the snapshot.
+        """
+        snapshot = load_snapshot(self._file(date))
+        vars(reader.portfolio).clear()
+        vars(reader.portfolio).update(vars(snapshot["portfolio"]))
+        reader.trades = snapshot["trades"]
+        return snapshot["date"]
+
+    def day_finished(self, reader, date, file):
+        """
+        Called by Reader.main after every replayed day (file is None if there was no file that day); saves a snapshot
+            every self.every days.
+        :param reader: Reader
+        :param date: datetime of the day.
+        :param file: path of the file of the day.
+        :return: None
+        """
+        self.manifest.record(date, file)
+        if file is None:
+            return
+        self._days += 1
+        self._unsaved = date
+        if self._days % self.every == 0:
+            self.save(reader)
+
+    def save(self, reader):
+        """
+        Saves a snapshot of reader.portfolio and the manifest, unless the last replayed day is already saved, then
+            removes the snapshots that are no longer kept.
+        :param reader: Reader
+        :return: None
+        """
+        if self._unsaved is not None:
+            save_snapshot(self._file(self._unsaved), reader.portfolio, self._unsaved, reader.trades)
+            self._unsaved = None
+        self.manifest.save()
+        snapshots = self.snapshots()
+        for date in snapshots[1:len(snapshots) - self.keep]:
+            os.remove(self._file(date))
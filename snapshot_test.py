@@ -0,0 +1,185 @@
+from events import CashUpdate
+from manifest import Manifest
+from portfolio import Portfolio
+from reader import Reader
+from snapshot import Checkpoint, load_snapshot, save_snapshot, VERSION
+
+from decimal import Decimal
+import datetime
+import os
+import pandas as pd
+import pickle
+import tempfile
+import types
+import unittest
+
+
+def cash_stage(reader, day):
+    balance = Decimal(int(day["HIS"]["A_MARKET_VALUE"].iloc[0]))
+    yield CashUpdate("EUR", balance, balance, day["date"])
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Save a portfolio with a stock, a future and cash, load it back and check that it carries on where it stopped.
+    """
+
+    def setUp(self):
+        self.date = datetime.datetime(2019, 3, 12)
+        self.portfolio = Portfolio()
+        self.portfolio.transact_position(
+            ticker=1, quantity=Decimal("100"), price=Decimal("74.78"), date=self.date,
+            action="BOT", category="Stock", currency="USD"
+        )
+        self.portfolio.transact_position(
+            ticker=2, quantity=Decimal("2"), price=Decimal("3300"), date=self.date, action="SLD",
+            category="Futures", currency="EUR", contract_size=Decimal("10"), history=True
+        )
+        self.portfolio.transact_cash("EUR", 1000, 1000, self.date)
+        self.portfolio.ids[1] = {"C_ID_TYPE": [1], "G_ID_VALUE": ["US30231G1022"]}
+        self.folder = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.folder.name, "portfolio.snapshot")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip(self):
+        save_snapshot(self.file, self.portfolio, self.date, {1: {"ticker": 3}})
+        snapshot = load_snapshot(self.file)
+        restored = snapshot["portfolio"]
+        self.assertEqual((snapshot["date"], snapshot["trades"]), (self.date, {1: {"ticker": 3}}))
+        self.assertEqual(restored.ids, self.portfolio.ids)
+        self.assertEqual(restored.equity, self.portfolio.equity)
+        for ticker, position in self.portfolio.positions.items():
+            self.assertTrue(position.log.to_frame().equals(restored.positions[ticker].log.to_frame()))
+
+        for portfolio in (self.portfolio, restored):
+            portfolio.transact_position(
+                ticker=1, quantity=Decimal("40"), price=Decimal("75.26"), date=self.date, action="SLD"
+            )
+        self.assertEqual(restored.realized_pnl, self.portfolio.realized_pnl)
+        self.assertEqual(restored.positions[1].log.rows, 2)
+
+    def test_version_mismatch(self):
+        with open(self.file, "wb") as f:
+            pickle.dump({"version": VERSION + 1, "date": self.date}, f)
+        with self.assertRaises(ValueError):
+            load_snapshot(self.file)
+
+
+class TestManifest(unittest.TestCase):
+    """
+    Record the file of a day and check which changes count as a restatement.
+    """
+
+    def test_changed(self):
+        date = datetime.datetime(2019, 3, 12)
+        with tempfile.TemporaryDirectory() as folder:
+            file = os.path.join(folder, "Zobel 03122019.xls")
+            with open(file, "w") as f:
+                f.write("first version")
+            manifest = Manifest(os.path.join(folder, "manifest.json"))
+            self.assertTrue(manifest.changed(date, file))
+            manifest.record(date, file)
+            manifest.save()
+
+            manifest = Manifest(os.path.join(folder, "manifest.json"))
+            self.assertFalse(manifest.changed(date, file))
+            with open(file, "w") as f:
+                f.write("restated file")
+            self.assertTrue(manifest.changed(date, file))
+            self.assertTrue(manifest.changed(date, None))
+
+            manifest.record(date, None)
+            self.assertFalse(manifest.changed(date, None))
+            self.assertTrue(manifest.changed(date, file))
+            manifest.forget(date)
+            self.assertEqual(manifest.days, {})
+
+
+class TestCheckpoint(unittest.TestCase):
+    """
+    Replay three days with snapshots, restate the file of the first day and check which snapshot a later run resumes
+    from.
+    """
+
+    days = [datetime.datetime(2019, 3, day) for day in (11, 12, 13)]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "files")
+        os.makedirs(os.path.join(self.path, "032019"))
+        for day in self.days:
+            self.write(day, "first version")
+        self.reader = types.SimpleNamespace(portfolio=Portfolio(), trades={})
+
+    def write(self, day, content):
+        file = os.path.join(self.path, day.strftime("%m%Y"), day.strftime("Zobel %m%d%Y.xls"))
+        with open(file, "w") as f:
+            f.write(content)
+        return file
+
+    def replay(self, checkpoint):
+        checkpoint.resume(self.reader, self.path, self.days[0])
+        for day in self.days:
+            self.reader.portfolio.transact_cash("EUR", 1, 1, day)
+            checkpoint.day_finished(self.reader, day, self.write(day, "first version"))
+        checkpoint.save(self.reader)
+
+    def test_restated_before_range(self):
+        self.replay(Checkpoint(os.path.join(self.folder.name, "snapshots")))
+        self.write(self.days[0], "restated file")
+        checkpoint = Checkpoint(os.path.join(self.folder.name, "snapshots"))
+        # The next run only covers the days after the snapshots; the restated day is still found.
+        with self.assertWarns(UserWarning):
+            resumed = checkpoint.resume(self.reader, self.path, self.days[-1] + datetime.timedelta(days=1))
+        self.assertEqual(resumed, (self.days[0] - datetime.timedelta(days=1), self.days[0]))
+        self.assertEqual(checkpoint.snapshots(), [resumed[0]])
+        self.assertNotIn("EUR", self.reader.portfolio.cash)
+        self.assertEqual(checkpoint.manifest.days, {})
+
+    def test_restated_replay(self):
+        """
+        Run Reader.main over workbooks whose "HIS" sheet holds the EUR balance of the day, restate the first day and
+            check that a later run replays every day from there, not only the days from its start_date.
+        """
+        path = os.path.join(self.folder.name, "workbooks")
+        os.makedirs(os.path.join(path, "032019"))
+        days = self.days + [datetime.datetime(2019, 3, 14), datetime.datetime(2019, 3, 15)]
+        for balance, day in enumerate(days, 1):
+            self.workbook(path, day, balance)
+        reader = Reader(Portfolio(), stages=[cash_stage])
+        reader.main(path, "03112019", "03142019", checkpoint=Checkpoint(os.path.join(self.folder.name, "snapshots")))
+
+        self.workbook(path, days[0], 100)
+        reader = Reader(Portfolio(), stages=[cash_stage])
+        with self.assertWarns(UserWarning):
+            reader.main(
+                path, "03142019", "03162019", checkpoint=Checkpoint(os.path.join(self.folder.name, "snapshots"))
+            )
+        history = reader.portfolio.history_frame()
+        self.assertEqual(list(history.index), days)
+        self.assertEqual(list(history["cash EUR"]), [100, 2, 3, 4, 5])
+
+        # Every day is in the manifest again, so the next run does not roll back.
+        reader = Reader(Portfolio(), stages=[cash_stage])
+        reader.main(path, "03162019", "03162019", checkpoint=Checkpoint(os.path.join(self.folder.name, "snapshots")))
+        self.assertEqual(list(reader.portfolio.history_frame()["cash EUR"]), [100, 2, 3, 4, 5])
+
+    @staticmethod
+    def workbook(path, day, balance):
+        file = os.path.join(path, day.strftime("%m%Y"), day.strftime("Zobel %m%d%Y.xlsx"))
+        with pd.ExcelWriter(file) as writer:
+            pd.DataFrame({"A_MARKET_VALUE": [balance]}).to_excel(writer, sheet_name="HIS", index=False)
+            for sheet in ("MVT", "SecuritiesIDs"):
+                pd.DataFrame().to_excel(writer, sheet_name=sheet, index=False)
+
+    def test_keep_none(self):
+        checkpoint = Checkpoint(os.path.join(self.folder.name, "snapshots"), keep=0)
+        self.replay(checkpoint)
+        self.assertEqual(checkpoint.snapshots(), [self.days[0] - datetime.timedelta(days=1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+from collections.abc import Mapping
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+NA = np.iinfo(np.int64).min  # Marks missing fixed-point values (logged as np.nan before).
+
+# Column name -> how the column is stored:
+#   "date":      datetime64[ns]
+#   int:         fixed-point int64 with that many decimal places (2: cents, 7: 1e-7 units)
+#   "category":  int16 codes into a list of labels
+POSITION_LOG = [
+    ("date", "date"),
+    ("quantity", 2),
+    ("price", 7),
+    ("market_value", 2),
+    ("unit_cost", 7),  # logged with two or seven decimal places depending on whether the position is flat.
+    ("cost_basis", 2),
+    ("unrealized_pnl", 2),
+    ("realized_pnl", 2),
+    ("event", "category"),
+]
+
+CASH_LOG = [
+    ("date", "date"),
+    ("quantity", 2),
+    ("price", 7),
+    ("market_value", 2),
+    ("unit_cost", 7),
+    ("cost_basis", 2),
+    ("unrealized_pnl", 2),
+    ("realized_pnl", 2),
+    ("currrency", "category"),
+    ("event", "category"),
+]
+
+# Daily totals of a Portfolio (see Portfolio.close_day).
+PORTFOLIO_LOG = [
+    ("date", "date"),
+    ("equity", 2),
+    ("unrealized_pnl", 2),
+    ("realized_pnl", 2),
+    ("net_exposure", 2),
+    ("gross_exposure", 2),
+]
+
+# Daily balance of every cash account of a Portfolio.
+CASH_BALANCES = [
+    ("date", "date"),
+    ("currency", "category"),
+    ("market_value", 2),
+    ("cost_basis", 2),
+]
+
+# Daily state of the futures chain of every underlying (see chains.ContractChains.close_day).
+CHAIN_LOG = [
+    ("date", "date"),
+    ("underlying", "category"),
+    ("currency", "category"),
+    ("contract", "category"),  # C_N_ID of the front contract.
+    ("quantity", 7),  # net number of contracts held over the chain.
+    ("price", 7),  # last price of the front contract.
+    ("adjustment", 7),  # sum of the roll gaps up to the date.
+    ("exposure", 2),
+    ("pnl", 2),  # realized and unrealized P&L of every contract of the chain, closed ones included.
+]
+
+# Lots closed by a fill (see lots.Lots): one row per open lot matched.
+LOT_LOG = [
+    ("open_date", "date"),
+    ("close_date", "date"),
+    ("side", "category"),  # "long" or "short"
+    ("quantity", 7),
+    ("open_price", 7),
+    ("close_price", 7),
+    ("realized_pnl", 2),
+]
+
+
+class TradeLog(Mapping):
+    """
+    Compact columnar store for the logs of Positions and Cash.
+
+    Each column is a NumPy array that grows by doubling its capacity, so appending a row is amortized O(1). Amounts are
+        stored as fixed-point int64 (cents for amounts, 1e-7 units for prices), dates as datetime64 and events as
+        int16 codes, which takes about 70 bytes per row instead of the kilobytes of Decimal objects held in lists.
+        New rows are first kept in a small buffer and written to the arrays in blocks, whenever the buffer is full or
+        the log is read: one NumPy assignment per column and block costs less than writing every value of every row
+        into the arrays, and appending a row takes about half the time (see the TradeLog.append benchmark).
+
+    The log can still be read like the dict of lists it replaces: log["price"] returns the column and log.keys() the
+        column names. log.to_frame() hands the log to pandas (use it instead of pd.DataFrame(log)), and
+        log.raw(column) returns a zero-copy view of the stored array.
+    """
+
+    BUFFER = 256  # rows kept in the buffer before they are written to the arrays.
+
+    def __init__(self, schema=POSITION_LOG, capacity=16):
+        """
+        :param schema: list of (column, kind) tuples, see POSITION_LOG.
+        :param capacity: Number of rows allocated up front.
+        """
+        self.schema = dict(schema)
+        self._size = 0
+        self._pending = []
+        self._capacity = capacity
+        self._columns = {}
+        self._labels = {}  # category column -> list of labels
+        self._codes = {}  # category column -> {label: code}
+        for name, kind in self.schema.items():
+            if kind == "date":
+                self._columns[name] = np.empty(capacity, dtype="datetime64[ns]")
+            elif kind == "category":
+                self._columns[name] = np.empty(capacity, dtype=np.int16)
+                self._labels[name] = []
+                self._codes[name] = {}
+            else:
+                self._columns[name] = np.empty(capacity, dtype=np.int64)
+
+    def _grow(self, rows):
+        while self._capacity < rows:
+            self._capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _flush(self):
+        """
+        Writes the buffered rows to the column arrays.
+        """
+        if not self._pending:
+            return
+        rows = len(self._pending)
+        if self._size + rows > self._capacity:
+            self._grow(self._size + rows)
+        for name, values in zip(self.schema, zip(*self._pending)):
+            column = self._columns[name]
+            column[self._size:self._size + rows] = np.array(values, dtype=column.dtype)
+        self._size += rows
+        self._pending = []
+
+    def _code(self, name, label):
+        code = self._codes[name].get(label)
+        if code is None:
+            code = len(self._labels[name])
+            self._labels[name].append(label)
+            self._codes[name][label] = code
+        return code
+
+    def append(self, **row):
+        """
+        Adds a row to the log. Every column of the schema must be given.
+
+        :param row: column=value. Amounts are Decimal objects (np.nan or None for missing values), dates are
+                    datetime objects and categories are str.
+        :return: None
+        """
+        values = []
+        for name, kind in self.schema.items():
+            value = row[name]
+            if kind == "date":
+                pass
+            elif kind == "category":
+                value = self._code(name, value)
+            elif value is None or (not isinstance(value, Decimal) and np.isnan(value)):
+                value = NA
+            else:
+                value = int(Decimal(value).scaleb(kind).to_integral_value())
+            values.append(value)
+        self._pending.append(values)
+        if len(self._pending) >= self.BUFFER:
+            self._flush()
+
+    def append_scaled(self, **row):
+        """
+        Same as append, but the amounts are given as fixed-point integers with the number of decimal places of their
+            column (used by the tax lots, which already hold their values that way, see lots.py).
+
+        :param row: column=value. Amounts are int (NA for missing values).
+        :return: None
+        """
+        self._pending.append([
+            self._code(name, row[name]) if kind == "category" else row[name] for name, kind in self.schema.items()
+        ])
+        if len(self._pending) >= self.BUFFER:
+            self._flush()
+
+    def raw(self, name):
+        """
+        :param name: column name.
+        :return: zero-copy np.ndarray view of the stored column (fixed-point int64, datetime64 or int16 codes).
+        """
+        self._flush()
+        return self._columns[name][:self._size]
+
+    def __getitem__(self, name):
+        """
+        :param name: column name.
+        :return: np.ndarray of the column: float64 amounts (NaN where missing), datetime64 dates or str labels.
+        """
+        kind = self.schema[name]
+        column = self.raw(name)
+        if kind == "date":
+            return column
+        if kind == "category":
+            return np.asarray(self._labels[name], dtype=object)[column]
+        values = column / 10 ** kind
+        values[column == NA] = np.nan
+        return values
+
+    def decimals(self, name):
+        """
+        :param name: column name of an amount.
+        :return: list of Decimal values of the column, exactly as they were logged (np.nan where missing).
+        """
+        scale = self.schema[name]
+        return [np.nan if value == NA else Decimal(value).scaleb(-scale) for value in self.raw(name).tolist()]
+
+    def __iter__(self):
+        return iter(self.schema)
+
+    def __len__(self):
+        return len(self.schema)
+
+    @property
+    def rows(self):
+        """
+        :return: int number of rows in the log.
+        """
+        return self._size + len(self._pending)
+
+    @property
+    def nbytes(self):
+        """
+        :return: int number of bytes allocated for the columns.
+        """
+        self._flush()
+        return sum(column.nbytes for column in self._columns.values())
+
+    def compact(self):
+        """
+        Releases the unused capacity of the arrays, for a log that is not going to grow anymore.
+        :return: None
+        """
+        self._flush()
+        self._capacity = max(self._size, 1)
+        self._columns = {name: column[:self._capacity].copy() for name, column in self._columns.items()}
+
+    def __getstate__(self):
+        """
+        Pickles the rows only: the buffer is written to the arrays and the unused capacity is left out.
+        """
+        self._flush()
+        state = dict(vars(self))
+        state["_capacity"] = max(self._size, 1)
+        state["_columns"] = {name: column[:state["_capacity"]].copy() for name, column in self._columns.items()}
+        return state
+
+    def to_frame(self):
+        """
+        :return: pd.DataFrame with one column per log column; amounts as float64, events as pd.Categorical.
+        """
+        frame = {}
+        for name, kind in self.schema.items():
+            if kind == "category":
+                frame[name] = pd.Categorical.from_codes(self.raw(name), categories=list(self._labels[name]))
+            else:
+                frame[name] = self[name]
+        return pd.DataFrame(frame)
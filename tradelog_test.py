@@ -0,0 +1,43 @@
+from tradelog import TradeLog, POSITION_LOG
+
+from decimal import Decimal
+import datetime
+import pickle
+import unittest
+
+
+class TestTradeLog(unittest.TestCase):
+    """
+    Append more rows than the buffer holds and check that every way of reading the log sees the buffered rows too.
+    """
+
+    def test_buffered_rows(self):
+        log = TradeLog(POSITION_LOG, capacity=4)
+        date = datetime.datetime(2019, 3, 12)
+        count = TradeLog.BUFFER + 10
+        for i in range(count):
+            log.append(
+                date=date + datetime.timedelta(days=i), quantity=Decimal(i), price=Decimal("74.78"),
+                market_value=Decimal(i) * Decimal("74.78"), unit_cost=Decimal("74.78"), cost_basis=None,
+                unrealized_pnl=Decimal("0.00"), realized_pnl=Decimal("0.00"), event="Trade" if i else "Inception"
+            )
+        self.assertEqual(log.rows, count)
+        self.assertEqual(log.decimals("quantity")[-1], Decimal(count - 1).quantize(Decimal("0.01")))
+        self.assertEqual(len(log.raw("price")), count)
+        self.assertEqual(list(log["event"][:2]), ["Inception", "Trade"])
+
+        log.append_scaled(
+            date=date, quantity=100, price=747800000, market_value=7478, unit_cost=747800000, cost_basis=7478,
+            unrealized_pnl=0, realized_pnl=0, event="Close"
+        )
+        restored = pickle.loads(pickle.dumps(log))
+        frame = restored.to_frame()
+        self.assertEqual(len(frame.index), count + 1)
+        self.assertEqual(frame["event"].iloc[-1], "Close")
+        self.assertTrue(frame["cost_basis"].iloc[:count].isna().all())
+        restored.compact()  # no capacity is left past the last row.
+        self.assertEqual(restored.nbytes, (count + 1) * sum(restored.raw(name).itemsize for name in restored))
+
+
+if __name__ == "__main__":
+    unittest.main()